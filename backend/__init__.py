@@ -5,10 +5,10 @@ from pathlib import Path
 from flask import Flask, jsonify
 from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate
-from flask_sqlalchemy import SQLAlchemy
 from flask_redis import FlaskRedis
 
 from backend.config import Config
+from backend.session import RoutingSQLAlchemy
 
 
 def create_app():
@@ -23,14 +23,16 @@ def create_app():
 
 app = create_app()
 
-db = SQLAlchemy(app)
+db = RoutingSQLAlchemy(app)
 migrate = Migrate(app, db)
 jwt = JWTManager(app)
 redis_client = FlaskRedis(app)
 
-from backend import models
+from backend import models, replica
 
 from .routes import auth, api
 
 app.register_blueprint(auth)
 app.register_blueprint(api)
+
+from backend import commands
@@ -0,0 +1,379 @@
+import os
+import struct
+import wave
+
+from collections import namedtuple
+
+from backend import app
+
+AudioInfo = namedtuple(
+    "AudioInfo", ["duration", "sample_rate", "channels", "sample_width", "file_size"]
+)
+
+WavLayout = namedtuple(
+    "WavLayout",
+    [
+        "audio_format",
+        "channels",
+        "sample_rate",
+        "byte_rate",
+        "block_align",
+        "bits_per_sample",
+        "data_offset",
+        "data_size",
+    ],
+)
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Decoders disagree slightly on where compressed audio ends, segments drawn up to
+# the very end of a clip must not be rejected for that
+DURATION_TOLERANCE = 0.05
+
+# Only this much of a file is scanned for the first MP3 frame or the last OGG page
+SCAN_SIZE = 64 * 1024
+
+MP3_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+MP3_SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    2.5: [11025, 12000, 8000],
+}
+
+
+def read_wav_layout(audio_file, file_size):
+    """Walk the RIFF chunks of a WAV file for its format and the position of the
+    sample data, which lets callers seek into the samples without decoding
+
+    For extensible files `audio_format` is the format of the sub type.
+    """
+    riff, _, wave_id = struct.unpack("<4sI4s", audio_file.read(12))
+    if riff != b"RIFF" or wave_id != b"WAVE":
+        raise ValueError("Not a RIFF WAVE file")
+
+    fmt = None
+    while True:
+        chunk_header = audio_file.read(8)
+        if len(chunk_header) < 8:
+            raise ValueError("No data chunk found")
+
+        chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+
+        if chunk_id == b"fmt ":
+            fmt_chunk = audio_file.read(chunk_size)
+            fmt = list(struct.unpack("<HHIIHH", fmt_chunk[:16]))
+            if fmt[0] == WAVE_FORMAT_EXTENSIBLE and len(fmt_chunk) >= 26:
+                (fmt[0],) = struct.unpack("<H", fmt_chunk[24:26])
+            audio_file.seek(chunk_size % 2, os.SEEK_CUR)
+        elif chunk_id == b"data":
+            break
+        else:
+            audio_file.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+    if fmt is None:
+        raise ValueError("No fmt chunk before data chunk")
+
+    data_offset = audio_file.tell()
+
+    # Recorders which stream to disk leave the size unset or too large
+    data_size = min(chunk_size, file_size - data_offset)
+
+    return WavLayout(*fmt, data_offset=data_offset, data_size=data_size)
+
+
+def read_wav_clip(audio_file, file_size, start_time, end_time):
+    """Locate the samples between `start_time` and `end_time` seconds of a WAV file
+
+    Returns a header for the clip, which is the original header up to the sample
+    data with the RIFF and data sizes rewritten, together with offset and length
+    of the clip's sample bytes. Nothing is decoded.
+    """
+    layout = read_wav_layout(audio_file, file_size)
+
+    if not layout.block_align or not layout.sample_rate:
+        raise ValueError("WAV header has no frames")
+
+    frame_count = layout.data_size // layout.block_align
+    first_frame = min(max(int(start_time * layout.sample_rate), 0), frame_count)
+    last_frame = min(max(int(end_time * layout.sample_rate), first_frame), frame_count)
+
+    offset = layout.data_offset + first_frame * layout.block_align
+    length = (last_frame - first_frame) * layout.block_align
+
+    audio_file.seek(0)
+    header = bytearray(audio_file.read(layout.data_offset))
+    struct.pack_into("<I", header, 4, len(header) - 8 + length)
+    struct.pack_into("<I", header, len(header) - 4, length)
+
+    return bytes(header), offset, length
+
+
+def read_wav_info(audio_file, file_size):
+    """Read a WAV header with `wave`, falling back to walking the RIFF chunks for
+    formats `wave` refuses such as float or extensible PCM
+    """
+    try:
+        with wave.open(audio_file) as wav:
+            sample_rate = wav.getframerate()
+            return AudioInfo(
+                duration=wav.getnframes() / sample_rate,
+                sample_rate=sample_rate,
+                channels=wav.getnchannels(),
+                sample_width=wav.getsampwidth(),
+                file_size=file_size,
+            )
+    except (wave.Error, EOFError, ZeroDivisionError):
+        audio_file.seek(0)
+
+    layout = read_wav_layout(audio_file, file_size)
+
+    return AudioInfo(
+        duration=layout.data_size / layout.byte_rate if layout.byte_rate else None,
+        sample_rate=layout.sample_rate,
+        channels=layout.channels,
+        sample_width=(layout.bits_per_sample + 7) // 8,
+        file_size=file_size,
+    )
+
+
+def parse_mp3_frame_header(header):
+    """Decode a 4 byte MPEG audio frame header, `None` if it is not one"""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+
+    version = {0: 2.5, 2: 2, 3: 1}.get((header[1] >> 3) & 0x03)
+    layer = {1: 3, 2: 2, 3: 1}.get((header[1] >> 1) & 0x03)
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+
+    if (
+        version is None
+        or layer is None
+        or bitrate_index in (0, 15)
+        or sample_rate_index == 3
+    ):
+        return None
+
+    bitrate = MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][sample_rate_index]
+    padding = (header[2] >> 1) & 0x01
+
+    if layer == 1:
+        samples_per_frame = 384
+        frame_size = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples_per_frame = 576 if layer == 3 and version != 1 else 1152
+        frame_size = samples_per_frame // 8 * bitrate // sample_rate + padding
+
+    return {
+        "version": version,
+        "bitrate": bitrate,
+        "sample_rate": sample_rate,
+        "channels": 1 if header[3] >> 6 == 3 else 2,
+        "samples_per_frame": samples_per_frame,
+        "frame_size": frame_size,
+    }
+
+
+def read_vbr_header(buffer, offset, frame):
+    """Look for a Xing/Info or VBRI header in the frame at `offset`
+
+    Returns whether there is one and the frame count it gives, if any.
+    """
+    if frame["version"] == 1:
+        side_info_size = 17 if frame["channels"] == 1 else 32
+    else:
+        side_info_size = 9 if frame["channels"] == 1 else 17
+
+    xing_offset = offset + 4 + side_info_size
+
+    if buffer[xing_offset : xing_offset + 4] in (b"Xing", b"Info"):
+        (flags,) = struct.unpack(">I", buffer[xing_offset + 4 : xing_offset + 8])
+        if flags & 0x01:
+            (frame_count,) = struct.unpack(
+                ">I", buffer[xing_offset + 8 : xing_offset + 12]
+            )
+            return True, frame_count
+        return True, None
+
+    if buffer[offset + 36 : offset + 40] == b"VBRI":
+        (frame_count,) = struct.unpack(">I", buffer[offset + 50 : offset + 54])
+        return True, frame_count
+
+    return False, None
+
+
+def is_followed_by_frame(buffer, offset, frame, file_end):
+    """Whether the frame at `offset` is followed by another frame of the same
+    stream, or ends exactly where the audio does
+    """
+    next_offset = offset + frame["frame_size"]
+
+    if next_offset == file_end or buffer[next_offset : next_offset + 3] == b"TAG":
+        return True
+
+    next_frame = parse_mp3_frame_header(buffer[next_offset : next_offset + 4])
+
+    return (
+        next_frame is not None
+        and next_frame["version"] == frame["version"]
+        and next_frame["sample_rate"] == frame["sample_rate"]
+    )
+
+
+def read_mp3_info(audio_file, file_size):
+    """Find the first MPEG frame after any ID3v2 tag and take the frame count from
+    a Xing/Info or VBRI header, or estimate it from the bitrate for CBR files
+    """
+    audio_start = 0
+    header = audio_file.read(10)
+
+    if header[:3] == b"ID3" and len(header) == 10:
+        tag_size = 0
+        for byte in header[6:10]:
+            tag_size = (tag_size << 7) | (byte & 0x7F)
+        audio_start = 10 + tag_size + (10 if header[5] & 0x10 else 0)
+
+    audio_file.seek(audio_start)
+    buffer = audio_file.read(SCAN_SIZE)
+
+    frame = None
+    frame_count = None
+    offset = buffer.find(b"\xff")
+    while offset != -1:
+        frame = parse_mp3_frame_header(buffer[offset : offset + 4])
+
+        # About one in ten sync words inside garbage decodes as a frame header.
+        # Only trust one which starts right after an ID3 tag, carries a VBR
+        # header or is followed by a second frame.
+        if frame is not None:
+            has_vbr_header, frame_count = read_vbr_header(buffer, offset, frame)
+
+            if (
+                (audio_start and offset == 0)
+                or has_vbr_header
+                or is_followed_by_frame(buffer, offset, frame, file_size - audio_start)
+            ):
+                break
+
+        frame = None
+        offset = buffer.find(b"\xff", offset + 1)
+
+    if frame is None:
+        raise ValueError("No MPEG audio frame found")
+
+    if frame_count is not None:
+        duration = frame_count * frame["samples_per_frame"] / frame["sample_rate"]
+    else:
+        audio_size = file_size - audio_start - offset
+
+        audio_file.seek(max(file_size - 128, 0))
+        if audio_file.read(3) == b"TAG":
+            audio_size -= 128
+
+        duration = audio_size * 8 / frame["bitrate"]
+
+    return AudioInfo(
+        duration=duration,
+        sample_rate=frame["sample_rate"],
+        channels=frame["channels"],
+        sample_width=None,
+        file_size=file_size,
+    )
+
+
+def read_ogg_info(audio_file, file_size):
+    """Read the Vorbis or Opus identification header from the first OGG page and
+    the granule position, which counts samples, from the last page of the stream
+    """
+    header = audio_file.read(27)
+    if len(header) < 27 or header[:4] != b"OggS":
+        raise ValueError("Not an OGG file")
+
+    serial = header[14:18]
+    segment_count = header[26]
+    audio_file.seek(27 + segment_count)
+    packet = audio_file.read(64)
+
+    if packet[:7] == b"\x01vorbis":
+        channels, sample_rate = struct.unpack("<BI", packet[11:16])
+        granule_rate = sample_rate
+        pre_skip = 0
+    elif packet[:8] == b"OpusHead":
+        channels, pre_skip, input_sample_rate = struct.unpack("<BHI", packet[9:16])
+        # Opus always decodes at 48 kHz, the input rate is informational
+        granule_rate = 48000
+        sample_rate = input_sample_rate or granule_rate
+    else:
+        raise ValueError("Unsupported OGG codec")
+
+    audio_file.seek(max(file_size - SCAN_SIZE, 0))
+    buffer = audio_file.read()
+
+    granule_position = None
+    offset = buffer.rfind(b"OggS")
+    while offset != -1:
+        page = buffer[offset : offset + 27]
+        if len(page) == 27 and page[14:18] == serial:
+            (granule_position,) = struct.unpack("<q", page[6:14])
+            if granule_position >= 0:
+                break
+        offset = buffer.rfind(b"OggS", 0, offset)
+
+    if granule_position is None or granule_position < 0:
+        raise ValueError("No granule position found in last OGG page")
+
+    return AudioInfo(
+        duration=max(granule_position - pre_skip, 0) / granule_rate,
+        sample_rate=sample_rate,
+        channels=channels,
+        sample_width=None,
+        file_size=file_size,
+    )
+
+
+def read_audio_info(path):
+    """Parse duration, sample rate, channels, sample width and size from the
+    headers of a WAV, MP3 or OGG file without decoding it
+
+    The format is sniffed from the content rather than the extension. Fields which
+    cannot be determined are `None`, a file which cannot be parsed at all still
+    reports its size.
+    """
+    file_size = os.path.getsize(path)
+
+    with open(path, "rb") as audio_file:
+        magic = audio_file.read(4)
+        audio_file.seek(0)
+
+        try:
+            if magic == b"RIFF":
+                return read_wav_info(audio_file, file_size)
+            if magic == b"OggS":
+                return read_ogg_info(audio_file, file_size)
+            return read_mp3_info(audio_file, file_size)
+        except (ValueError, struct.error) as e:
+            app.logger.warning(f"Could not read audio metadata of {path}: {e}")
+
+    return AudioInfo(
+        duration=None,
+        sample_rate=None,
+        channels=None,
+        sample_width=None,
+        file_size=file_size,
+    )
+
+
+def is_past_end(duration, end_time):
+    """Whether a segment ending at `end_time` lies beyond audio of `duration`"""
+    return duration is not None and end_time > duration + DURATION_TOLERANCE
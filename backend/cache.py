@@ -0,0 +1,163 @@
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+from backend import app, redis_client
+
+
+class TTLCache(object):
+    """Small thread-safe LRU cache whose entries expire after `ttl` seconds
+
+    Instances live in a single worker process, so anything stored here has to
+    be safe to serve stale for up to `ttl` seconds. A `ttl` of 0 disables the
+    cache entirely.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return default
+
+            expires_at, value = entry
+
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class VersionedTTLCache(TTLCache):
+    """`TTLCache` which refuses to store a value loaded before an invalidation
+
+    Take `version()` before loading a value and store it with `set_if_current`,
+    it is dropped if any key was deleted or the cache cleared in between, as the
+    value may predate that change. Invalidations are rare compared to loads, so
+    counting them for the whole cache keeps few values from being cached.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self._version = 0
+        self._version_lock = threading.Lock()
+
+    def version(self):
+        with self._version_lock:
+            return self._version
+
+    def set_if_current(self, version, key, value):
+        with self._version_lock:
+            if self._version == version:
+                self.set(key, value)
+
+    def delete(self, key):
+        with self._version_lock:
+            self._version += 1
+            super().delete(key)
+
+    def clear(self):
+        with self._version_lock:
+            self._version += 1
+            super().clear()
+
+
+_shared_caches = {}
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def register_shared_cache(namespace, cache):
+    """Register a worker-local cache whose keys are evicted on every worker when
+    `publish_invalidation` is called for `namespace`
+    """
+    _shared_caches[namespace] = cache
+
+
+def publish_invalidation(namespace, key):
+    _shared_caches[namespace].delete(key)
+    redis_client.publish(app.config["CACHE_INVALIDATION_CHANNEL"], f"{namespace}:{key}")
+
+
+def _evict(message):
+    if isinstance(message, bytes):
+        message = message.decode()
+
+    namespace, _, key = message.partition(":")
+    cache = _shared_caches.get(namespace)
+
+    if cache is not None:
+        cache.delete(key)
+
+
+def _listen_for_invalidations():
+    retry_seconds = 1
+
+    while True:
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(app.config["CACHE_INVALIDATION_CHANNEL"])
+
+            # Anything published while we were not subscribed is lost, so start
+            # over with empty caches after every (re)connect
+            for cache in _shared_caches.values():
+                cache.clear()
+
+            retry_seconds = 1
+            for message in pubsub.listen():
+                _evict(message["data"])
+        except Exception as e:
+            app.logger.error("Cache invalidation listener disconnected")
+            app.logger.error(e)
+            time.sleep(retry_seconds)
+            retry_seconds = min(retry_seconds * 2, 30)
+
+
+@app.before_request
+def start_invalidation_listener():
+    """Start one listener thread per worker process
+
+    uWSGI forks workers after the app is imported, so the thread can only be
+    started lazily from inside the worker.
+    """
+    global _listener_pid
+
+    if _listener_pid == os.getpid():
+        return
+
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+
+        thread = threading.Thread(target=_listen_for_invalidations, daemon=True)
+        thread.start()
+        _listener_pid = os.getpid()
@@ -0,0 +1,196 @@
+from collections import namedtuple
+
+from werkzeug.exceptions import BadRequest, NotFound
+
+from backend import app, db
+from backend.cache import VersionedTTLCache, publish_invalidation, register_shared_cache
+from backend.models import Label, LabelType, LabelValue, annotation_table
+from backend.replica import primary_reads
+
+CatalogLabel = namedtuple("CatalogLabel", ["id", "name", "type", "values"])
+
+
+class LabelCatalog(object):
+    """Labels of a project with their types and values, indexed for validating and
+    serializing annotations without touching the database
+    """
+
+    def __init__(self, labels):
+        self.labels = {label.name: label for label in labels}
+        self.values = {value_id: label for label in labels for value_id in label.values}
+
+    def knows(self, value_ids):
+        return all(value_id in self.values for value_id in value_ids)
+
+    def resolve_value_ids(self, annotations):
+        """Validate annotations sent by clients and return the label value ids
+        """
+        value_ids = []
+
+        for label_name, val in annotations.items():
+            label = self.labels.get(label_name)
+
+            if label is None:
+                raise NotFound(description=f"Label not found with name: `{label_name}`")
+
+            if "values" not in val:
+                raise BadRequest(
+                    description=f"Key: `values` missing in Label: `{label_name}`"
+                )
+
+            label_values = val["values"]
+
+            if isinstance(label_values, list):
+                for val_id in label_values:
+                    if int(val_id) not in label.values:
+                        raise BadRequest(
+                            description=f"`{label_name}` does not have label value with id `{val_id}`"
+                        )
+                    value_ids.append(int(val_id))
+
+            else:
+                if label_values == "-1":
+                    continue
+
+                if int(label_values) not in label.values:
+                    raise BadRequest(
+                        description=f"`{label_name}` does not have label value with id `{label_values}`"
+                    )
+                value_ids.append(int(label_values))
+
+        return list(dict.fromkeys(value_ids))
+
+    def serialize(self, value_ids, detailed=False):
+        """Group label value ids of a segmentation by label name
+
+        `detailed` includes the text of every value, as used by the export.
+        """
+        annotations = dict()
+
+        for value_id in value_ids:
+            label = self.values[value_id]
+            value = (
+                {"id": value_id, "value": label.values[value_id]}
+                if detailed
+                else value_id
+            )
+
+            if label.name not in annotations:
+                annotations[label.name] = {
+                    "id" if detailed else "label_id": label.id,
+                    "values": [] if label.type == "multiselect" else None,
+                }
+
+            if label.type == "multiselect":
+                annotations[label.name]["values"].append(value)
+            else:
+                annotations[label.name]["values"] = value
+
+        return annotations
+
+
+_catalog_cache = VersionedTTLCache(
+    maxsize=app.config["LABEL_CATALOG_CACHE_SIZE"],
+    ttl=app.config["LABEL_CATALOG_CACHE_TTL"],
+)
+register_shared_cache("catalog", _catalog_cache)
+
+
+def load_label_catalog(project_id):
+    # Catalogs are cached until the next change of the labels, which a replica
+    # may not have applied yet
+    with primary_reads():
+        labels = (
+            db.session.query(Label.id, Label.name, LabelType.type)
+            .join(LabelType, Label.type_id == LabelType.id)
+            .filter(Label.project_id == project_id)
+            .order_by(Label.id)
+            .all()
+        )
+        values = (
+            db.session.query(LabelValue.id, LabelValue.label_id, LabelValue.value)
+            .join(Label, LabelValue.label_id == Label.id)
+            .filter(Label.project_id == project_id)
+            .order_by(LabelValue.id)
+            .all()
+        )
+
+    label_values = {label.id: dict() for label in labels}
+    for value in values:
+        label_values[value.label_id][value.id] = value.value
+
+    return LabelCatalog(
+        [
+            CatalogLabel(
+                id=label.id,
+                name=label.name,
+                type=label.type,
+                values=label_values[label.id],
+            )
+            for label in labels
+        ]
+    )
+
+
+def get_label_catalog(project_id, value_ids=(), refresh=False):
+    """Return the label catalog of a project from the worker cache
+
+    The catalog is reloaded when it does not know one of `value_ids`, which can
+    only happen if an invalidation has not reached this worker yet.
+    """
+    key = str(project_id)
+    catalog = _catalog_cache.get(key)
+
+    if refresh or catalog is None or not catalog.knows(value_ids):
+        version = _catalog_cache.version()
+        catalog = load_label_catalog(project_id)
+        _catalog_cache.set_if_current(version, key, catalog)
+
+    return catalog
+
+
+def invalidate_label_catalog(project_id):
+    """Drop the catalog of a project on every worker after its labels or label
+    values changed
+    """
+    publish_invalidation("catalog", str(project_id))
+
+
+def load_segmentation_value_ids(segmentation_ids):
+    """Fetch label value ids of many segmentations with one query on `annotation`
+    """
+    value_ids = {segmentation_id: [] for segmentation_id in segmentation_ids}
+
+    if not value_ids:
+        return value_ids
+
+    rows = (
+        db.session.query(
+            annotation_table.c.segmentation_id, annotation_table.c.label_value_id
+        )
+        .filter(annotation_table.c.segmentation_id.in_(segmentation_ids))
+        .order_by(annotation_table.c.id)
+    )
+    for segmentation_id, label_value_id in rows:
+        value_ids[segmentation_id].append(label_value_id)
+
+    return value_ids
+
+
+def set_segmentation_value_ids(segmentation_id, value_ids):
+    """Replace the annotations of a segmentation with the given label value ids
+    """
+    db.session.execute(
+        annotation_table.delete().where(
+            annotation_table.c.segmentation_id == segmentation_id
+        )
+    )
+
+    if value_ids:
+        db.session.execute(
+            annotation_table.insert(),
+            [
+                {"segmentation_id": segmentation_id, "label_value_id": value_id}
+                for value_id in value_ids
+            ],
+        )
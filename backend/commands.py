@@ -0,0 +1,216 @@
+import os
+import uuid
+
+from datetime import timedelta
+from pathlib import Path
+
+import click
+
+from backend import app
+from backend.counters import reconcile_data_counts
+from backend.ingest import run_worker
+from backend.query_plans import check_query_plans, seed_database
+from backend.storage import create_temp_file, find_orphaned_files, get_storage
+from backend.storage.local import shard_filename
+
+
+@app.cli.command("shard-uploads")
+@click.option("--dry-run", is_flag=True, help="Only report what would be moved.")
+def shard_uploads(dry_run):
+    """Move audio files from the flat upload folder into the sharded layout
+
+    Safe to run while the application serves requests: every file is hard linked
+    to its new place before the old name is removed, so it is always reachable
+    under one of them. Interrupted runs continue where they stopped when started
+    again.
+    """
+    if app.config["STORAGE_DRIVER"] != "local":
+        click.echo("Only files of the local storage driver are sharded")
+        return
+
+    upload_folder = Path(app.config["UPLOAD_FOLDER"])
+
+    moved = 0
+    skipped = 0
+
+    with os.scandir(upload_folder.as_posix()) as entries:
+        for entry in entries:
+            # Hidden entries are partial and temporary uploads
+            if entry.name.startswith(".") or not entry.is_file(follow_symlinks=False):
+                continue
+
+            relative_path = shard_filename(entry.name)
+            if relative_path == entry.name:
+                skipped += 1
+                continue
+
+            target_path = upload_folder.joinpath(relative_path)
+
+            if dry_run:
+                click.echo(f"{entry.name} -> {relative_path}")
+                moved += 1
+                continue
+
+            target_path.parent.mkdir(parents=True, exist_ok=True)
+
+            try:
+                os.link(entry.path, target_path.as_posix())
+            except FileNotFoundError:
+                # Removed since the folder was listed
+                continue
+            except FileExistsError:
+                # Left behind by an interrupted run, or stored again since
+                if not os.path.samefile(entry.path, target_path.as_posix()):
+                    if os.path.getsize(entry.path) != target_path.stat().st_size:
+                        click.echo(
+                            f"Skipping {entry.name}, a different file exists at {relative_path}",
+                            err=True,
+                        )
+                        skipped += 1
+                        continue
+
+            os.unlink(entry.path)
+            moved += 1
+
+            if moved % 1000 == 0:
+                click.echo(f"Moved {moved} files")
+
+    click.echo(f"Moved {moved} files, skipped {skipped}")
+
+
+@app.cli.command("prune-audio")
+@click.option(
+    "--grace-hours",
+    type=float,
+    default=24,
+    help="Keep files modified more recently than this, they may belong to uploads "
+    "still in progress.",
+)
+@click.option("--dry-run", is_flag=True, help="Only report what would be removed.")
+def prune_audio(grace_hours, dry_run):
+    """Remove stored audio files and peaks sidecars no data point refers to
+
+    Requests never remove content addressed files themselves, another request may
+    be about to commit a data point for the same file, so files of failed uploads
+    are left for this sweep.
+    """
+    storage = get_storage()
+    removed = 0
+
+    for key in find_orphaned_files(timedelta(hours=grace_hours)):
+        if dry_run:
+            click.echo(key)
+        else:
+            storage.delete(key)
+        removed += 1
+
+    click.echo(f"{'Would remove' if dry_run else 'Removed'} {removed} files")
+
+
+@app.cli.command("check-storage")
+def check_storage():
+    """Store, read, stream and remove a file with the configured storage driver
+
+    Meant to check the settings of a bucket, or an S3 compatible server like the
+    one started by `docker-compose.s3.yml`, before uploading real data.
+    """
+    storage = get_storage()
+    key = f"check-storage-{uuid.uuid4().hex}.bin"
+    content = os.urandom(3 * 1024 * 1024 + 17)
+
+    fd, temp_path = create_temp_file(".check-")
+    with os.fdopen(fd, "wb") as temp_file:
+        temp_file.write(content)
+
+    def check(name, passed):
+        if not passed:
+            raise click.ClickException(f"{name} failed for {key}")
+        click.echo(f"ok   {name}")
+
+    try:
+        storage.put(key, temp_path)
+        check("put", storage.exists(key) and storage.size(key) == len(content))
+
+        with storage.open(key) as stored_file:
+            read_back = stored_file.read()
+            stored_file.seek(len(content) - 100)
+            tail = stored_file.read()
+        check("open", read_back == content and tail == content[-100:])
+
+        start, end = 1000, len(content) - 1000
+        streamed = b"".join(storage.stream_range(key, start, end, 64 * 1024))
+        check("stream_range", streamed == content[start:end])
+
+        check("touch", storage.touch(key))
+        check("list_files", key in {listed for listed, _ in storage.list_files()})
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        storage.delete(key)
+
+    check("delete", not storage.exists(key))
+
+
+@app.cli.command("ingest-worker")
+@click.option(
+    "--concurrency", type=int, help="Jobs run at the same time, `INGEST_CONCURRENCY`."
+)
+@click.option("--once", is_flag=True, help="Exit once no job is left to run.")
+def ingest_worker(concurrency, once):
+    """Run the processing stages of ingested data points, like peaks generation
+
+    Jobs are queued in the database, so any number of workers can run next to
+    each other and pick up jobs of data points created on any backend node.
+    """
+    processed = run_worker(
+        concurrency=concurrency or app.config["INGEST_CONCURRENCY"],
+        poll_interval=app.config["INGEST_POLL_INTERVAL"],
+        once=once,
+    )
+    click.echo(f"Ran {processed} jobs")
+
+
+@app.cli.command("reconcile-counts")
+@click.option("--project-id", type=int, help="Only recount data of this project.")
+def reconcile_counts(project_id):
+    """Recount the data points shown on the dashboard and correct counters which
+    drifted from the data
+    """
+    corrected = reconcile_data_counts(project_id)
+    click.echo(f"Corrected {corrected} counters")
+
+
+@app.cli.command("check-query-plans")
+@click.option(
+    "--seed",
+    type=int,
+    default=0,
+    help="Generate this many data points first, only on a database of its own.",
+)
+@click.option("--verbose", is_flag=True, help="Print the plan of every query.")
+def check_query_plans_command(seed, verbose):
+    """Explain the queries of frequent routes and fail if any of them reads a
+    whole table instead of using an index
+
+    Plans depend on the amount of data, so run it against a copy of production
+    data or a database seeded with `--seed`.
+    """
+    if seed:
+        seed_database(seed)
+        click.echo(f"Seeded {seed} data points")
+
+    failed = 0
+
+    for name, plan, full_scans in check_query_plans():
+        if full_scans:
+            failed += 1
+            click.echo(f"FAIL {name}: reads {', '.join(full_scans)} in full", err=True)
+        else:
+            click.echo(f"ok   {name}")
+
+        if verbose or full_scans:
+            for row in plan:
+                click.echo(f"     {tuple(row)}")
+
+    if failed:
+        raise click.ClickException(f"{failed} queries read whole tables")
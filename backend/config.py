@@ -10,6 +10,26 @@ class Config(object):
         "DATABASE_URL"
     ) or "sqlite:///" + os.path.join(basedir, "app.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_pre_ping": os.environ.get("DATABASE_POOL_PRE_PING", "True") == "True",
+        "pool_recycle": int(os.environ.get("DATABASE_POOL_RECYCLE", 3600)),
+        # Sizes only apply to pooled connections, so they are passed on when set
+        **{
+            option: int(os.environ[variable])
+            for option, variable in [
+                ("pool_size", "DATABASE_POOL_SIZE"),
+                ("max_overflow", "DATABASE_MAX_OVERFLOW"),
+                ("pool_timeout", "DATABASE_POOL_TIMEOUT"),
+            ]
+            if os.environ.get(variable)
+        },
+    }
+    SQLALCHEMY_BINDS = (
+        {"replica": os.environ["DATABASE_REPLICA_URL"]}
+        if os.environ.get("DATABASE_REPLICA_URL")
+        else None
+    )
+    REPLICA_STICKINESS = int(os.environ.get("REPLICA_STICKINESS", 10))
     SQLALCHEMY_ECHO = True if os.environ.get("SQLALCHEMY_ECHO") == "True" else False
     REDIS_URL = os.environ.get("JWT_REDIS_STORE_URL", "")
     JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "")
@@ -20,3 +40,41 @@ class Config(object):
     JWT_HEADER_TYPE = None
     JWT_BLACKLIST_TOKEN_CHECKS = ["access"]
     UPLOAD_FOLDER = '/root/uploads'
+    # Local to each node, several nodes need to share it or route uploads stickily
+    RESUMABLE_UPLOAD_FOLDER = os.path.join(UPLOAD_FOLDER, ".partial")
+    RESUMABLE_UPLOAD_MAX_AGE = timedelta(
+        hours=int(os.environ.get("RESUMABLE_UPLOAD_MAX_AGE_HOURS", 72))
+    )
+    UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+    IDENTITY_CACHE_TTL = int(os.environ.get("IDENTITY_CACHE_TTL", 30))
+    IDENTITY_CACHE_SIZE = int(os.environ.get("IDENTITY_CACHE_SIZE", 1024))
+    MEMBERSHIP_CACHE_TTL = int(os.environ.get("MEMBERSHIP_CACHE_TTL", 30))
+    MEMBERSHIP_CACHE_SIZE = int(os.environ.get("MEMBERSHIP_CACHE_SIZE", 8192))
+    TOKEN_CACHE_TTL = int(os.environ.get("TOKEN_CACHE_TTL", 10))
+    TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", 4096))
+    CACHE_INVALIDATION_CHANNEL = os.environ.get(
+        "CACHE_INVALIDATION_CHANNEL", "audino:invalidate"
+    )
+    EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 500))
+    LABEL_CATALOG_CACHE_TTL = int(os.environ.get("LABEL_CATALOG_CACHE_TTL", 300))
+    LABEL_CATALOG_CACHE_SIZE = int(os.environ.get("LABEL_CATALOG_CACHE_SIZE", 256))
+    BULK_UPLOAD_MAX_ITEMS = int(os.environ.get("BULK_UPLOAD_MAX_ITEMS", 1000))
+    PEAKS_SAMPLES_PER_PEAK = int(os.environ.get("PEAKS_SAMPLES_PER_PEAK", 512))
+    AUDIO_CACHE_MAX_AGE = int(os.environ.get("AUDIO_CACHE_MAX_AGE", 365 * 24 * 3600))
+    AUDIO_ACCEL_REDIRECT_PREFIX = os.environ.get("AUDIO_ACCEL_REDIRECT_PREFIX", "")
+    STORAGE_DRIVER = os.environ.get("STORAGE_DRIVER", "local")
+    STORAGE_CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, ".cache")
+    S3_BUCKET = os.environ.get("S3_BUCKET", "")
+    S3_PREFIX = os.environ.get("S3_PREFIX", "")
+    S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL", "")
+    S3_REGION = os.environ.get("S3_REGION", "")
+    S3_ACCESS_KEY_ID = os.environ.get("S3_ACCESS_KEY_ID", "")
+    S3_SECRET_ACCESS_KEY = os.environ.get("S3_SECRET_ACCESS_KEY", "")
+    INGEST_CONCURRENCY = int(os.environ.get("INGEST_CONCURRENCY", 4))
+    INGEST_PEAKS_CONCURRENCY = int(os.environ.get("INGEST_PEAKS_CONCURRENCY", 2))
+    INGEST_POLL_INTERVAL = float(os.environ.get("INGEST_POLL_INTERVAL", 2))
+    INGEST_MAX_ATTEMPTS = int(os.environ.get("INGEST_MAX_ATTEMPTS", 5))
+    INGEST_RETRY_DELAY = int(os.environ.get("INGEST_RETRY_DELAY", 30))
+    INGEST_JOB_TIMEOUT = int(os.environ.get("INGEST_JOB_TIMEOUT", 15 * 60))
+    DATA_PAGE_SIZE = int(os.environ.get("DATA_PAGE_SIZE", 10))
+    DATA_PAGE_MAX_SIZE = int(os.environ.get("DATA_PAGE_MAX_SIZE", 100))
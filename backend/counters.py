@@ -0,0 +1,186 @@
+import sqlalchemy as sa
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import set_committed_value
+
+from backend import db
+from backend.models import Data, DataCount, Segmentation
+
+COUNTED_FIELDS = ["total", "completed", "marked_review"]
+
+
+def adjust_data_count(user_id, project_id, **deltas):
+    """Add `deltas` of `total`, `completed` and `marked_review` to the data counts
+    of a user in a project, within the transaction of the change being counted
+
+    Counters are updated in place rather than read and written back, so
+    concurrent requests never lose each other's changes.
+    """
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    table = DataCount.__table__
+    update = (
+        table.update()
+        .where(table.c.user_id == user_id)
+        .where(table.c.project_id == project_id)
+        .values({field: table.c[field] + delta for field, delta in deltas.items()})
+    )
+
+    if db.session.execute(update).rowcount:
+        return
+
+    try:
+        with db.session.begin_nested():
+            db.session.execute(
+                table.insert().values(
+                    user_id=user_id,
+                    project_id=project_id,
+                    **{field: deltas.get(field, 0) for field in COUNTED_FIELDS},
+                )
+            )
+    except IntegrityError:
+        # Another request created the row in the meantime
+        db.session.execute(update)
+
+
+def count_new_data(data_points):
+    """Count data points created in the current transaction"""
+    deltas = {}
+
+    for data in data_points:
+        key = (data.assigned_user_id, data.project_id)
+        total, completed, marked_review = deltas.get(key, (0, 0, 0))
+        deltas[key] = (
+            total + 1,
+            completed + (1 if data.status == "completed" else 0),
+            marked_review + (1 if data.is_marked_for_review else 0),
+        )
+
+    for (user_id, project_id), (total, completed, marked_review) in deltas.items():
+        adjust_data_count(
+            user_id,
+            project_id,
+            total=total,
+            completed=completed,
+            marked_review=marked_review,
+        )
+
+
+def count_segmentations(data, delta):
+    """Add `delta` to the segmentations of a data point, which has to be locked
+    by the current transaction, and count it as completed or pending again when
+    its first segmentation was added or its last one removed
+    """
+    segmentation_count = data.segmentation_count + delta
+    status = "completed" if segmentation_count else "pending"
+
+    if status != data.status:
+        adjust_data_count(
+            data.assigned_user_id,
+            data.project_id,
+            completed=1 if status == "completed" else -1,
+        )
+
+    # Segmentations are not a change of the data point itself, so it keeps its
+    # place in listings ordered by `last_modified`
+    db.session.execute(
+        Data.__table__.update()
+        .where(Data.id == data.id)
+        .values(
+            segmentation_count=segmentation_count,
+            status=status,
+            last_modified=Data.last_modified,
+        )
+    )
+    set_committed_value(data, "segmentation_count", segmentation_count)
+    set_committed_value(data, "status", status)
+
+
+def get_data_counts(user_id, project_id):
+    """Counts of the data points assigned to a user in a project, by dashboard tab
+    """
+    count = DataCount.query.filter_by(user_id=user_id, project_id=project_id).first()
+
+    if count is None:
+        return {"pending": 0, "completed": 0, "marked_review": 0, "all": 0}
+
+    return {
+        "pending": count.total - count.completed,
+        "completed": count.completed,
+        "marked_review": count.marked_review,
+        "all": count.total,
+    }
+
+
+def reconcile_data_counts(project_id=None):
+    """Recount segmentations and data points from scratch and correct counters
+    which drifted, for example through changes made directly in the database
+
+    Returns the number of corrected data points and counters.
+    """
+    segmentation_count = (
+        db.session.query(sa.func.count(Segmentation.id))
+        .filter(Segmentation.data_id == Data.id)
+        .correlate(Data)
+        .as_scalar()
+    )
+    drifted = Data.query.filter(Data.segmentation_count != segmentation_count)
+    if project_id is not None:
+        drifted = drifted.filter(Data.project_id == project_id)
+
+    corrected = drifted.update(
+        {
+            "segmentation_count": segmentation_count,
+            "status": sa.case([(segmentation_count > 0, "completed")], else_="pending"),
+            "last_modified": Data.last_modified,
+        },
+        synchronize_session=False,
+    )
+
+    counts = DataCount.query
+    if project_id is not None:
+        counts = counts.filter_by(project_id=project_id)
+
+    # Counters are locked before counting, so changes committed while counting
+    # wait and apply their own deltas on top of the recounted values
+    counts = counts.with_for_update().all()
+
+    query = db.session.query(
+        Data.assigned_user_id,
+        Data.project_id,
+        sa.func.count(Data.id),
+        sa.func.sum(sa.case([(Data.status == "completed", 1)], else_=0)),
+        sa.func.sum(sa.case([(Data.is_marked_for_review, 1)], else_=0)),
+    ).group_by(Data.assigned_user_id, Data.project_id)
+
+    if project_id is not None:
+        query = query.filter(Data.project_id == project_id)
+
+    actual = {
+        (user_id, project_id): (total, int(completed), int(marked_review))
+        for user_id, project_id, total, completed, marked_review in query
+    }
+
+    for count in counts:
+        values = actual.pop((count.user_id, count.project_id), (0, 0, 0))
+
+        if values != (count.total, count.completed, count.marked_review):
+            count.total, count.completed, count.marked_review = values
+            corrected += 1
+
+    for (user_id, project_id), (total, completed, marked_review) in actual.items():
+        db.session.add(
+            DataCount(
+                user_id=user_id,
+                project_id=project_id,
+                total=total,
+                completed=completed,
+                marked_review=marked_review,
+            )
+        )
+        corrected += 1
+
+    db.session.commit()
+    return corrected
@@ -0,0 +1,143 @@
+import sqlalchemy as sa
+
+from flask import request
+from werkzeug.exceptions import BadRequest
+
+from backend import db
+from backend.models import Data, Segmentation, annotation_table
+
+SCOPES = ["segmentation", "data"]
+
+
+def parse_value_filters(catalog):
+    """Label value ids of the repeated `filter` query parameter, given as
+    `label:value`, grouped by label
+
+    A match needs one of the values of every label filtered on.
+    """
+    groups = dict()
+
+    for value in request.args.getlist("filter"):
+        label_name, _, value_name = value.partition(":")
+        label = catalog.labels.get(label_name)
+
+        if label is None:
+            raise BadRequest(description=f"Label not found with name: `{label_name}`")
+
+        value_ids = [
+            value_id
+            for value_id, label_value in label.values.items()
+            if label_value == value_name
+        ]
+
+        if not value_ids:
+            raise BadRequest(
+                description=f"`{label_name}` does not have label value `{value_name}`"
+            )
+
+        groups.setdefault(label.id, set()).update(value_ids)
+
+    return list(groups.values())
+
+
+def has_any_value(segmentation_id, value_ids):
+    # Aliased so that the subquery never correlates with an enclosing query on
+    # `annotation`, like the one counting facets
+    annotation = annotation_table.alias()
+
+    return sa.exists().where(
+        sa.and_(
+            annotation.c.segmentation_id == segmentation_id,
+            annotation.c.label_value_id.in_(value_ids),
+        )
+    )
+
+
+def matching_segmentations(project_id, value_id_groups):
+    """Ids of the segmentations of a project annotated with a value of every
+    group
+    """
+    segmentation = Segmentation.__table__
+    data = Data.__table__
+
+    return (
+        sa.select([segmentation.c.id])
+        .select_from(segmentation.join(data, data.c.id == segmentation.c.data_id))
+        .where(data.c.project_id == project_id)
+        .where(
+            sa.and_(
+                *[
+                    has_any_value(segmentation.c.id, value_ids)
+                    for value_ids in value_id_groups
+                ]
+            )
+        )
+    )
+
+
+def matching_data(project_id, value_id_groups):
+    """Ids of the data points of a project with a segmentation annotated with a
+    value of every group, not necessarily the same segmentation for all of them
+    """
+    data = Data.__table__
+    segmentation = Segmentation.__table__.alias()
+
+    return (
+        sa.select([data.c.id])
+        .where(data.c.project_id == project_id)
+        .where(
+            sa.and_(
+                *[
+                    sa.exists()
+                    .where(segmentation.c.data_id == data.c.id)
+                    .where(has_any_value(segmentation.c.id, value_ids))
+                    for value_ids in value_id_groups
+                ]
+            )
+        )
+    )
+
+
+def query_annotations(project_id, value_id_groups, scope, limit, offset):
+    """Count, find and facet the segmentations or data points of a project
+    matching `value_id_groups`, all in the database
+
+    Returns the number of matches, `(data_id, segmentation_id)` of one page of
+    them ordered by id and the number of matches annotated with each label value.
+    """
+    segmentation = Segmentation.__table__
+    data = Data.__table__
+
+    if scope == "segmentation":
+        matches = matching_segmentations(project_id, value_id_groups)
+        page = matches.with_only_columns(
+            [segmentation.c.data_id, segmentation.c.id]
+        ).order_by(segmentation.c.id)
+        facet_key = annotation_table.c.segmentation_id
+        facet_source = annotation_table
+    else:
+        matches = matching_data(project_id, value_id_groups)
+        page = matches.with_only_columns([data.c.id, sa.null()]).order_by(data.c.id)
+        facet_key = segmentation.c.data_id
+        facet_source = annotation_table.join(
+            segmentation, segmentation.c.id == annotation_table.c.segmentation_id
+        )
+
+    count = db.session.execute(
+        sa.select([sa.func.count()]).select_from(matches.alias())
+    ).scalar()
+    rows = db.session.execute(page.limit(limit).offset(offset)).fetchall()
+    facet_counts = db.session.execute(
+        sa.select(
+            [annotation_table.c.label_value_id, sa.func.count(sa.distinct(facet_key))]
+        )
+        .select_from(facet_source)
+        .where(facet_key.in_(matches))
+        .group_by(annotation_table.c.label_value_id)
+    ).fetchall()
+
+    return (
+        count,
+        [(data_id, segmentation_id) for data_id, segmentation_id in rows],
+        dict(facet_counts),
+    )
@@ -0,0 +1,46 @@
+from flask import request
+
+
+def parse_fields(available):
+    """Names of the fields requested with the comma separated `fields` query
+    parameter, or `None` when all fields are requested
+
+    Nested fields are requested with their dotted path, like
+    `segmentations.start_time`, which implies their parent. Raises `ValueError`
+    with a message for the response if unknown fields are requested.
+    """
+    value = request.args.get("fields", None, type=str)
+
+    if value is None:
+        return None
+
+    fields = {field.strip() for field in value.split(",") if field.strip()}
+    unknown = fields - set(available)
+
+    if unknown:
+        raise ValueError(f"Unknown fields requested: {', '.join(sorted(unknown))}")
+
+    return fields | {field.split(".")[0] for field in fields}
+
+
+def wants(fields, field):
+    return fields is None or field in fields
+
+
+def nested_fields(fields, parent):
+    """Requested fields below `parent`, `None` for all of them"""
+    if fields is None:
+        return None
+
+    nested = {
+        field[len(parent) + 1 :] for field in fields if field.startswith(f"{parent}.")
+    }
+
+    return nested or None
+
+
+def select_fields(item, fields):
+    if fields is None:
+        return item
+
+    return {key: value for key, value in item.items() if key in fields}
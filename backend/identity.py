@@ -0,0 +1,111 @@
+from collections import namedtuple
+
+from flask import g
+from flask_jwt_extended import get_jwt_identity
+
+from backend import app, db
+from backend.cache import VersionedTTLCache, publish_invalidation, register_shared_cache
+from backend.models import Role, User, user_project_table
+from backend.replica import primary_reads
+
+
+class RequestUser(namedtuple("RequestUser", ["id", "username", "role"])):
+    """Plain snapshot of the authenticated user which is safe to share between
+    requests, unlike a `User` bound to a session
+    """
+
+    __slots__ = ()
+
+    @property
+    def is_admin(self):
+        return self.role == "admin"
+
+
+_identity_cache = VersionedTTLCache(
+    maxsize=app.config["IDENTITY_CACHE_SIZE"], ttl=app.config["IDENTITY_CACHE_TTL"]
+)
+register_shared_cache("user", _identity_cache)
+
+_membership_cache = VersionedTTLCache(
+    maxsize=app.config["MEMBERSHIP_CACHE_SIZE"], ttl=app.config["MEMBERSHIP_CACHE_TTL"]
+)
+register_shared_cache("membership", _membership_cache)
+
+
+def load_request_user(username):
+    """Load id and role of a user straight from the primary database
+    """
+    with primary_reads():
+        user = (
+            db.session.query(User.id, User.username, Role.role)
+            .join(Role, User.role_id == Role.id)
+            .filter(User.username == username)
+            .first()
+        )
+
+    if user is None:
+        return None
+
+    return RequestUser(id=user.id, username=user.username, role=user.role)
+
+
+def get_request_user():
+    """Resolve the JWT identity of the current request to a `RequestUser`
+
+    Must be called inside a `jwt_required` view. Users are cached per worker for
+    `IDENTITY_CACHE_TTL` seconds and once per request in `g`.
+    """
+    if "request_user" in g:
+        return g.request_user
+
+    username = get_jwt_identity()["username"]
+    request_user = _identity_cache.get(username)
+
+    if request_user is None:
+        # A user changed while loading is not cached, it may be the old one
+        version = _identity_cache.version()
+        request_user = load_request_user(username)
+
+        if request_user is not None:
+            _identity_cache.set_if_current(version, username, request_user)
+
+    g.request_user = request_user
+    return request_user
+
+
+def is_project_member(user_id, project_id):
+    """Check membership with a single lookup on the unique `(user_id, project_id)`
+    index of `user_project`, regardless of how many users the project has
+    """
+    key = f"{user_id}:{project_id}"
+    is_member = _membership_cache.get(key)
+
+    if is_member is None:
+        version = _membership_cache.version()
+        with primary_reads():
+            is_member = db.session.query(
+                db.session.query(user_project_table.c.id)
+                .filter(
+                    user_project_table.c.user_id == user_id,
+                    user_project_table.c.project_id == project_id,
+                )
+                .exists()
+            ).scalar()
+        _membership_cache.set_if_current(version, key, is_member)
+
+    return is_member
+
+
+def invalidate_users(usernames):
+    """Drop cached identities on every worker after their role changed
+    """
+    for username in usernames:
+        publish_invalidation("user", username)
+
+
+def invalidate_memberships(user_ids, project_id):
+    """Drop cached membership checks on every worker after users were added to
+    or removed from a project
+    """
+    for user_id in user_ids:
+        publish_invalidation("membership", f"{user_id}:{project_id}")
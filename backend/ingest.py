@@ -0,0 +1,274 @@
+import os
+import shutil
+import socket
+import time
+
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+from backend import app, db
+from backend.audio import read_audio_info
+from backend.models import Data, IngestJob
+from backend.peaks import generate_peaks
+from backend.storage import create_temp_file, get_storage
+
+IngestStage = namedtuple("IngestStage", ["name", "run", "concurrency"])
+
+INGEST_STAGES = {}
+
+
+def ingest_stage(name, concurrency=None):
+    """Register a function processing a `Data` row after it was ingested
+
+    Every registered stage gets a job for each new data point and runs in
+    `flask ingest-worker`, outside of the upload request. Stages have to be
+    idempotent, since failed jobs are retried. `concurrency` limits how many jobs
+    of the stage one worker runs at the same time.
+    """
+
+    def register(run):
+        INGEST_STAGES[name] = IngestStage(name=name, run=run, concurrency=concurrency)
+        return run
+
+    return register
+
+
+def enqueue_ingest_jobs(data_ids, stages=None):
+    """Add a job for every registered stage, or every stage of `stages`, of each
+    data point, to be committed together with the data points themselves
+    """
+    now = datetime.utcnow()
+    rows = [
+        {
+            "data_id": data_id,
+            "stage": stage,
+            "status": "pending",
+            "attempts": 0,
+            "run_after": now,
+        }
+        for data_id in data_ids
+        for stage in stages or INGEST_STAGES
+    ]
+
+    if rows:
+        db.session.execute(IngestJob.__table__.insert(), rows)
+
+
+def update_processing_status(data_id):
+    statuses = {
+        status
+        for (status,) in db.session.query(IngestJob.status).filter_by(data_id=data_id)
+    }
+
+    if "failed" in statuses:
+        processing_status = "failed"
+    elif "running" in statuses:
+        processing_status = "processing"
+    elif "pending" in statuses:
+        processing_status = "pending"
+    else:
+        processing_status = "ready"
+
+    Data.query.filter_by(id=data_id).update(
+        {"processing_status": processing_status}, synchronize_session=False
+    )
+
+
+def release_stale_jobs():
+    """Return jobs of workers which died while running them to the queue"""
+    timeout = datetime.utcnow() - timedelta(seconds=app.config["INGEST_JOB_TIMEOUT"])
+
+    released = IngestJob.query.filter(
+        IngestJob.status == "running", IngestJob.locked_at < timeout
+    ).update(
+        {"status": "pending", "locked_by": None, "locked_at": None},
+        synchronize_session=False,
+    )
+    db.session.commit()
+    return released
+
+
+def claim_jobs(worker_id, limit, capacity):
+    """Claim up to `limit` runnable jobs, and of each stage at most as many as
+    `capacity` maps its name to, `None` meaning no limit
+
+    Workers do not lock rows while looking for jobs. A job is claimed with an
+    update which only matches while it is still pending, so when several
+    workers race for the same job exactly one of them wins and the others move
+    on to the next candidate.
+    """
+    capacity = dict(capacity)
+    stages = [stage for stage, free in capacity.items() if free is None or free > 0]
+
+    if limit <= 0 or not stages:
+        return []
+
+    now = datetime.utcnow()
+    candidates = (
+        db.session.query(IngestJob.id, IngestJob.data_id, IngestJob.stage)
+        .filter(
+            IngestJob.status == "pending",
+            IngestJob.run_after <= now,
+            IngestJob.stage.in_(stages),
+        )
+        .order_by(IngestJob.run_after, IngestJob.id)
+        .limit(limit * 4)
+        .all()
+    )
+    db.session.commit()
+
+    claimed = []
+    for job_id, data_id, stage in candidates:
+        if capacity[stage] is not None and capacity[stage] <= 0:
+            continue
+
+        result = db.session.execute(
+            IngestJob.__table__.update()
+            .where(IngestJob.id == job_id)
+            .where(IngestJob.status == "pending")
+            .values(
+                status="running",
+                locked_by=worker_id,
+                locked_at=now,
+                attempts=IngestJob.attempts + 1,
+            )
+        )
+
+        if result.rowcount == 1:
+            update_processing_status(data_id)
+            claimed.append((job_id, stage))
+
+            if capacity[stage] is not None:
+                capacity[stage] -= 1
+
+        db.session.commit()
+
+        if len(claimed) == limit:
+            break
+
+    return claimed
+
+
+def run_job(job_id):
+    """Run a claimed job and record its outcome, failed jobs are retried with an
+    exponential backoff until `INGEST_MAX_ATTEMPTS` is reached
+    """
+    with app.app_context():
+        try:
+            job = IngestJob.query.get(job_id)
+            data_id = job.data_id
+
+            try:
+                INGEST_STAGES[job.stage].run(job.data)
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Error running {job.stage} of data {data_id}")
+                app.logger.error(e)
+
+                job = IngestJob.query.get(job_id)
+                job.last_error = str(e) or type(e).__name__
+
+                if job.attempts >= app.config["INGEST_MAX_ATTEMPTS"]:
+                    job.status = "failed"
+                else:
+                    delay = app.config["INGEST_RETRY_DELAY"] * 2 ** (job.attempts - 1)
+                    job.status = "pending"
+                    job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+            else:
+                job.status = "done"
+                job.last_error = None
+
+            job.locked_by = None
+            job.locked_at = None
+            db.session.flush()
+
+            update_processing_status(data_id)
+            db.session.commit()
+        finally:
+            db.session.remove()
+
+
+def run_worker(concurrency, poll_interval, once=False):
+    """Run ingest jobs until stopped, or with `once` until none is left to run
+
+    Returns the number of jobs run.
+    """
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    running = {}
+    processed = 0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            running_stages = list(running.values())
+            capacity = {
+                stage.name: None
+                if stage.concurrency is None
+                else stage.concurrency - running_stages.count(stage.name)
+                for stage in INGEST_STAGES.values()
+            }
+
+            try:
+                release_stale_jobs()
+                jobs = claim_jobs(worker_id, concurrency - len(running), capacity)
+            except Exception as e:
+                # The database may be restarting or not migrated yet
+                db.session.rollback()
+                app.logger.error("Error claiming ingest jobs")
+                app.logger.error(e)
+                jobs = []
+
+            for job_id, stage in jobs:
+                running[executor.submit(run_job, job_id)] = stage
+
+            if not running:
+                if once:
+                    return processed
+
+                time.sleep(poll_interval)
+                continue
+
+            done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                processed += 1
+
+                try:
+                    future.result()
+                except Exception as e:
+                    # The outcome could not be recorded, the job is run again once
+                    # it counts as stale
+                    app.logger.error(f"Error recording outcome of a {stage} job")
+                    app.logger.error(e)
+
+
+@ingest_stage("metadata")
+def read_missing_audio_info(data):
+    """Read audio metadata of data points stored before it was parsed at upload"""
+    if data.file_size is not None:
+        return
+
+    storage = get_storage()
+    path = storage.local_path(data.filename)
+
+    if path is not None:
+        data.set_audio_info(read_audio_info(path.as_posix()))
+        db.session.commit()
+        return
+
+    temp_fd, temp_path = create_temp_file(".ingest-")
+    try:
+        with os.fdopen(temp_fd, "wb") as temp_file, storage.open(
+            data.filename
+        ) as stored_file:
+            shutil.copyfileobj(stored_file, temp_file)
+
+        data.set_audio_info(read_audio_info(temp_path))
+        db.session.commit()
+    finally:
+        os.remove(temp_path)
+
+
+@ingest_stage("peaks", concurrency=app.config["INGEST_PEAKS_CONCURRENCY"])
+def generate_data_peaks(data):
+    generate_peaks(data.filename)
@@ -0,0 +1,37 @@
+"""content addressed data files
+
+Revision ID: 21bb999724c3
+Revises: ad03ff92a270
+Create Date: 2026-10-17 10:02:17.554913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "21bb999724c3"
+down_revision = "ad03ff92a270"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Identical recordings now share one file, so several data points may point
+    # to the same filename
+    op.drop_constraint("filename", "data", type_="unique")
+    op.create_index(op.f("ix_data_filename"), "data", ["filename"], unique=False)
+    op.add_column(
+        "data", sa.Column("content_hash", sa.String(length=64), nullable=True)
+    )
+    op.create_index(
+        op.f("ix_data_content_hash"), "data", ["content_hash"], unique=False
+    )
+
+
+def downgrade():
+    # Fails if data points already share a file
+    op.drop_index(op.f("ix_data_content_hash"), table_name="data")
+    op.drop_column("data", "content_hash")
+    op.drop_index(op.f("ix_data_filename"), table_name="data")
+    op.create_unique_constraint("filename", "data", ["filename"])
@@ -0,0 +1,61 @@
+"""data counts per user and project
+
+Revision ID: 3f1d7e5b0a92
+Revises: 8c4f2a9d61e7
+Create Date: 2026-10-17 13:35:52.170448
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3f1d7e5b0a92"
+down_revision = "8c4f2a9d61e7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "data_count",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("project_id", sa.Integer(), nullable=False),
+        sa.Column("total", sa.Integer(), nullable=False),
+        sa.Column("completed", sa.Integer(), nullable=False),
+        sa.Column("marked_review", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("last_modified", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["project_id"], ["project.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint(
+            "user_id", "project_id", name="_count_user_id_project_id_uc"
+        ),
+    )
+    op.execute(
+        """
+        INSERT INTO data_count
+            (user_id, project_id, total, completed, marked_review, created_at,
+            last_modified)
+        SELECT
+            assigned_user_id,
+            project_id,
+            COUNT(*),
+            SUM(
+                CASE WHEN EXISTS (
+                    SELECT 1 FROM segmentation WHERE segmentation.data_id = data.id
+                ) THEN 1 ELSE 0 END
+            ),
+            SUM(CASE WHEN is_marked_for_review THEN 1 ELSE 0 END),
+            CURRENT_TIMESTAMP,
+            CURRENT_TIMESTAMP
+        FROM data
+        GROUP BY assigned_user_id, project_id
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("data_count")
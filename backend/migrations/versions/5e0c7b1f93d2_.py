@@ -0,0 +1,32 @@
+"""audio metadata of data
+
+Revision ID: 5e0c7b1f93d2
+Revises: 21bb999724c3
+Create Date: 2026-10-17 11:24:41.318027
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5e0c7b1f93d2"
+down_revision = "21bb999724c3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("data", sa.Column("duration", sa.Float(), nullable=True))
+    op.add_column("data", sa.Column("sample_rate", sa.Integer(), nullable=True))
+    op.add_column("data", sa.Column("channels", sa.SmallInteger(), nullable=True))
+    op.add_column("data", sa.Column("sample_width", sa.SmallInteger(), nullable=True))
+    op.add_column("data", sa.Column("file_size", sa.BigInteger(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("data", "file_size")
+    op.drop_column("data", "sample_width")
+    op.drop_column("data", "channels")
+    op.drop_column("data", "sample_rate")
+    op.drop_column("data", "duration")
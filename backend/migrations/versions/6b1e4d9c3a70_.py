@@ -0,0 +1,76 @@
+"""full-text search over transcriptions
+
+Revision ID: 6b1e4d9c3a70
+Revises: d2b8f64e1c39
+Create Date: 2026-10-17 15:41:08.266305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "6b1e4d9c3a70"
+down_revision = "d2b8f64e1c39"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_segmentation_transcription_fulltext",
+        "segmentation",
+        ["transcription"],
+        unique=False,
+        mysql_prefix="FULLTEXT",
+    )
+    op.create_index(
+        "ix_data_reference_transcription_fulltext",
+        "data",
+        ["reference_transcription"],
+        unique=False,
+        mysql_prefix="FULLTEXT",
+    )
+
+    if op.get_bind().dialect.name != "sqlite":
+        return
+
+    # SQLite has no FULLTEXT indexes, the application keeps this table in sync
+    op.execute(
+        """
+        CREATE VIRTUAL TABLE search_index USING fts5(
+            content,
+            project_id UNINDEXED,
+            data_id UNINDEXED,
+            segmentation_id UNINDEXED
+        )
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO search_index
+            (rowid, content, project_id, data_id, segmentation_id)
+        SELECT segmentation.id * 2 + 1, segmentation.transcription, data.project_id,
+            data.id, segmentation.id
+        FROM segmentation
+        JOIN data ON data.id = segmentation.data_id
+        WHERE segmentation.transcription <> ''
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO search_index
+            (rowid, content, project_id, data_id, segmentation_id)
+        SELECT id * 2, reference_transcription, project_id, id, NULL
+        FROM data
+        WHERE reference_transcription <> ''
+        """
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "sqlite":
+        op.execute("DROP TABLE search_index")
+
+    op.drop_index("ix_data_reference_transcription_fulltext", table_name="data")
+    op.drop_index("ix_segmentation_transcription_fulltext", table_name="segmentation")
@@ -0,0 +1,74 @@
+"""ingest job queue and processing status of data
+
+Revision ID: 8c4f2a9d61e7
+Revises: 5e0c7b1f93d2
+Create Date: 2026-10-17 12:48:09.604113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8c4f2a9d61e7"
+down_revision = "5e0c7b1f93d2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "ingest_job",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("data_id", sa.Integer(), nullable=False),
+        sa.Column("stage", sa.String(length=32), nullable=False),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("run_after", sa.DateTime(), nullable=False),
+        sa.Column("locked_by", sa.String(length=64), nullable=True),
+        sa.Column("locked_at", sa.DateTime(), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("last_modified", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["data_id"], ["data.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("data_id", "stage", name="_data_id_stage_uc"),
+    )
+    op.create_index(
+        op.f("ix_ingest_job_data_id"), "ingest_job", ["data_id"], unique=False
+    )
+    op.create_index(
+        "ix_ingest_job_status_run_after",
+        "ingest_job",
+        ["status", "run_after"],
+        unique=False,
+    )
+    op.add_column(
+        "data",
+        sa.Column(
+            "processing_status",
+            sa.String(length=16),
+            nullable=False,
+            server_default="pending",
+        ),
+    )
+
+    # Existing data points go through the same stages as new ones, which fills in
+    # what was never computed for them and skips what already exists
+    for stage in ("metadata", "peaks"):
+        op.execute(
+            f"""
+            INSERT INTO ingest_job
+                (data_id, stage, status, attempts, run_after, created_at, last_modified)
+            SELECT id, '{stage}', 'pending', 0, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP,
+                CURRENT_TIMESTAMP
+            FROM data
+            """
+        )
+
+
+def downgrade():
+    op.drop_column("data", "processing_status")
+    op.drop_index("ix_ingest_job_status_run_after", table_name="ingest_job")
+    op.drop_index(op.f("ix_ingest_job_data_id"), table_name="ingest_job")
+    op.drop_table("ingest_job")
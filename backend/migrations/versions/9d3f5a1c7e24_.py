@@ -0,0 +1,44 @@
+"""indexes for foreign keys of hot queries
+
+Revision ID: 9d3f5a1c7e24
+Revises: e4a9c2b7d815
+Create Date: 2026-10-17 17:05:44.912317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "9d3f5a1c7e24"
+down_revision = "e4a9c2b7d815"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_data_project_id", "data", ["project_id"], unique=False)
+    op.create_index(
+        "ix_segmentation_data_id", "segmentation", ["data_id"], unique=False
+    )
+    op.create_index(
+        "ix_user_project_project_id_user_id",
+        "user_project",
+        ["project_id", "user_id"],
+        unique=False,
+    )
+    op.create_index("ix_label_project_id", "label", ["project_id"], unique=False)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "mysql":
+        # MySQL dropped the indexes it created for these foreign keys once the
+        # new ones covered them, they have to be restored before dropping those
+        op.create_index("project_id", "label", ["project_id"], unique=False)
+        op.create_index("project_id", "user_project", ["project_id"], unique=False)
+        op.create_index("data_id", "segmentation", ["data_id"], unique=False)
+
+    op.drop_index("ix_label_project_id", table_name="label")
+    op.drop_index("ix_user_project_project_id_user_id", table_name="user_project")
+    op.drop_index("ix_segmentation_data_id", table_name="segmentation")
+    op.drop_index("ix_data_project_id", table_name="data")
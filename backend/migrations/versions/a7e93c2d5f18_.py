@@ -0,0 +1,36 @@
+"""index for keyset pagination of data listings
+
+Revision ID: a7e93c2d5f18
+Revises: 3f1d7e5b0a92
+Create Date: 2026-10-17 14:10:27.938155
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a7e93c2d5f18"
+down_revision = "3f1d7e5b0a92"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_data_project_id_assigned_user_id_last_modified",
+        "data",
+        ["project_id", "assigned_user_id", "last_modified"],
+        unique=False,
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "mysql":
+        # MySQL dropped the index it created for the foreign key on `project_id`
+        # once this one covered it, it has to be restored before dropping this one
+        op.create_index("project_id", "data", ["project_id"], unique=False)
+
+    op.drop_index(
+        "ix_data_project_id_assigned_user_id_last_modified", table_name="data"
+    )
@@ -0,0 +1,41 @@
+"""unique user_project membership
+
+Revision ID: ad03ff92a270
+Revises: b60bb67d1758
+Create Date: 2026-10-17 09:12:41.318022
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "ad03ff92a270"
+down_revision = "b60bb67d1758"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keep the oldest row of every duplicated membership before enforcing
+    # uniqueness. The derived table is needed for MySQL to allow the subquery.
+    op.execute(
+        """
+        DELETE FROM user_project
+        WHERE id NOT IN (
+            SELECT id FROM (
+                SELECT MIN(id) AS id FROM user_project GROUP BY user_id, project_id
+            ) AS memberships
+        )
+        """
+    )
+    op.create_unique_constraint(
+        "_user_id_project_id_uc", "user_project", ["user_id", "project_id"]
+    )
+
+
+def downgrade():
+    # MySQL needs an index on `user_id` for its foreign key once the unique
+    # constraint is gone
+    op.create_index("ix_user_project_user_id", "user_project", ["user_id"])
+    op.drop_constraint("_user_id_project_id_uc", "user_project", type_="unique")
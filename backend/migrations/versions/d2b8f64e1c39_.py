@@ -0,0 +1,53 @@
+"""segmentation count and annotation status of data
+
+Revision ID: d2b8f64e1c39
+Revises: a7e93c2d5f18
+Create Date: 2026-10-17 14:52:13.481726
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d2b8f64e1c39"
+down_revision = "a7e93c2d5f18"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "data",
+        sa.Column(
+            "segmentation_count", sa.Integer(), nullable=False, server_default="0"
+        ),
+    )
+    op.add_column(
+        "data",
+        sa.Column(
+            "status", sa.String(length=16), nullable=False, server_default="pending"
+        ),
+    )
+    op.execute(
+        """
+        UPDATE data SET segmentation_count = (
+            SELECT COUNT(*) FROM segmentation WHERE segmentation.data_id = data.id
+        )
+        """
+    )
+    op.execute("UPDATE data SET status = 'completed' WHERE segmentation_count > 0")
+    op.create_index(
+        "ix_data_project_id_assigned_user_id_status_last_modified",
+        "data",
+        ["project_id", "assigned_user_id", "status", "last_modified"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "ix_data_project_id_assigned_user_id_status_last_modified", table_name="data"
+    )
+    op.drop_column("data", "status")
+    op.drop_column("data", "segmentation_count")
@@ -0,0 +1,50 @@
+"""annotation indexes for label value queries
+
+Revision ID: e4a9c2b7d815
+Revises: 6b1e4d9c3a70
+Create Date: 2026-10-17 16:20:37.590142
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e4a9c2b7d815"
+down_revision = "6b1e4d9c3a70"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_annotation_segmentation_id_label_value_id",
+        "annotation",
+        ["segmentation_id", "label_value_id"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_annotation_label_value_id_segmentation_id",
+        "annotation",
+        ["label_value_id", "segmentation_id"],
+        unique=False,
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "mysql":
+        # MySQL dropped the indexes it created for these foreign keys once the
+        # new ones covered them, they have to be restored before dropping those
+        op.create_index(
+            "segmentation_id", "annotation", ["segmentation_id"], unique=False
+        )
+        op.create_index(
+            "label_value_id", "annotation", ["label_value_id"], unique=False
+        )
+
+    op.drop_index(
+        "ix_annotation_label_value_id_segmentation_id", table_name="annotation"
+    )
+    op.drop_index(
+        "ix_annotation_segmentation_id_label_value_id", table_name="annotation"
+    )
@@ -1,6 +1,7 @@
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from backend import db
+from backend.fields import select_fields, wants
 
 annotation_table = db.Table(
     "annotation",
@@ -23,6 +24,16 @@ annotation_table = db.Table(
         default=db.func.now(),
         onupdate=db.func.utc_timestamp(),
     ),
+    db.Index(
+        "ix_annotation_segmentation_id_label_value_id",
+        "segmentation_id",
+        "label_value_id",
+    ),
+    db.Index(
+        "ix_annotation_label_value_id_segmentation_id",
+        "label_value_id",
+        "segmentation_id",
+    ),
 )
 
 user_project_table = db.Table(
@@ -39,6 +50,10 @@ user_project_table = db.Table(
         default=db.func.now(),
         onupdate=db.func.utc_timestamp(),
     ),
+    db.UniqueConstraint("user_id", "project_id", name="_user_id_project_id_uc"),
+    # The unique constraint serves lookups by user, members of a project are
+    # looked up by project
+    db.Index("ix_user_project_project_id_user_id", "project_id", "user_id"),
 )
 
 
@@ -55,18 +70,41 @@ class Data(db.Model):
         "assigned_user_id", db.Integer(), db.ForeignKey("user.id"), nullable=False
     )
 
-    filename = db.Column("filename", db.String(100), nullable=False, unique=True)
+    filename = db.Column("filename", db.String(100), nullable=False, index=True)
+
+    content_hash = db.Column("content_hash", db.String(64), nullable=True, index=True)
 
     original_filename = db.Column("original_filename", db.String(100), nullable=False)
 
-    reference_transcription = db.Column(
-        "reference_transcription", db.Text(), nullable=True
+    # Unbounded text is only loaded when accessed or undeferred by a query
+    reference_transcription = db.deferred(
+        db.Column("reference_transcription", db.Text(), nullable=True)
     )
 
+    duration = db.Column("duration", db.Float(), nullable=True)
+
+    sample_rate = db.Column("sample_rate", db.Integer(), nullable=True)
+
+    channels = db.Column("channels", db.SmallInteger(), nullable=True)
+
+    sample_width = db.Column("sample_width", db.SmallInteger(), nullable=True)
+
+    file_size = db.Column("file_size", db.BigInteger(), nullable=True)
+
     is_marked_for_review = db.Column(
         "is_marked_for_review", db.Boolean(), nullable=False, default=False
     )
 
+    processing_status = db.Column(
+        "processing_status", db.String(16), nullable=False, default="pending"
+    )
+
+    segmentation_count = db.Column(
+        "segmentation_count", db.Integer(), nullable=False, default=0
+    )
+
+    status = db.Column("status", db.String(16), nullable=False, default="pending")
+
     created_at = db.Column(
         "created_at", db.DateTime(), nullable=False, default=db.func.now()
     )
@@ -83,27 +121,162 @@ class Data(db.Model):
     assigned_user = db.relationship("User")
     segmentations = db.relationship("Segmentation", backref="Data")
 
+    __table_args__ = (
+        # Listings of a user's data in a project are read in `(last_modified, id)`
+        # order, InnoDB appends `id` to every secondary index
+        db.Index(
+            "ix_data_project_id_assigned_user_id_last_modified",
+            "project_id",
+            "assigned_user_id",
+            "last_modified",
+        ),
+        db.Index(
+            "ix_data_project_id_assigned_user_id_status_last_modified",
+            "project_id",
+            "assigned_user_id",
+            "status",
+            "last_modified",
+        ),
+        # Exports walk the data of a project in `id` order
+        db.Index("ix_data_project_id", "project_id"),
+        db.Index(
+            "ix_data_reference_transcription_fulltext",
+            "reference_transcription",
+            mysql_prefix="FULLTEXT",
+        ),
+    )
+
     def update_marked_review(self, marked_review):
         self.is_marked_for_review = marked_review
 
     def set_segmentations(self, segmentations):
         self.segmentations = segmentations
-
-    def to_dict(self):
-        return {
+        self.set_segmentation_count(len(segmentations))
+
+    def set_segmentation_count(self, segmentation_count):
+        self.segmentation_count = segmentation_count
+        self.status = "completed" if segmentation_count else "pending"
+
+    def set_audio_info(self, audio_info):
+        self.duration = audio_info.duration
+        self.sample_rate = audio_info.sample_rate
+        self.channels = audio_info.channels
+        self.sample_width = audio_info.sample_width
+        self.file_size = audio_info.file_size
+
+    def to_dict(self, fields=None):
+        """Serialize the data point, or only `fields` of it, without loading
+        deferred columns or relationships which are not requested
+        """
+        data = {
             "original_filename": self.original_filename,
             "filename": self.filename,
             "url": f"/audios/{self.filename}",
-            "reference_transcription": self.reference_transcription,
             "is_marked_for_review": self.is_marked_for_review,
+            "duration": self.duration,
+            "sample_rate": self.sample_rate,
+            "channels": self.channels,
+            "sample_width": self.sample_width,
+            "file_size": self.file_size,
+            "processing_status": self.processing_status,
+            "segmentation_count": self.segmentation_count,
+            "status": self.status,
             "created_at": self.created_at,
             "last_modified": self.last_modified,
-            "assigned_user": {
+        }
+
+        if wants(fields, "reference_transcription"):
+            data["reference_transcription"] = self.reference_transcription
+
+        if wants(fields, "assigned_user"):
+            data["assigned_user"] = {
                 "id": self.assigned_user_id,
                 "username": self.assigned_user.username,
                 "role": self.assigned_user.role.role,
-            },
-        }
+            }
+
+        return select_fields(data, fields)
+
+
+class DataCount(db.Model):
+    __tablename__ = "data_count"
+
+    id = db.Column("id", db.Integer(), primary_key=True)
+
+    user_id = db.Column(
+        "user_id", db.Integer(), db.ForeignKey("user.id"), nullable=False
+    )
+
+    project_id = db.Column(
+        "project_id", db.Integer(), db.ForeignKey("project.id"), nullable=False
+    )
+
+    total = db.Column("total", db.Integer(), nullable=False, default=0)
+
+    completed = db.Column("completed", db.Integer(), nullable=False, default=0)
+
+    marked_review = db.Column("marked_review", db.Integer(), nullable=False, default=0)
+
+    created_at = db.Column(
+        "created_at", db.DateTime(), nullable=False, default=db.func.now()
+    )
+
+    last_modified = db.Column(
+        "last_modified",
+        db.DateTime(),
+        nullable=False,
+        default=db.func.now(),
+        onupdate=db.func.utc_timestamp(),
+    )
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "user_id", "project_id", name="_count_user_id_project_id_uc"
+        ),
+    )
+
+
+class IngestJob(db.Model):
+    __tablename__ = "ingest_job"
+
+    id = db.Column("id", db.Integer(), primary_key=True)
+
+    data_id = db.Column(
+        "data_id", db.Integer(), db.ForeignKey("data.id"), nullable=False, index=True
+    )
+
+    stage = db.Column("stage", db.String(32), nullable=False)
+
+    status = db.Column("status", db.String(16), nullable=False, default="pending")
+
+    attempts = db.Column("attempts", db.Integer(), nullable=False, default=0)
+
+    run_after = db.Column("run_after", db.DateTime(), nullable=False)
+
+    locked_by = db.Column("locked_by", db.String(64), nullable=True)
+
+    locked_at = db.Column("locked_at", db.DateTime(), nullable=True)
+
+    last_error = db.Column("last_error", db.Text(), nullable=True)
+
+    created_at = db.Column(
+        "created_at", db.DateTime(), nullable=False, default=db.func.now()
+    )
+
+    last_modified = db.Column(
+        "last_modified",
+        db.DateTime(),
+        nullable=False,
+        default=db.func.now(),
+        onupdate=db.func.utc_timestamp(),
+    )
+
+    data = db.relationship("Data")
+
+    __table_args__ = (
+        db.UniqueConstraint("data_id", "stage", name="_data_id_stage_uc"),
+        db.Index("ix_ingest_job_status_run_after", "status", "run_after"),
+    )
 
 
 class Label(db.Model):
@@ -138,6 +311,7 @@ class Label(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint("name", "project_id", name="_name_project_id_uc"),
+        db.Index("ix_label_project_id", "project_id"),
     )
 
     def set_label_type(self, label_type_id):
@@ -266,7 +440,7 @@ class Segmentation(db.Model):
 
     end_time = db.Column("end_time", db.Float(), nullable=False)
 
-    transcription = db.Column("transcription", db.Text(), nullable=True)
+    transcription = db.deferred(db.Column("transcription", db.Text(), nullable=True))
 
     created_at = db.Column(
         "created_at", db.DateTime(), nullable=False, default=db.func.now()
@@ -284,6 +458,15 @@ class Segmentation(db.Model):
         "LabelValue", secondary=annotation_table, back_populates="segmentations",
     )
 
+    __table_args__ = (
+        db.Index("ix_segmentation_data_id", "data_id"),
+        db.Index(
+            "ix_segmentation_transcription_fulltext",
+            "transcription",
+            mysql_prefix="FULLTEXT",
+        ),
+    )
+
     def set_start_time(self, start_time):
         self.start_time = start_time
 
@@ -293,15 +476,19 @@ class Segmentation(db.Model):
     def set_transcription(self, transcription):
         self.transcription = transcription
 
-    def to_dict(self):
-        return {
+    def to_dict(self, fields=None):
+        segmentation = {
             "start_time": self.start_time,
             "end_time": self.end_time,
-            "transcription": self.transcription,
             "created_at": self.created_at,
             "last_modified": self.last_modified,
         }
 
+        if wants(fields, "transcription"):
+            segmentation["transcription"] = self.transcription
+
+        return select_fields(segmentation, fields)
+
 
 class User(db.Model):
     __tablename__ = "user"
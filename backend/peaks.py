@@ -0,0 +1,290 @@
+import os
+import shutil
+import struct
+import tempfile
+
+from pathlib import Path
+
+import numpy as np
+
+from backend import app
+from backend.audio import WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_PCM, read_wav_layout
+from backend.storage import create_temp_file, get_storage
+
+PEAKS_EXTENSION = ".peaks"
+
+# magic, sample rate, samples per peak of level 0, number of levels, followed by
+# (offset, number of peaks) of every level
+PEAKS_HEADER = struct.Struct("<8sIII4x")
+PEAKS_LEVEL = struct.Struct("<QQ")
+PEAKS_MAGIC = b"AUDPEAK2"
+
+# Peaks are stored as interleaved (min, max) pairs scaled to 16 bit
+PEAKS_DTYPE = np.dtype("<i2")
+
+# Peaks are computed over this many buckets per read to bound memory use
+PEAKS_BUCKETS_PER_READ = 4096
+
+
+def peaks_key(filename):
+    """Name of the peaks sidecar stored next to an audio file"""
+    return f"{filename}{PEAKS_EXTENSION}"
+
+
+def decode_wav_samples(raw, layout):
+    """Turn raw WAV sample bytes into a float32 array of shape (frames, channels)
+    scaled to [-1, 1]
+    """
+    bits = layout.bits_per_sample
+
+    if layout.audio_format == WAVE_FORMAT_PCM and bits == 8:
+        samples = (np.frombuffer(raw, np.uint8).astype(np.float32) - 128) / 128
+    elif layout.audio_format == WAVE_FORMAT_PCM and bits == 16:
+        samples = np.frombuffer(raw, "<i2").astype(np.float32) / 2 ** 15
+    elif layout.audio_format == WAVE_FORMAT_PCM and bits == 24:
+        triplets = np.frombuffer(raw, np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = (
+            (triplets[:, 0] | (triplets[:, 1] << 8) | (triplets[:, 2] << 16)) << 8 >> 8
+        )
+        samples = samples.astype(np.float32) / 2 ** 23
+    elif layout.audio_format == WAVE_FORMAT_PCM and bits == 32:
+        samples = np.frombuffer(raw, "<i4").astype(np.float32) / 2 ** 31
+    elif layout.audio_format == WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+        samples = np.frombuffer(raw, f"<f{bits // 8}").astype(np.float32)
+    else:
+        raise ValueError(
+            f"Unsupported WAV sample format {layout.audio_format} with {bits} bits"
+        )
+
+    return samples.reshape(-1, layout.channels)
+
+
+def compute_wav_peaks(audio_file, file_size, samples_per_peak):
+    """Compute min/max peaks of a WAV file, all channels mixed into one
+
+    Returns the sample rate and an int16 array of shape (peaks, 2). The file is
+    read in slices, so memory use does not grow with its length.
+    """
+    layout = read_wav_layout(audio_file, file_size)
+
+    if not layout.channels or not layout.block_align:
+        raise ValueError("WAV header has no channels")
+
+    audio_file.seek(layout.data_offset)
+    remaining = layout.data_size - layout.data_size % layout.block_align
+    read_size = samples_per_peak * PEAKS_BUCKETS_PER_READ * layout.block_align
+
+    peaks = []
+    while remaining > 0:
+        raw = audio_file.read(min(read_size, remaining))
+        if not raw:
+            break
+        remaining -= len(raw)
+
+        raw = raw[: len(raw) - len(raw) % layout.block_align]
+        samples = decode_wav_samples(raw, layout)
+
+        bucket_starts = np.arange(0, len(samples), samples_per_peak)
+        chunk_peaks = np.empty((len(bucket_starts), 2), np.float32)
+        chunk_peaks[:, 0] = np.minimum.reduceat(samples.min(axis=1), bucket_starts)
+        chunk_peaks[:, 1] = np.maximum.reduceat(samples.max(axis=1), bucket_starts)
+        peaks.append(chunk_peaks)
+
+    if peaks:
+        peaks = np.concatenate(peaks)
+    else:
+        peaks = np.zeros((0, 2), np.float32)
+
+    return (
+        layout.sample_rate,
+        np.round(np.clip(peaks, -1, 1) * 32767).astype(PEAKS_DTYPE),
+    )
+
+
+def build_pyramid(peaks):
+    """Successively halve peaks by merging neighbouring pairs until one is left"""
+    levels = [peaks]
+
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        if len(level) % 2:
+            level = np.concatenate([level, level[-1:]])
+
+        pairs = level.reshape(-1, 2, 2)
+        levels.append(
+            np.stack([pairs[:, :, 0].min(axis=1), pairs[:, :, 1].max(axis=1)], axis=1)
+        )
+
+    return levels
+
+
+class PeakPyramid:
+    """Peak levels of one audio file memory mapped from its sidecar
+
+    Level `n` holds one peak per `samples_per_peak * 2 ** n` samples. Levels are
+    views into the mapping, so reading a slice of a level only touches the pages
+    it covers.
+    """
+
+    def __init__(self, path):
+        self._mapping = np.memmap(path, dtype=np.uint8, mode="r")
+
+        magic, sample_rate, samples_per_peak, level_count = PEAKS_HEADER.unpack_from(
+            self._mapping
+        )
+        if magic != PEAKS_MAGIC:
+            raise ValueError("Peaks sidecar has an unknown format")
+
+        self.sample_rate = sample_rate
+        self.samples_per_peak = samples_per_peak
+        self.levels = []
+
+        for index in range(level_count):
+            offset, length = PEAKS_LEVEL.unpack_from(
+                self._mapping, PEAKS_HEADER.size + index * PEAKS_LEVEL.size
+            )
+            self.levels.append(
+                np.frombuffer(
+                    self._mapping, PEAKS_DTYPE, count=length * 2, offset=offset
+                ).reshape(-1, 2)
+            )
+
+    @property
+    def duration(self):
+        return len(self.levels[0]) * self.samples_per_peak / self.sample_rate
+
+    def query(self, start, end, width):
+        """Peaks between `start` and `end` seconds for drawing `width` pixels
+
+        Picks the coarsest level which still has at least one peak per pixel and
+        returns its samples per peak, the time of the first peak and a view of the
+        peaks, about `width` to `2 * width` of them. The range is clamped to the
+        audio.
+        """
+        start = min(max(start, 0), self.duration)
+        end = min(max(end, start), self.duration)
+        samples = (end - start) * self.sample_rate
+
+        level_index = 0
+        while (
+            level_index + 1 < len(self.levels)
+            and samples / (self.samples_per_peak * 2 ** (level_index + 1)) >= width
+        ):
+            level_index += 1
+
+        samples_per_peak = self.samples_per_peak * 2 ** level_index
+        level = self.levels[level_index]
+
+        first = min(int(start * self.sample_rate // samples_per_peak), len(level))
+        last = min(-int(-end * self.sample_rate // samples_per_peak), len(level))
+
+        return (
+            samples_per_peak,
+            first * samples_per_peak / self.sample_rate,
+            level[first : max(first, last)],
+        )
+
+
+def generate_peaks(filename):
+    """Compute the peak pyramid sidecar of a stored audio file unless it already
+    exists
+
+    Only WAV is supported, other formats are decoded by the browser as before.
+    Returns whether a sidecar is available.
+    """
+    storage = get_storage()
+    sidecar_key = peaks_key(filename)
+
+    if storage.exists(sidecar_key):
+        with storage.open(sidecar_key) as peaks_file:
+            if peaks_file.read(len(PEAKS_MAGIC)) == PEAKS_MAGIC:
+                return True
+
+    with storage.open(filename) as audio_file:
+        if audio_file.read(4) != b"RIFF":
+            return False
+
+        audio_file.seek(0)
+        try:
+            sample_rate, peaks = compute_wav_peaks(
+                audio_file, storage.size(filename), app.config["PEAKS_SAMPLES_PER_PEAK"]
+            )
+        except (ValueError, struct.error) as e:
+            app.logger.warning(f"Could not compute peaks of {filename}: {e}")
+            return False
+
+    levels = build_pyramid(peaks)
+
+    fd, temp_path = create_temp_file(".peaks-")
+    try:
+        with os.fdopen(fd, "wb") as peaks_file:
+            peaks_file.write(
+                PEAKS_HEADER.pack(
+                    PEAKS_MAGIC,
+                    sample_rate,
+                    app.config["PEAKS_SAMPLES_PER_PEAK"],
+                    len(levels),
+                )
+            )
+
+            offset = PEAKS_HEADER.size + len(levels) * PEAKS_LEVEL.size
+            for level in levels:
+                peaks_file.write(PEAKS_LEVEL.pack(offset, len(level)))
+                offset += level.nbytes
+
+            for level in levels:
+                peaks_file.write(level.tobytes())
+
+        storage.put(sidecar_key, temp_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return True
+
+
+def local_peaks_path(filename):
+    """Local path of the peaks sidecar of an audio file for memory mapping it
+
+    Sidecars in remote storage are downloaded once into `STORAGE_CACHE_FOLDER`,
+    they never change. `None` if there is no sidecar.
+    """
+    storage = get_storage()
+    sidecar_key = peaks_key(filename)
+
+    path = storage.local_path(sidecar_key)
+    if path is not None:
+        return path if path.exists() else None
+
+    path = Path(app.config["STORAGE_CACHE_FOLDER"]).joinpath(sidecar_key)
+    if path.exists():
+        return path
+
+    if not storage.exists(sidecar_key):
+        return None
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=path.parent.as_posix(), prefix=".peaks-")
+    try:
+        with os.fdopen(fd, "wb") as cache_file, storage.open(sidecar_key) as peaks_file:
+            shutil.copyfileobj(peaks_file, cache_file)
+        os.replace(temp_path, path.as_posix())
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return path
+
+
+def load_peaks(filename):
+    """Map the peak pyramid of an audio file, `None` if there is none"""
+    path = local_peaks_path(filename)
+    if path is None:
+        return None
+
+    try:
+        return PeakPyramid(path.as_posix())
+    except (ValueError, struct.error):
+        return None
@@ -0,0 +1,377 @@
+import random
+import uuid
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+from backend import db
+from backend.facets import matching_data, matching_segmentations
+from backend.models import (
+    Data,
+    DataCount,
+    IngestJob,
+    Label,
+    LabelType,
+    LabelValue,
+    Project,
+    Role,
+    Segmentation,
+    User,
+    annotation_table,
+    user_project_table,
+)
+
+Sample = namedtuple(
+    "Sample", ["project_id", "user_id", "data_ids", "segmentation_ids", "value_ids"]
+)
+
+HOT_QUERIES = dict()
+
+
+def hot_query(name):
+    """Register a function building a query the application runs on every
+    request of a frequent route, from ids of a `Sample`
+    """
+
+    def register(build):
+        HOT_QUERIES[name] = build
+        return build
+
+    return register
+
+
+@hot_query("data listing")
+def data_listing(sample):
+    return (
+        Data.query.filter(
+            Data.assigned_user_id == sample.user_id,
+            Data.project_id == sample.project_id,
+            Data.status == "pending",
+        )
+        .order_by(Data.last_modified.desc(), Data.id.desc())
+        .limit(11)
+    )
+
+
+@hot_query("data listing after cursor")
+def data_listing_after_cursor(sample):
+    last_modified = datetime.utcnow()
+
+    return (
+        Data.query.filter(
+            Data.assigned_user_id == sample.user_id,
+            Data.project_id == sample.project_id,
+            sa.or_(
+                Data.last_modified < last_modified,
+                sa.and_(Data.last_modified == last_modified, Data.id < 1),
+            ),
+        )
+        .order_by(Data.last_modified.desc(), Data.id.desc())
+        .limit(11)
+    )
+
+
+@hot_query("annotation export batch")
+def annotation_export_batch(sample):
+    return (
+        Data.query.filter(Data.project_id == sample.project_id, Data.id > 0)
+        .order_by(Data.id)
+        .limit(100)
+    )
+
+
+@hot_query("segmentations of data")
+def segmentations_of_data(sample):
+    return Segmentation.query.filter(Segmentation.data_id.in_(sample.data_ids))
+
+
+@hot_query("annotations of segmentations")
+def annotations_of_segmentations(sample):
+    return db.session.query(
+        annotation_table.c.segmentation_id, annotation_table.c.label_value_id
+    ).filter(annotation_table.c.segmentation_id.in_(sample.segmentation_ids))
+
+
+@hot_query("project membership")
+def project_membership(sample):
+    return db.session.query(
+        db.session.query(user_project_table.c.id)
+        .filter(
+            user_project_table.c.user_id == sample.user_id,
+            user_project_table.c.project_id == sample.project_id,
+        )
+        .exists()
+    )
+
+
+@hot_query("projects of user")
+def projects_of_user(sample):
+    return Project.query.join(user_project_table).filter(
+        user_project_table.c.user_id == sample.user_id
+    )
+
+
+@hot_query("users of project")
+def users_of_project(sample):
+    return db.session.query(user_project_table.c.user_id).filter(
+        user_project_table.c.project_id == sample.project_id
+    )
+
+
+@hot_query("labels of project")
+def labels_of_project(sample):
+    return (
+        db.session.query(Label.id, Label.name, LabelType.type)
+        .join(LabelType, Label.type_id == LabelType.id)
+        .filter(Label.project_id == sample.project_id)
+    )
+
+
+@hot_query("label values of project")
+def label_values_of_project(sample):
+    return (
+        db.session.query(LabelValue.id, LabelValue.label_id, LabelValue.value)
+        .join(Label, LabelValue.label_id == Label.id)
+        .filter(Label.project_id == sample.project_id)
+    )
+
+
+@hot_query("data counts")
+def data_counts(sample):
+    return DataCount.query.filter_by(
+        user_id=sample.user_id, project_id=sample.project_id
+    )
+
+
+@hot_query("ingest jobs to claim")
+def ingest_jobs_to_claim(sample):
+    return (
+        db.session.query(IngestJob.id)
+        .filter(IngestJob.status == "pending", IngestJob.run_after <= datetime.utcnow())
+        .order_by(IngestJob.run_after)
+        .limit(10)
+    )
+
+
+@hot_query("segmentations by label values")
+def segmentations_by_label_values(sample):
+    return matching_segmentations(sample.project_id, [sample.value_ids])
+
+
+@hot_query("data by label values")
+def data_by_label_values(sample):
+    return matching_data(sample.project_id, [sample.value_ids])
+
+
+def statement_of(query):
+    return getattr(query, "statement", query)
+
+
+def explain(statement):
+    """Rows of the plan the database chooses for `statement`"""
+    connection = db.session.connection()
+    compiled = statement_of(statement).compile(dialect=connection.dialect)
+    parameters = tuple(compiled.params[name] for name in compiled.positiontup)
+
+    if connection.dialect.name == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN "
+    else:
+        prefix = "EXPLAIN "
+
+    return connection.execute(prefix + str(compiled), parameters).fetchall()
+
+
+def full_scans(plan, dialect_name):
+    """Tables read in full according to an `explain` plan"""
+    if dialect_name == "sqlite":
+        # Details read like `SEARCH data USING INDEX ...` for lookups, `SCAN data`
+        # and `SCAN data USING [COVERING] INDEX ...` read every row of the table
+        # or of the index
+        return [
+            row[-1].split()[1]
+            for row in plan
+            if row[-1].startswith("SCAN ")
+            and "VIRTUAL TABLE" not in row[-1]
+            and not row[-1].startswith("SCAN CONSTANT ROW")
+        ]
+
+    return [
+        row["table"]
+        for row in plan
+        if row["type"] == "ALL" and not row["table"].startswith("<")
+    ]
+
+
+def load_sample():
+    """Ids of the busiest annotator of a project, some of their data points and
+    segmentations and label values of the project to build the queries with
+    """
+    busiest = (
+        db.session.query(Data.project_id, Data.assigned_user_id)
+        .group_by(Data.project_id, Data.assigned_user_id)
+        .order_by(sa.func.count().desc())
+        .first()
+    )
+    project_id, user_id = busiest or (0, 0)
+    data_ids = [
+        data_id
+        for (data_id,) in db.session.query(Data.id)
+        .filter_by(project_id=project_id, assigned_user_id=user_id)
+        .limit(10)
+    ]
+    segmentation_ids = [
+        segmentation_id
+        for (segmentation_id,) in db.session.query(Segmentation.id)
+        .filter(Segmentation.data_id.in_(data_ids or [0]))
+        .limit(10)
+    ]
+    value_ids = [
+        value_id
+        for (value_id,) in db.session.query(LabelValue.id)
+        .join(Label, LabelValue.label_id == Label.id)
+        .filter(Label.project_id == project_id)
+        .limit(2)
+    ]
+
+    return Sample(
+        project_id=project_id,
+        user_id=user_id,
+        data_ids=data_ids or [0],
+        segmentation_ids=segmentation_ids or [0],
+        value_ids=value_ids or [0],
+    )
+
+
+def check_query_plans():
+    """Explain every hot query, returns `(name, plan, tables read in full)`"""
+    dialect_name = db.session.connection().dialect.name
+    sample = load_sample()
+    results = []
+
+    for name, build in HOT_QUERIES.items():
+        plan = explain(build(sample))
+        results.append((name, plan, full_scans(plan, dialect_name)))
+
+    return results
+
+
+def seed_database(data_points, projects=5, users=10, segmentations=3):
+    """Fill the database with generated projects, data points, segmentations and
+    annotations, so that the planner sees tables of realistic size
+
+    Only meant for a database of its own, nothing is ever removed again.
+    """
+    role_id = db.session.query(Role.id).filter_by(role="user").scalar()
+    label_type_id = db.session.query(LabelType.id).filter_by(type="select").scalar()
+    run = uuid.uuid4().hex[:8]
+    now = datetime.utcnow()
+
+    user_ids = []
+    for index in range(users):
+        user = User(username=f"seed-{run}-{index}", role_id=role_id)
+        user.set_password(uuid.uuid4().hex)
+        db.session.add(user)
+        db.session.flush()
+        user_ids.append(user.id)
+
+    project_ids = []
+    value_ids = dict()
+    for index in range(projects):
+        project = Project(
+            name=f"seed-{run}-{index}",
+            api_key=uuid.uuid4().hex,
+            creator_user_id=user_ids[0],
+        )
+        db.session.add(project)
+        db.session.flush()
+        project_ids.append(project.id)
+
+        label = Label(name="label", project_id=project.id, type_id=label_type_id)
+        db.session.add(label)
+        db.session.flush()
+
+        values = [LabelValue(value=f"value-{i}", label_id=label.id) for i in range(5)]
+        db.session.add_all(values)
+        db.session.flush()
+        value_ids[project.id] = [value.id for value in values]
+
+    db.session.execute(
+        user_project_table.insert(),
+        [
+            {"user_id": user_id, "project_id": project_id}
+            for project_id in project_ids
+            for user_id in user_ids
+        ],
+    )
+
+    batch_size = 1000
+    for start in range(0, data_points, batch_size):
+        assignments = [
+            (random.choice(project_ids), random.choice(user_ids))
+            for _ in range(min(batch_size, data_points - start))
+        ]
+        db.session.execute(
+            Data.__table__.insert(),
+            [
+                {
+                    "project_id": project_id,
+                    "assigned_user_id": user_id,
+                    "filename": f"{uuid.uuid4().hex}.wav",
+                    "original_filename": "seed.wav",
+                    "is_marked_for_review": False,
+                    "processing_status": "ready",
+                    "segmentation_count": segmentations,
+                    "status": "completed",
+                    "last_modified": now - timedelta(seconds=random.randrange(10 ** 6)),
+                }
+                for project_id, user_id in assignments
+            ],
+        )
+        new_data = (
+            db.session.query(Data.id, Data.project_id)
+            .order_by(Data.id.desc())
+            .limit(len(assignments))
+            .all()
+        )
+
+        db.session.execute(
+            Segmentation.__table__.insert(),
+            [
+                {
+                    "data_id": data_id,
+                    "start_time": index,
+                    "end_time": index + 1,
+                    "transcription": "seed",
+                }
+                for data_id, _ in new_data
+                for index in range(segmentations)
+            ],
+        )
+        new_segmentations = (
+            db.session.query(Segmentation.id, Data.project_id)
+            .join(Data, Data.id == Segmentation.data_id)
+            .filter(Segmentation.data_id >= min(data_id for data_id, _ in new_data))
+            .all()
+        )
+        db.session.execute(
+            annotation_table.insert(),
+            [
+                {
+                    "segmentation_id": segmentation_id,
+                    "label_value_id": random.choice(value_ids[project_id]),
+                }
+                for segmentation_id, project_id in new_segmentations
+            ],
+        )
+
+    db.session.commit()
+
+    connection = db.session.connection()
+    if connection.dialect.name == "sqlite":
+        connection.execute("ANALYZE")
+    else:
+        for table in ["data", "segmentation", "annotation", "user_project", "label"]:
+            connection.execute(f"ANALYZE TABLE {table}")
+    db.session.commit()
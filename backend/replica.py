@@ -0,0 +1,75 @@
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, has_request_context, request
+from flask_jwt_extended import get_jwt_identity
+
+from backend import app, db, redis_client
+from backend.session import REPLICA_BIND
+
+
+def has_replica():
+    return REPLICA_BIND in (app.config["SQLALCHEMY_BINDS"] or {})
+
+
+def recent_writer_key(username):
+    return f"audino:wrote:{username}"
+
+
+def replica_reads(view):
+    """Read from the replica in an idempotent GET view, unless the user changed
+    something within the last `REPLICA_STICKINESS` seconds, which the replica
+    may not have applied yet
+
+    Must be applied below `jwt_required`.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if has_replica() and request.method == "GET":
+            identity = get_jwt_identity()
+            g.replica_reads = not (
+                identity
+                and redis_client.exists(recent_writer_key(identity["username"]))
+            )
+
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary within the block, for lookups whose result is
+    cached beyond the current request
+    """
+    if not has_request_context():
+        yield
+        return
+
+    previous = g.get("primary_reads", False)
+    g.primary_reads = True
+
+    try:
+        yield
+    finally:
+        g.primary_reads = previous
+
+
+@app.after_request
+def remember_writes(response):
+    """Keep users on the primary for a few seconds after a request of theirs
+    changed something
+    """
+    if not has_replica() or not db.session.registry.has():
+        return response
+
+    identity = get_jwt_identity()
+    if identity and db.session().wrote:
+        redis_client.set(
+            recent_writer_key(identity["username"]),
+            1,
+            ex=app.config["REPLICA_STICKINESS"],
+        )
+
+    return response
@@ -10,3 +10,4 @@ from .labels import *
 from .current_user import *
 from .data import *
 from .audios import *
+from .uploads import *
@@ -2,16 +2,20 @@ import os
 
 from flask import send_from_directory, jsonify
 from flask_login import login_required, current_user
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
 
 from backend import app
 
 from backend.models import Data
+from backend.storage import send_audio
 
 
 @app.route("/audios/<path:file_name>")
 def send_audio_file(file_name):
     try:
-        return send_from_directory(app.config["UPLOAD_FOLDER"], file_name)
+        return send_audio(file_name)
+    except RequestedRangeNotSatisfiable:
+        raise
     except Exception as e:
         app.logger.error(e)
         return jsonify(message="Error loading the audio"), 404
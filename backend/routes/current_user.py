@@ -1,23 +1,31 @@
+import base64
+import json
 import sqlalchemy as sa
 import uuid
 
+from datetime import datetime
+
 from flask import jsonify, flash, redirect, url_for, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
+from sqlalchemy.orm import undefer
 from werkzeug.urls import url_parse
 
 from backend import app, db
-from backend.models import Project, User, Data, Segmentation
+from backend.counters import get_data_counts
+from backend.fields import parse_fields, wants
+from backend.identity import get_request_user, is_project_member
+from backend.models import Project, User, Data, user_project_table
+from backend.replica import replica_reads
 
 from . import api
 
 
 @api.route("/current_user/projects", methods=["GET"])
 @jwt_required
+@replica_reads
 def fetch_current_user_projects():
-    identity = get_jwt_identity()
-
     try:
-        request_user = User.query.filter_by(username=identity["username"]).first()
+        request_user = get_request_user()
         response = list(
             [
                 {
@@ -26,7 +34,9 @@ def fetch_current_user_projects():
                     "created_by": project.creator_user.username,
                     "created_on": project.created_at.strftime("%B %d, %Y"),
                 }
-                for project in request_user.projects
+                for project in Project.query.join(user_project_table).filter(
+                    user_project_table.c.user_id == request_user.id
+                )
             ]
         )
     except Exception as e:
@@ -38,85 +48,185 @@ def fetch_current_user_projects():
     return jsonify(projects=response), 200
 
 
+DATA_LIST_FIELDS = {
+    "data_id": lambda data_point: data_point.id,
+    "filename": lambda data_point: data_point.filename,
+    "original_filename": lambda data_point: data_point.original_filename,
+    "created_on": lambda data_point: data_point.created_at.strftime("%B %d, %Y"),
+    "reference_transcription": lambda data_point: data_point.reference_transcription,
+    "is_marked_for_review": lambda data_point: data_point.is_marked_for_review,
+    "duration": lambda data_point: data_point.duration,
+    "number_of_segmentations": lambda data_point: data_point.segmentation_count,
+}
+
+
+def encode_cursor(data_point, direction):
+    """Opaque cursor pointing at `data_point` of a listing ordered by
+    `(last_modified, id)`, to continue after it (`next`) or before it (`prev`)
+    """
+    position = [direction, data_point.last_modified.isoformat(), data_point.id]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Direction, `last_modified` and id of a cursor, raises `TypeError` or
+    `ValueError` for anything else
+    """
+    direction, last_modified, data_id = json.loads(
+        base64.urlsafe_b64decode(cursor.encode())
+    )
+
+    if direction not in ("next", "prev"):
+        raise ValueError(direction)
+
+    return direction, datetime.fromisoformat(last_modified), int(data_id)
+
+
 @api.route("/current_user/projects/<int:project_id>/data", methods=["GET"])
 @jwt_required
+@replica_reads
 def fetch_data_for_project(project_id):
-    identity = get_jwt_identity()
-
-    page = request.args.get("page", 1, type=int)
+    """List data points assigned to the current user in a project
+
+    Pages are selected by the `cursor` returned as `next_cursor` or
+    `prev_cursor` of the previous response, so every page costs the same and
+    items changed meanwhile are neither skipped nor repeated. Clients sending
+    `page` get offset based pages with `next_page` and `prev_page` instead.
+
+    `fields` limits the serialized fields of each data point, large ones are only
+    loaded from the database when requested.
+    """
+    page = request.args.get("page", None, type=int)
+    cursor = request.args.get("cursor", None, type=str)
     active = request.args.get("active", "pending", type=str)
-
+    limit = request.args.get("limit", app.config["DATA_PAGE_SIZE"], type=int)
     try:
-        request_user = User.query.filter_by(username=identity["username"]).first()
-        project = Project.query.get(project_id)
-
-        if request_user not in project.users:
-            return jsonify(message="Unauthorized access!"), 401
-
-        segmentations = db.session.query(Segmentation.data_id).distinct().subquery()
-
-        data = {}
-
-        data["pending"] = (
-            db.session.query(Data)
-            .filter(Data.assigned_user_id == request_user.id)
-            .filter(Data.project_id == project_id)
-            .filter(Data.id.notin_(segmentations))
-            .distinct()
-            .order_by(Data.last_modified.desc())
+        fields = parse_fields(DATA_LIST_FIELDS)
+    except ValueError as e:
+        return jsonify(message=str(e)), 400
+
+    if not 0 < limit <= app.config["DATA_PAGE_MAX_SIZE"]:
+        return (
+            jsonify(
+                message=f"Param `limit` should be between 1 and {app.config['DATA_PAGE_MAX_SIZE']}"
+            ),
+            400,
         )
 
-        data["completed"] = (
-            db.session.query(Data)
-            .filter(Data.assigned_user_id == request_user.id)
-            .filter(Data.project_id == project_id)
-            .filter(Data.id.in_(segmentations))
-            .distinct()
-            .order_by(Data.last_modified.desc())
+    try:
+        direction, last_modified, data_id = (
+            decode_cursor(cursor) if cursor else ("next", None, None)
         )
+    except (TypeError, ValueError):
+        return jsonify(message="Param `cursor` is invalid"), 400
 
-        data["marked_review"] = Data.query.filter_by(
-            assigned_user_id=request_user.id,
-            project_id=project_id,
-            is_marked_for_review=True,
-        ).order_by(Data.last_modified.desc())
+    try:
+        request_user = get_request_user()
+        if not is_project_member(request_user.id, project_id):
+            return jsonify(message="Unauthorized access!"), 401
 
-        data["all"] = Data.query.filter_by(
-            assigned_user_id=request_user.id, project_id=project_id
-        ).order_by(Data.last_modified.desc())
+        filters = {
+            "pending": [Data.status == "pending"],
+            "completed": [Data.status == "completed"],
+            "marked_review": [Data.is_marked_for_review.is_(True)],
+            "all": [],
+        }
+
+        query = Data.query.filter(
+            Data.assigned_user_id == request_user.id,
+            Data.project_id == project_id,
+            *filters[active],
+        )
 
-        paginated_data = data[active].paginate(page, 10, False)
+        if wants(fields, "reference_transcription"):
+            query = query.options(undefer(Data.reference_transcription))
+
+        if page is not None:
+            page = max(page, 1)
+            items = (
+                query.order_by(Data.last_modified.desc(), Data.id.desc())
+                .limit(limit + 1)
+                .offset((page - 1) * limit)
+                .all()
+            )
+            has_more = len(items) > limit
+            items = items[:limit]
+            has_next, has_prev = has_more, page > 1
+        elif direction == "next":
+            if last_modified is not None:
+                query = query.filter(
+                    sa.or_(
+                        Data.last_modified < last_modified,
+                        sa.and_(Data.last_modified == last_modified, Data.id < data_id),
+                    )
+                )
+
+            items = (
+                query.order_by(Data.last_modified.desc(), Data.id.desc())
+                .limit(limit + 1)
+                .all()
+            )
+            has_more = len(items) > limit
+            items = items[:limit]
+            has_next, has_prev = has_more, last_modified is not None
+        else:
+            # Walk backwards from the cursor and restore the listing order
+            query = query.filter(
+                sa.or_(
+                    Data.last_modified > last_modified,
+                    sa.and_(Data.last_modified == last_modified, Data.id > data_id),
+                )
+            )
+            items = (
+                query.order_by(Data.last_modified.asc(), Data.id.asc())
+                .limit(limit + 1)
+                .all()
+            )
+            has_more = len(items) > limit
+            items = items[:limit][::-1]
+            has_next, has_prev = True, has_more
 
-        next_page = paginated_data.next_num if paginated_data.has_next else None
-        prev_page = paginated_data.prev_num if paginated_data.has_prev else None
         response = list(
             [
                 {
-                    "data_id": data_point.id,
-                    "filename": data_point.filename,
-                    "original_filename": data_point.original_filename,
-                    "created_on": data_point.created_at.strftime("%B %d, %Y"),
-                    "reference_transcription": data_point.reference_transcription,
-                    "is_marked_for_review": data_point.is_marked_for_review,
-                    "number_of_segmentations": len(data_point.segmentations),
+                    field: serialize(data_point)
+                    for field, serialize in DATA_LIST_FIELDS.items()
+                    if wants(fields, field)
                 }
-                for data_point in paginated_data.items
+                for data_point in items
             ]
         )
-        count_data = {key: value.count() for key, value in data.items()}
+        count_data = get_data_counts(request_user.id, project_id)
     except Exception as e:
         message = "Error fetching all data points"
         app.logger.error(message)
         app.logger.error(e)
         return jsonify(message=message), 500
 
+    next_cursor = encode_cursor(items[-1], "next") if items and has_next else None
+    prev_cursor = encode_cursor(items[0], "prev") if items and has_prev else None
+
+    if page is None:
+        return (
+            jsonify(
+                data=response,
+                count=count_data,
+                next_cursor=next_cursor,
+                prev_cursor=prev_cursor,
+                limit=limit,
+                active=active,
+            ),
+            200,
+        )
+
     return (
         jsonify(
             data=response,
             count=count_data,
-            next_page=next_page,
-            prev_page=prev_page,
+            next_page=page + 1 if has_next else None,
+            prev_page=page - 1 if has_prev else None,
             page=page,
+            next_cursor=next_cursor,
             active=active,
         ),
         200,
@@ -8,20 +8,36 @@ from flask import jsonify, flash, redirect, url_for, request, send_from_director
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.urls import url_parse
 from werkzeug.utils import secure_filename
-from werkzeug.exceptions import BadRequest, NotFound, InternalServerError
+from werkzeug.exceptions import BadRequest, HTTPException, NotFound, InternalServerError
 
 from backend import app, db
-from backend.models import Data, Project, User, Segmentation, Label, LabelValue
+from backend.audio import is_past_end
+from backend.catalog import get_label_catalog, set_segmentation_value_ids
+from backend.counters import count_new_data
+from backend.ingest import enqueue_ingest_jobs
+from backend.search import index_data_points, index_segmentations
+from backend.models import (
+    Data,
+    Project,
+    User,
+    Segmentation,
+    Label,
+    LabelValue,
+    annotation_table,
+)
+from backend.storage import send_audio, store_audio
 
 from . import api
 
 ALLOWED_EXTENSIONS = ["wav", "mp3", "ogg"]
 
+SEGMENT_PAST_END_MESSAGE = "Segmentation `end_time` is past the end of the audio"
+
 
 @api.route("/audio/<path:file_name>", methods=["GET"])
 @jwt_required
 def send_audio_file(file_name):
-    return send_from_directory(app.config["UPLOAD_FOLDER"], file_name)
+    return send_audio(file_name, private=True)
 
 
 def validate_segmentation(segment):
@@ -65,63 +81,114 @@ def generate_segmentation(
     db.session.add(segmentation)
     db.session.flush()
 
-    values = []
+    try:
+        value_ids = get_label_catalog(project_id).resolve_value_ids(annotations)
+    except (BadRequest, NotFound):
+        # Labels or values may have been added after this worker cached the catalog
+        value_ids = get_label_catalog(project_id, refresh=True).resolve_value_ids(
+            annotations
+        )
 
-    for label_name, val in annotations.items():
-        label = Label.query.filter_by(name=label_name, project_id=project_id).first()
+    set_segmentation_value_ids(segmentation.id, value_ids)
+    index_segmentations(
+        project_id, [(segmentation.id, data_id, segmentation.transcription)]
+    )
+    return segmentation
 
-        if label is None:
-            raise NotFound(description=f"Label not found with name: `{label_name}`")
 
-        if "values" not in val:
-            raise BadRequest(
-                description=f"Key: `values` missing in Label: `{label_name}`"
-            )
+def get_project_from_api_key():
+    """Find the project authenticated by the API key in `Authorization` header
+    """
+    api_key = request.headers.get("Authorization", None)
 
-        label_values = val["values"]
+    if not api_key:
+        raise BadRequest(description="API Key missing from `Authorization` Header")
 
-        if isinstance(label_values, list):
-            for val_id in label_values:
+    project = Project.query.filter_by(api_key=api_key).first()
 
-                value = LabelValue.query.filter_by(
-                    id=int(val_id), label_id=int(label.id)
-                ).first()
+    if not project:
+        raise NotFound(description="No project exist with given API Key")
 
-                if value is None:
-                    raise BadRequest(
-                        description=f"`{label_name}` does not have label value with id `{val_id}`"
-                    )
-                values.append(value)
+    return project
 
-        else:
-            if label_values == "-1":
-                continue
 
-            value = LabelValue.query.filter_by(
-                id=int(label_values), label_id=int(label.id)
-            ).first()
+def get_audio_extension(original_filename):
+    extension = Path(original_filename).suffix.lower()
 
-            if value is None:
-                raise BadRequest(
-                    description=f"`{label_name}` does not have label value with id `{label_values}`"
-                )
-            values.append(value)
+    if len(extension) > 1 and extension[1:] not in ALLOWED_EXTENSIONS:
+        raise BadRequest(description="File format is not supported")
 
-    segmentation.values = values
-    return segmentation
+    return extension
 
 
-@api.route("/data", methods=["POST"])
-def add_data():
-    api_key = request.headers.get("Authorization", None)
+def create_data_point(
+    project_id,
+    assigned_user_id,
+    stored_audio,
+    original_filename,
+    reference_transcription,
+    is_marked_for_review,
+    segmentations,
+):
+    """Create a data point for an audio file stored with `store_audio` along with
+    its segmentations
 
-    if not api_key:
-        raise BadRequest(description="API Key missing from `Authorization` Header")
+    Anything expensive about the audio is left to the jobs enqueued here, which
+    `flask ingest-worker` runs after the data point was committed.
+    """
+    try:
+        data = Data(
+            project_id=project_id,
+            filename=stored_audio.filename,
+            content_hash=stored_audio.content_hash,
+            original_filename=original_filename,
+            reference_transcription=reference_transcription,
+            is_marked_for_review=is_marked_for_review,
+            assigned_user_id=assigned_user_id,
+        )
+        data.set_audio_info(stored_audio.audio_info)
+        db.session.add(data)
+        db.session.flush()
 
-    project = Project.query.filter_by(api_key=api_key).first()
+        new_segmentations = []
 
-    if not project:
-        raise NotFound(description="No project exist with given API Key")
+        for segment in segmentations:
+            validated = validate_segmentation(segment)
+
+            if not validated:
+                raise BadRequest(description=f"Segmentations have missing keys.")
+
+            if is_past_end(data.duration, float(segment["end_time"])):
+                raise BadRequest(description=SEGMENT_PAST_END_MESSAGE)
+
+            new_segment = generate_segmentation(
+                data_id=data.id,
+                project_id=project_id,
+                end_time=float(segment["end_time"]),
+                start_time=float(segment["start_time"]),
+                annotations=segment.get("annotations", {}),
+                transcription=segment["transcription"],
+            )
+
+            new_segmentations.append(new_segment)
+
+        data.set_segmentations(new_segmentations)
+        count_new_data([data])
+        index_data_points([data])
+        enqueue_ingest_jobs([data.id])
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    db.session.refresh(data)
+    return data
+
+
+@api.route("/data", methods=["POST"])
+def add_data():
+    project = get_project_from_api_key()
 
     username = request.form.get("username", None)
     user = User.query.filter_by(username=username).first()
@@ -129,64 +196,269 @@ def add_data():
     if not user:
         raise NotFound(description="No user found with given username")
 
-    segmentations = request.form.get("segmentations", "[]")
+    segmentations = json.loads(request.form.get("segmentations", "[]"))
     reference_transcription = request.form.get("reference_transcription", None)
     is_marked_for_review = bool(request.form.get("is_marked_for_review", False))
     audio_file = request.files["audio_file"]
     original_filename = secure_filename(audio_file.filename)
 
-    extension = Path(original_filename).suffix.lower()
-
-    if len(extension) > 1 and extension[1:] not in ALLOWED_EXTENSIONS:
-        raise BadRequest(description="File format is not supported")
-
-    filename = f"{str(uuid.uuid4().hex)}{extension}"
-
-    file_path = Path(app.config["UPLOAD_FOLDER"]).joinpath(filename)
-    audio_file.save(file_path.as_posix())
+    extension = get_audio_extension(original_filename)
+    stored_audio = store_audio(audio_file.stream, extension)
 
-    data = Data(
+    data = create_data_point(
         project_id=project.id,
-        filename=filename,
+        assigned_user_id=user.id,
+        stored_audio=stored_audio,
         original_filename=original_filename,
         reference_transcription=reference_transcription,
         is_marked_for_review=is_marked_for_review,
-        assigned_user_id=user.id,
+        segmentations=segmentations,
+    )
+
+    return (
+        jsonify(
+            data_id=data.id,
+            message=f"Data uploaded, created and assigned successfully",
+            type="DATA_CREATED",
+        ),
+        201,
     )
-    db.session.add(data)
-    db.session.flush()
 
-    segmentations = json.loads(segmentations)
 
-    new_segmentations = []
+def prepare_bulk_item(item, users, catalog, used_files):
+    """Validate one entry of a bulk manifest and resolve everything that has to
+    be inserted for it, without touching the database
 
-    for segment in segmentations:
-        validated = validate_segmentation(segment)
+    `used_files` holds the keys of files claimed by earlier entries, each upload
+    can only be read once.
+    """
+    if not isinstance(item, dict):
+        raise BadRequest(description="Manifest entries need to be objects")
 
-        if not validated:
+    file_key = item.get("file") or ""
+    audio_file = request.files.get(file_key)
+
+    if audio_file is None:
+        raise BadRequest(description="No file uploaded for key given in `file`")
+
+    if file_key in used_files:
+        raise BadRequest(description="File given in `file` is used by another entry")
+
+    user = users.get(item.get("username"))
+
+    if user is None:
+        raise NotFound(description="No user found with given username")
+
+    original_filename = secure_filename(audio_file.filename)
+    extension = get_audio_extension(original_filename)
+
+    segmentations = []
+    for segment in item.get("segmentations", []):
+        if not isinstance(segment, dict) or not validate_segmentation(segment):
             raise BadRequest(description=f"Segmentations have missing keys.")
 
-        new_segment = generate_segmentation(
-            data_id=data.id,
-            project_id=project.id,
-            end_time=float(segment["end_time"]),
-            start_time=float(segment["start_time"]),
-            annotations=segment.get("annotations", {}),
-            transcription=segment["transcription"],
+        if not isinstance(segment.get("annotations", {}), dict):
+            raise BadRequest(
+                description="Annotations of segmentations need to be objects"
+            )
+
+        segmentations.append(
+            {
+                "start_time": float(segment["start_time"]),
+                "end_time": float(segment["end_time"]),
+                "transcription": segment["transcription"],
+                "value_ids": catalog.resolve_value_ids(segment.get("annotations", {})),
+            }
         )
 
-        new_segmentations.append(new_segment)
+    used_files.add(file_key)
+
+    return {
+        "audio_file": audio_file,
+        "extension": extension,
+        "data": {
+            "assigned_user_id": user.id,
+            "original_filename": original_filename,
+            "reference_transcription": item.get("reference_transcription", None),
+            "is_marked_for_review": bool(item.get("is_marked_for_review", False)),
+        },
+        "segmentations": segmentations,
+    }
+
+
+@api.route("/data/bulk", methods=["POST"])
+def add_data_bulk():
+    """Create many data points from one multipart request
+
+    The `manifest` form field holds a JSON list with one object per data point:
+    `file` (name of the multipart field holding its audio), `username`,
+    `reference_transcription`, `is_marked_for_review` and `segmentations`.
+    Valid entries are inserted together in a single transaction, invalid ones are
+    reported back without affecting the rest.
+    """
+    project = get_project_from_api_key()
 
-    data.set_segmentations(new_segmentations)
+    try:
+        manifest = json.loads(request.form.get("manifest", "[]"))
+    except ValueError:
+        raise BadRequest(description="Param `manifest` needs to be valid JSON")
 
-    db.session.commit()
-    db.session.refresh(data)
+    if not isinstance(manifest, list) or not manifest:
+        raise BadRequest(description="Param `manifest` should be a non empty list")
+
+    if len(manifest) > app.config["BULK_UPLOAD_MAX_ITEMS"]:
+        raise BadRequest(
+            description=f"At most {app.config['BULK_UPLOAD_MAX_ITEMS']} items can be uploaded at once"
+        )
+
+    usernames = {item.get("username") for item in manifest if isinstance(item, dict)}
+    users = {
+        user.username: user
+        for user in User.query.filter(User.username.in_(usernames - {None}))
+    }
+    catalog = get_label_catalog(project.id, refresh=True)
+
+    results = []
+    prepared = []
+    used_files = set()
+
+    for index, item in enumerate(manifest):
+        try:
+            prepared.append(
+                (index, prepare_bulk_item(item, users, catalog, used_files))
+            )
+        except HTTPException as e:
+            results.append(
+                {"index": index, "status": "failed", "message": e.description}
+            )
+        except (TypeError, ValueError):
+            results.append(
+                {
+                    "index": index,
+                    "status": "failed",
+                    "message": "Invalid manifest entry",
+                }
+            )
+
+    try:
+        data_points = []
+        accepted = []
+        for index, item in prepared:
+            stored_audio = store_audio(item["audio_file"].stream, item["extension"])
+
+            # Segments can only be checked against the duration once the audio is
+            # stored and its headers are readable
+            if any(
+                is_past_end(stored_audio.audio_info.duration, segment["end_time"])
+                for segment in item["segmentations"]
+            ):
+                results.append(
+                    {
+                        "index": index,
+                        "status": "failed",
+                        "message": SEGMENT_PAST_END_MESSAGE,
+                    }
+                )
+                continue
+
+            data = Data(
+                project_id=project.id,
+                filename=stored_audio.filename,
+                content_hash=stored_audio.content_hash,
+                **item["data"],
+            )
+            data.set_audio_info(stored_audio.audio_info)
+            data.set_segmentation_count(len(item["segmentations"]))
+            data_points.append(data)
+            accepted.append((index, item))
+
+        prepared = accepted
+
+        # Files are content addressed and may repeat, so data points go through the
+        # ORM to get their ids back, everything below them is inserted in bulk
+        db.session.add_all(data_points)
+        db.session.flush()
+        data_ids = [data.id for data in data_points]
+
+        segmentation_rows = [
+            {
+                "data_id": data_id,
+                "start_time": segment["start_time"],
+                "end_time": segment["end_time"],
+                "transcription": segment["transcription"],
+            }
+            for data_id, (_, item) in zip(data_ids, prepared)
+            for segment in item["segmentations"]
+        ]
+
+        if segmentation_rows:
+            db.session.execute(Segmentation.__table__.insert(), segmentation_rows)
+
+            # Auto increment ids grow in insertion order, so ordering by id lines the
+            # new rows up with `segmentation_rows`
+            segmentation_ids = [
+                segmentation_id
+                for (segmentation_id,) in db.session.query(Segmentation.id)
+                .filter(Segmentation.data_id.in_(data_ids))
+                .order_by(Segmentation.data_id, Segmentation.id)
+            ]
+            data_segments = [
+                (data_id, segment)
+                for data_id, (_, item) in sorted(
+                    zip(data_ids, prepared), key=lambda entry: entry[0]
+                )
+                for segment in item["segmentations"]
+            ]
+            annotation_rows = [
+                {"segmentation_id": segmentation_id, "label_value_id": value_id}
+                for segmentation_id, (_, segment) in zip(
+                    segmentation_ids, data_segments
+                )
+                for value_id in segment["value_ids"]
+            ]
+
+            if annotation_rows:
+                db.session.execute(annotation_table.insert(), annotation_rows)
+
+            index_segmentations(
+                project.id,
+                [
+                    (segmentation_id, data_id, segment["transcription"])
+                    for segmentation_id, (data_id, segment) in zip(
+                        segmentation_ids, data_segments
+                    )
+                ],
+            )
+
+        count_new_data(data_points)
+        index_data_points(data_points)
+        enqueue_ingest_jobs(data_ids)
+
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+
+        app.logger.error("Error creating data points in bulk")
+        app.logger.error(e)
+        return (
+            jsonify(
+                message="Error creating data points in bulk", type="BULK_DATA_FAILED"
+            ),
+            500,
+        )
+
+    for data_id, (index, item) in zip(data_ids, prepared):
+        results.append({"index": index, "status": "created", "data_id": data_id})
+
+    results.sort(key=lambda result: result["index"])
 
     return (
         jsonify(
-            data_id=data.id,
-            message=f"Data uploaded, created and assigned successfully",
-            type="DATA_CREATED",
+            results=results,
+            created=len(prepared),
+            failed=len(results) - len(prepared),
+            message=f"{len(prepared)} of {len(results)} data points created",
+            type="BULK_DATA_CREATED" if prepared else "BULK_DATA_FAILED",
         ),
-        201,
+        201 if prepared else 400,
     )
@@ -2,11 +2,14 @@ import sqlalchemy as sa
 import uuid
 
 from flask import jsonify, flash, redirect, url_for, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from werkzeug.urls import url_parse
 
 from backend import app, db
+from backend.catalog import invalidate_label_catalog
+from backend.identity import get_request_user
 from backend.models import User, Label, LabelValue
+from backend.replica import replica_reads
 
 from . import api
 
@@ -14,9 +17,8 @@ from . import api
 @api.route("/labels/<int:label_id>/values", methods=["POST"])
 @jwt_required
 def add_value_to_label(label_id):
-    identity = get_jwt_identity()
-    request_user = User.query.filter_by(username=identity["username"]).first()
-    is_admin = True if request_user.role.role == "admin" else False
+    request_user = get_request_user()
+    is_admin = request_user.is_admin
 
     if is_admin == False:
         return jsonify(message="Unauthorized access!"), 401
@@ -37,6 +39,8 @@ def add_value_to_label(label_id):
         db.session.add(label_value)
         db.session.commit()
         db.session.refresh(label_value)
+
+        invalidate_label_catalog(label_value.label.project_id)
     except Exception as e:
         if type(e) == sa.exc.IntegrityError:
             app.logger.info(f"Label Value: {value} already exists!")
@@ -69,10 +73,10 @@ def add_value_to_label(label_id):
 
 @api.route("/labels/<int:label_id>/values", methods=["GET"])
 @jwt_required
+@replica_reads
 def get_values_for_label(label_id):
-    identity = get_jwt_identity()
-    request_user = User.query.filter_by(username=identity["username"]).first()
-    is_admin = True if request_user.role.role == "admin" else False
+    request_user = get_request_user()
+    is_admin = request_user.is_admin
 
     if is_admin == False:
         return jsonify(message="Unauthorized access!"), 401
@@ -98,9 +102,8 @@ def get_values_for_label(label_id):
 @api.route("/labels/<int:label_id>/values/<int:label_value_id>", methods=["GET"])
 @jwt_required
 def fetch_label_value(label_id, label_value_id):
-    identity = get_jwt_identity()
-    request_user = User.query.filter_by(username=identity["username"]).first()
-    is_admin = True if request_user.role.role == "admin" else False
+    request_user = get_request_user()
+    is_admin = request_user.is_admin
 
     if is_admin == False:
         return jsonify(message="Unauthorized access!"), 401
@@ -127,9 +130,8 @@ def fetch_label_value(label_id, label_value_id):
 @api.route("/labels/<int:label_id>/values/<int:label_value_id>", methods=["PATCH"])
 @jwt_required
 def update_value_for_label(label_id, label_value_id):
-    identity = get_jwt_identity()
-    request_user = User.query.filter_by(username=identity["username"]).first()
-    is_admin = True if request_user.role.role == "admin" else False
+    request_user = get_request_user()
+    is_admin = request_user.is_admin
 
     if is_admin == False:
         return jsonify(message="Unauthorized access!"), 401
@@ -149,6 +151,8 @@ def update_value_for_label(label_id, label_value_id):
         label_value = LabelValue.query.get(label_value_id)
         label_value.set_label_value(value)
         db.session.commit()
+
+        invalidate_label_catalog(label_value.label.project_id)
     except Exception as e:
         if type(e) == sa.exc.IntegrityError:
             app.logger.info(f"Label Value: {value} already exists!")
@@ -9,15 +9,41 @@ from flask_jwt_extended import (
 from werkzeug.urls import url_parse
 
 from backend import app, jwt, redis_client
+from backend.cache import VersionedTTLCache, publish_invalidation, register_shared_cache
 from backend.models import User
 
 from . import auth
 
+_token_cache = VersionedTTLCache(
+    maxsize=app.config["TOKEN_CACHE_SIZE"], ttl=app.config["TOKEN_CACHE_TTL"]
+)
+register_shared_cache("token", _token_cache)
+_missing = object()
+
+
+def get_token_state(jti):
+    """Fetch the revocation entry of a token, going to Redis only on a miss of the
+    worker-local cache. `logout` evicts the entry on every worker.
+    """
+    entry = _token_cache.get(jti, _missing)
+
+    if entry is _missing:
+        # A logout while Redis is read must not be undone by caching the entry
+        version = _token_cache.version()
+        entry = redis_client.get(jti)
+
+        if isinstance(entry, bytes):
+            entry = entry.decode()
+
+        _token_cache.set_if_current(version, jti, entry)
+
+    return entry
+
 
 @jwt.token_in_blacklist_loader
 def revoked_token_callback(decrypted_token):
     jti = decrypted_token["jti"]
-    entry = redis_client.get(jti)
+    entry = get_token_state(jti)
 
     if entry is None:
         return True
@@ -94,7 +120,7 @@ def login():
 def is_logged_in():
     identity = get_jwt_identity()
     jti = get_raw_jwt()["jti"]
-    entry = redis_client.get(jti)
+    entry = get_token_state(jti)
 
     if entry is None:
         return jsonify(is_logged_in=False), 200
@@ -114,4 +140,5 @@ def is_logged_in():
 def logout():
     jti = get_raw_jwt()["jti"]
     redis_client.set(jti, "true", app.config["JWT_ACCESS_TOKEN_EXPIRES"] * 1.2)
+    publish_invalidation("token", jti)
     return jsonify(message="User logged out", type="LOGGED_OUT"), 200
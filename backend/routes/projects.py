@@ -1,17 +1,93 @@
+import math
+import sqlalchemy as sa
 import uuid
 
-from flask import jsonify, flash, redirect, url_for, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import (
+    Response,
+    json,
+    jsonify,
+    flash,
+    redirect,
+    url_for,
+    request,
+    stream_with_context,
+)
+from flask_jwt_extended import jwt_required
 
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload, undefer
 from werkzeug.urls import url_parse
 
 from backend import app, db
-from backend.models import Project, User, Label, Data, Segmentation, LabelValue
+from backend.audio import is_past_end, read_wav_clip
+from backend.catalog import (
+    get_label_catalog,
+    invalidate_label_catalog,
+    load_segmentation_value_ids,
+)
+from backend.counters import adjust_data_count, count_segmentations
+from backend.facets import SCOPES, parse_value_filters, query_annotations
+from backend.fields import nested_fields, parse_fields, wants
+from backend.identity import get_request_user, invalidate_memberships, is_project_member
+from backend.models import (
+    Project,
+    User,
+    Label,
+    Data,
+    Segmentation,
+    LabelValue,
+    user_project_table,
+)
+from backend.peaks import load_peaks
+from backend.replica import replica_reads
+from backend.search import remove_segmentations, search_project
+from backend.storage import get_storage
 
 from . import api
-from .data import generate_segmentation
+from .data import SEGMENT_PAST_END_MESSAGE, generate_segmentation
+
+
+PROJECT_LIST_FIELDS = {
+    "project_id": lambda project: project.id,
+    "name": lambda project: project.name,
+    "api_key": lambda project: project.api_key,
+    "created_by": lambda project: project.creator_user.username,
+    "created_on": lambda project: project.created_at.strftime("%B %d, %Y"),
+}
+
+DATA_FIELDS = [
+    "original_filename",
+    "filename",
+    "url",
+    "reference_transcription",
+    "is_marked_for_review",
+    "duration",
+    "sample_rate",
+    "channels",
+    "sample_width",
+    "file_size",
+    "processing_status",
+    "segmentation_count",
+    "status",
+    "created_at",
+    "last_modified",
+    "assigned_user",
+]
+
+SEGMENTATION_FIELDS = [
+    "start_time",
+    "end_time",
+    "transcription",
+    "created_at",
+    "last_modified",
+    "annotations",
+]
+
+ANNOTATION_EXPORT_FIELDS = (
+    DATA_FIELDS
+    + ["segmentations"]
+    + [f"segmentations.{field}" for field in SEGMENTATION_FIELDS]
+)
 
 
 def generate_api_key():
@@ -21,9 +97,8 @@ def generate_api_key():
 @api.route("/projects", methods=["POST"])
 @jwt_required
 def create_project():
-    identity = get_jwt_identity()
-    request_user = User.query.filter_by(username=identity["username"]).first()
-    is_admin = True if request_user.role.role == "admin" else False
+    request_user = get_request_user()
+    is_admin = request_user.is_admin
 
     if is_admin == False:
         return jsonify(message="Unauthorized access!"), 401
@@ -64,23 +139,31 @@ def create_project():
 
 @api.route("/projects", methods=["GET"])
 @jwt_required
+@replica_reads
 def fetch_all_projects():
-    identity = get_jwt_identity()
-    request_user = User.query.filter_by(username=identity["username"]).first()
-    is_admin = True if request_user.role.role == "admin" else False
+    request_user = get_request_user()
+    is_admin = request_user.is_admin
 
     if is_admin == False:
         return jsonify(message="Unauthorized access!"), 401
+
+    try:
+        fields = parse_fields(PROJECT_LIST_FIELDS)
+    except ValueError as e:
+        return jsonify(message=str(e)), 400
+
     try:
-        projects = Project.query.all()
+        projects = Project.query
+
+        if wants(fields, "created_by"):
+            projects = projects.options(joinedload(Project.creator_user))
+
         response = list(
             [
                 {
-                    "project_id": project.id,
-                    "name": project.name,
-                    "api_key": project.api_key,
-                    "created_by": project.creator_user.username,
-                    "created_on": project.created_at.strftime("%B %d, %Y"),
+                    field: serialize(project)
+                    for field, serialize in PROJECT_LIST_FIELDS.items()
+                    if wants(fields, field)
                 }
                 for project in projects
             ]
@@ -97,9 +180,8 @@ def fetch_all_projects():
 @api.route("/projects/<int:project_id>", methods=["GET"])
 @jwt_required
 def fetch_project(project_id):
-    identity = get_jwt_identity()
-    request_user = User.query.filter_by(username=identity["username"]).first()
-    is_admin = True if request_user.role.role == "admin" else False
+    request_user = get_request_user()
+    is_admin = request_user.is_admin
 
     if is_admin == False:
         return jsonify(message="Unauthorized access!"), 401
@@ -145,9 +227,8 @@ def fetch_project(project_id):
 @api.route("/projects/<int:project_id>/users", methods=["PATCH"])
 @jwt_required
 def update_project_users(project_id):
-    identity = get_jwt_identity()
-    request_user = User.query.filter_by(username=identity["username"]).first()
-    is_admin = True if request_user.role.role == "admin" else False
+    request_user = get_request_user()
+    is_admin = request_user.is_admin
 
     if is_admin == False:
         return jsonify(message="Unauthorized access!"), 401
@@ -167,20 +248,47 @@ def update_project_users(project_id):
         project = Project.query.get(project_id)
         # TODO: Decide whether to give creator of project access
         # project.users.append(request_user)
-        final_users = [user for user in project.users]
-        for user in project.users:
-            if user.id not in users:
-                final_users.remove(user)
+        current_user_ids = {
+            user_id
+            for (user_id,) in db.session.query(user_project_table.c.user_id).filter(
+                user_project_table.c.project_id == project.id
+            )
+        }
+        requested_user_ids = {int(user_id) for user_id in users}
 
-        for user_id in users:
-            user = User.query.get(user_id)
-            if user not in project.users:
-                final_users.append(user)
+        removed_user_ids = current_user_ids - requested_user_ids
+        added_user_ids = {
+            user_id
+            for (user_id,) in db.session.query(User.id).filter(
+                User.id.in_(requested_user_ids - current_user_ids)
+            )
+        }
 
-        project.users = final_users
+        if len(added_user_ids) != len(requested_user_ids - current_user_ids):
+            raise ValueError("Some of the given users do not exist")
+
+        if removed_user_ids:
+            db.session.execute(
+                user_project_table.delete().where(
+                    sa.and_(
+                        user_project_table.c.project_id == project.id,
+                        user_project_table.c.user_id.in_(removed_user_ids),
+                    )
+                )
+            )
+
+        if added_user_ids:
+            db.session.execute(
+                user_project_table.insert(),
+                [
+                    {"user_id": user_id, "project_id": project.id}
+                    for user_id in added_user_ids
+                ],
+            )
 
-        db.session.add(project)
         db.session.commit()
+
+        invalidate_memberships(removed_user_ids | added_user_ids, project.id)
     except Exception as e:
         app.logger.error(f"Error adding users to project: {project_id}")
         app.logger.error(e)
@@ -205,9 +313,8 @@ def update_project_users(project_id):
 @api.route("/projects/<int:project_id>/labels", methods=["POST"])
 @jwt_required
 def add_label_to_project(project_id):
-    identity = get_jwt_identity()
-    request_user = User.query.filter_by(username=identity["username"]).first()
-    is_admin = True if request_user.role.role == "admin" else False
+    request_user = get_request_user()
+    is_admin = request_user.is_admin
 
     if is_admin == False:
         return jsonify(message="Unauthorized access!"), 401
@@ -247,6 +354,8 @@ def add_label_to_project(project_id):
         db.session.add(project)
         db.session.commit()
         db.session.refresh(label)
+
+        invalidate_label_catalog(project_id)
     except Exception as e:
         if type(e) == IntegrityError:
             app.logger.info(f"Label: {label_name} already exists!")
@@ -281,9 +390,8 @@ def add_label_to_project(project_id):
 @api.route("/projects/<int:project_id>/labels/<int:label_id>", methods=["GET"])
 @jwt_required
 def get_label_for_project(project_id, label_id):
-    identity = get_jwt_identity()
-    request_user = User.query.filter_by(username=identity["username"]).first()
-    is_admin = True if request_user.role.role == "admin" else False
+    request_user = get_request_user()
+    is_admin = request_user.is_admin
 
     if is_admin == False:
         return jsonify(message="Unauthorized access!"), 401
@@ -318,9 +426,8 @@ def get_label_for_project(project_id, label_id):
 @api.route("/projects/<int:project_id>/labels/<int:label_id>", methods=["PATCH"])
 @jwt_required
 def update_label_for_project(project_id, label_id):
-    identity = get_jwt_identity()
-    request_user = User.query.filter_by(username=identity["username"]).first()
-    is_admin = True if request_user.role.role == "admin" else False
+    request_user = get_request_user()
+    is_admin = request_user.is_admin
 
     if is_admin == False:
         return jsonify(message="Unauthorized access!"), 401
@@ -352,6 +459,8 @@ def update_label_for_project(project_id, label_id):
         label = Label.query.filter_by(id=label_id, project_id=project_id).first()
         label.set_label_type(label_type_id)
         db.session.commit()
+
+        invalidate_label_catalog(project_id)
     except Exception as e:
         # TODO: Check for errors here
         app.logger.error(
@@ -380,27 +489,24 @@ def update_label_for_project(project_id, label_id):
 
 @api.route("/projects/<int:project_id>/labels", methods=["GET"])
 @jwt_required
+@replica_reads
 def get_labels_for_project(project_id):
-    identity = get_jwt_identity()
-
     try:
-        request_user = User.query.filter_by(username=identity["username"]).first()
-        project = Project.query.get(project_id)
-
-        if request_user not in project.users:
+        request_user = get_request_user()
+        if not is_project_member(request_user.id, project_id):
             return jsonify(message="Unauthorized access!"), 401
 
-        labels = project.labels
+        catalog = get_label_catalog(project_id)
 
         response = {}
-        for label in labels:
-            values = label.label_values
-            type = label.label_type.type
-
-            values = [{"value_id": value.id, "value": value.value} for value in values]
+        for label in catalog.labels.values():
+            values = [
+                {"value_id": value_id, "value": value}
+                for value_id, value in label.values.items()
+            ]
 
             response[label.name] = {
-                "type": type,
+                "type": label.type,
                 "label_id": label.id,
                 "values": values,
             }
@@ -413,19 +519,195 @@ def get_labels_for_project(project_id):
     return (jsonify(response), 200)
 
 
-@api.route("/projects/<int:project_id>/data/<int:data_id>", methods=["GET"])
+@api.route("/projects/<int:project_id>/search", methods=["GET"])
 @jwt_required
-def get_segmentations_for_data(project_id, data_id):
-    identity = get_jwt_identity()
+def search_transcriptions(project_id):
+    """Find segments and data points of a project by the words of their
+    transcription or reference transcription, most relevant first
+    """
+    query = request.args.get("q", "", type=str).strip()
+    page = max(request.args.get("page", 1, type=int), 1)
+    limit = request.args.get("limit", app.config["DATA_PAGE_SIZE"], type=int)
+
+    if not query:
+        return jsonify(message="Param `q` is missing"), 400
+
+    if not 0 < limit <= app.config["DATA_PAGE_MAX_SIZE"]:
+        return (
+            jsonify(
+                message=f"Param `limit` should be between 1 and {app.config['DATA_PAGE_MAX_SIZE']}"
+            ),
+            400,
+        )
 
     try:
-        request_user = User.query.filter_by(username=identity["username"]).first()
-        project = Project.query.get(project_id)
+        request_user = get_request_user()
+        if not is_project_member(request_user.id, project_id):
+            return jsonify(message="Unauthorized access!"), 401
+
+        matches = search_project(project_id, query, limit + 1, (page - 1) * limit)
+        has_next = len(matches) > limit
+        matches = matches[:limit]
+
+        data_ids = {data_id for data_id, _, _ in matches}
+        segmentation_ids = {segmentation_id for _, segmentation_id, _ in matches}
+
+        data_points = {
+            data.id: data
+            for data in Data.query.filter(Data.id.in_(data_ids)).options(
+                undefer(Data.reference_transcription)
+            )
+        }
+        segmentations = {
+            segmentation.id: segmentation
+            for segmentation in Segmentation.query.filter(
+                Segmentation.id.in_(segmentation_ids - {None})
+            ).options(undefer(Segmentation.transcription))
+        }
+
+        response = []
+        for data_id, segmentation_id, score in matches:
+            # The SQLite index may still list rows removed outside the application
+            if data_id not in data_points or (
+                segmentation_id is not None and segmentation_id not in segmentations
+            ):
+                continue
+
+            data = data_points[data_id]
+            result = {
+                "type": "data" if segmentation_id is None else "segmentation",
+                "data_id": data_id,
+                "segmentation_id": segmentation_id,
+                "original_filename": data.original_filename,
+                "score": score,
+            }
+
+            if segmentation_id is None:
+                result["text"] = data.reference_transcription
+            else:
+                segmentation = segmentations[segmentation_id]
+                result["text"] = segmentation.transcription
+                result["start_time"] = segmentation.start_time
+                result["end_time"] = segmentation.end_time
+
+            response.append(result)
+    except Exception as e:
+        app.logger.error("Error searching transcriptions")
+        app.logger.error(e)
+        return jsonify(message="Error searching transcriptions"), 500
 
-        if request_user not in project.users:
+    return (
+        jsonify(
+            results=response,
+            next_page=page + 1 if has_next else None,
+            prev_page=page - 1 if page > 1 else None,
+            page=page,
+            limit=limit,
+        ),
+        200,
+    )
+
+
+@api.route("/projects/<int:project_id>/annotations/query", methods=["GET"])
+@jwt_required
+@replica_reads
+def query_project_annotations(project_id):
+    """Find segmentations, or data points with `scope=data`, by their label
+    values and count the label values of all matches
+
+    Every `filter=label:value` has to match, filters on the same label match
+    any of their values.
+    """
+    scope = request.args.get("scope", "segmentation", type=str)
+    page = max(request.args.get("page", 1, type=int), 1)
+    limit = request.args.get("limit", app.config["DATA_PAGE_SIZE"], type=int)
+
+    if scope not in SCOPES:
+        return jsonify(message=f"Param `scope` should be one of {SCOPES}"), 400
+
+    if not 0 < limit <= app.config["DATA_PAGE_MAX_SIZE"]:
+        return (
+            jsonify(
+                message=f"Param `limit` should be between 1 and {app.config['DATA_PAGE_MAX_SIZE']}"
+            ),
+            400,
+        )
+
+    request_user = get_request_user()
+    if not is_project_member(request_user.id, project_id):
+        return jsonify(message="Unauthorized access!"), 401
+
+    catalog = get_label_catalog(project_id)
+    value_id_groups = parse_value_filters(catalog)
+
+    try:
+        count, matches, facet_counts = query_annotations(
+            project_id, value_id_groups, scope, limit, (page - 1) * limit
+        )
+        catalog = get_label_catalog(project_id, value_ids=facet_counts)
+
+        facets = dict()
+        for value_id, value_count in facet_counts.items():
+            label = catalog.values[value_id]
+            facet = facets.setdefault(label.name, {"label_id": label.id, "values": []})
+            facet["values"].append(
+                {"id": value_id, "value": label.values[value_id], "count": value_count}
+            )
+
+        for facet in facets.values():
+            facet["values"].sort(key=lambda value: (-value["count"], value["id"]))
+    except Exception as e:
+        message = "Error querying annotations for project"
+        app.logger.error(message)
+        app.logger.error(e)
+        return jsonify(message=message, type="QUERY_ANNOTATIONS_FAILED"), 500
+
+    return (
+        jsonify(
+            results=[
+                {"data_id": data_id, "segmentation_id": segmentation_id}
+                for data_id, segmentation_id in matches
+            ],
+            count=count,
+            facets=facets,
+            scope=scope,
+            next_page=page + 1 if page * limit < count else None,
+            prev_page=page - 1 if page > 1 else None,
+            page=page,
+            limit=limit,
+        ),
+        200,
+    )
+
+
+@api.route("/projects/<int:project_id>/data/<int:data_id>", methods=["GET"])
+@jwt_required
+def get_segmentations_for_data(project_id, data_id):
+    try:
+        request_user = get_request_user()
+        if not is_project_member(request_user.id, project_id):
             return jsonify(message="Unauthorized access!"), 401
 
-        data = Data.query.filter_by(id=data_id, project_id=project_id).first()
+        data = (
+            Data.query.filter_by(id=data_id, project_id=project_id)
+            .options(
+                undefer(Data.reference_transcription),
+                selectinload(Data.segmentations).undefer(Segmentation.transcription),
+            )
+            .first()
+        )
+
+        segment_value_ids = load_segmentation_value_ids(
+            [segment.id for segment in data.segmentations]
+        )
+        catalog = get_label_catalog(
+            project_id,
+            value_ids=[
+                value_id
+                for value_ids in segment_value_ids.values()
+                for value_id in value_ids
+            ],
+        )
 
         segmentations = []
         for segment in data.segmentations:
@@ -436,22 +718,7 @@ def get_segmentations_for_data(project_id, data_id):
                 "transcription": segment.transcription,
             }
 
-            values = dict()
-            for value in segment.values:
-                if value.label.name not in values:
-                    values[value.label.name] = {
-                        "label_id": value.label.id,
-                        "values": []
-                        if value.label.label_type.type == "multiselect"
-                        else None,
-                    }
-
-                if value.label.label_type.type == "multiselect":
-                    values[value.label.name]["values"].append(value.id)
-                else:
-                    values[value.label.name]["values"] = value.id
-
-            resp["annotations"] = values
+            resp["annotations"] = catalog.serialize(segment_value_ids[segment.id])
 
             segmentations.append(resp)
 
@@ -460,6 +727,10 @@ def get_segmentations_for_data(project_id, data_id):
             "original_filename": data.original_filename,
             "reference_transcription": data.reference_transcription,
             "is_marked_for_review": data.is_marked_for_review,
+            "duration": data.duration,
+            "sample_rate": data.sample_rate,
+            "channels": data.channels,
+            "processing_status": data.processing_status,
             "segmentations": segmentations,
         }
 
@@ -471,28 +742,95 @@ def get_segmentations_for_data(project_id, data_id):
     return (jsonify(response), 200)
 
 
+@api.route("/projects/<int:project_id>/data/<int:data_id>/peaks", methods=["GET"])
+@jwt_required
+def get_peaks_for_data(project_id, data_id):
+    """Return precomputed min/max peaks of the audio in the JSON format of
+    audiowaveform, so the waveform can be drawn before the audio is downloaded
+
+    With `width`, only the peaks between `start` and `end` seconds are returned
+    at a resolution of one to two peaks per pixel, otherwise all peaks at full
+    resolution.
+    """
+    start = request.args.get("start", 0, type=float)
+    end = request.args.get("end", None, type=float)
+    width = request.args.get("width", None, type=int)
+
+    if width is not None and width <= 0:
+        return jsonify(message="Param `width` needs to be a positive integer"), 400
+
+    if not math.isfinite(start) or (end is not None and not math.isfinite(end)):
+        return jsonify(message="Params `start` and `end` need to be finite"), 400
+
+    try:
+        request_user = get_request_user()
+        if not is_project_member(request_user.id, project_id):
+            return jsonify(message="Unauthorized access!"), 401
+
+        data = Data.query.filter_by(id=data_id, project_id=project_id).first()
+
+        peaks = load_peaks(data.filename) if data else None
+
+        if peaks is None:
+            return jsonify(message="No peaks available for datapoint"), 404
+
+        if end is None:
+            end = peaks.duration
+
+        if width is None:
+            samples_per_peak, start, values = peaks.query(
+                0, peaks.duration, len(peaks.levels[0])
+            )
+        else:
+            samples_per_peak, start, values = peaks.query(start, end, width)
+
+        response = {
+            "version": 2,
+            "channels": 1,
+            "sample_rate": peaks.sample_rate,
+            "samples_per_pixel": samples_per_peak,
+            "bits": 16,
+            "start": start,
+            "length": len(values),
+            "data": values.ravel().tolist(),
+        }
+    except Exception as e:
+        app.logger.error("Error fetching peaks for datapoint")
+        app.logger.error(e)
+        return (jsonify(message="Error fetching peaks for datapoint"), 500)
+
+    return (jsonify(response), 200)
+
+
 @api.route("/projects/<int:project_id>/data/<int:data_id>", methods=["PATCH"])
 @jwt_required
 def update_data(project_id, data_id):
-    identity = get_jwt_identity()
-
     if not request.is_json:
         return jsonify(message="Missing JSON in request"), 400
 
     is_marked_for_review = bool(request.json.get("is_marked_for_review", False))
 
     try:
-        request_user = User.query.filter_by(username=identity["username"]).first()
-        project = Project.query.get(project_id)
-
-        if request_user not in project.users:
+        request_user = get_request_user()
+        if not is_project_member(request_user.id, project_id):
             return jsonify(message="Unauthorized access!"), 401
 
-        data = Data.query.filter_by(id=data_id, project_id=project_id).first()
+        data = (
+            Data.query.filter_by(id=data_id, project_id=project_id)
+            .with_for_update()
+            .first()
+        )
 
-        if request_user != data.assigned_user:
+        if request_user.id != data.assigned_user_id:
             return jsonify(message="Unauthorized access!"), 401
 
+        if data.is_marked_for_review != is_marked_for_review:
+            adjust_data_count(
+                data.assigned_user_id,
+                project_id,
+                marked_review=1 if is_marked_for_review else -1,
+            )
+
         data.update_marked_review(is_marked_for_review)
 
         db.session.add(data)
@@ -526,8 +864,6 @@ def update_data(project_id, data_id):
 )
 @jwt_required
 def add_segmentations(project_id, data_id, segmentation_id=None):
-    identity = get_jwt_identity()
-
     if not request.is_json:
         return jsonify(message="Missing JSON in request"), 400
 
@@ -552,20 +888,32 @@ def add_segmentations(project_id, data_id, segmentation_id=None):
     end_time = round(float(end_time), 4)
 
     try:
-        request_user = User.query.filter_by(username=identity["username"]).first()
-        project = Project.query.get(project_id)
-
-        if request_user not in project.users:
+        request_user = get_request_user()
+        if not is_project_member(request_user.id, project_id):
             return jsonify(message="Unauthorized access!"), 401
 
-        data = Data.query.filter_by(id=data_id, project_id=project_id).first()
+        # Locked so concurrent requests count segmentations one after another
+        data = (
+            Data.query.filter_by(id=data_id, project_id=project_id)
+            .with_for_update()
+            .first()
+        )
 
-        if request_user != data.assigned_user:
+        if request_user.id != data.assigned_user_id:
             return jsonify(message="Unauthorized access!"), 401
 
+        if is_past_end(data.duration, end_time):
+            return (
+                jsonify(
+                    message=SEGMENT_PAST_END_MESSAGE,
+                    type="SEGMENTATION_CREATION_FAILED",
+                ),
+                400,
+            )
+
         segmentation = generate_segmentation(
             data_id=data_id,
-            project_id=project.id,
+            project_id=project_id,
             end_time=end_time,
             start_time=start_time,
             annotations=annotations,
@@ -573,6 +921,9 @@ def add_segmentations(project_id, data_id, segmentation_id=None):
             segmentation_id=segmentation_id,
         )
 
+        if segmentation_id is None:
+            count_segmentations(data, 1)
+
         db.session.add(segmentation)
         db.session.commit()
         db.session.refresh(segmentation)
@@ -608,18 +959,18 @@ def add_segmentations(project_id, data_id, segmentation_id=None):
 )
 @jwt_required
 def delete_segmentations(project_id, data_id, segmentation_id):
-    identity = get_jwt_identity()
-
     try:
-        request_user = User.query.filter_by(username=identity["username"]).first()
-        project = Project.query.get(project_id)
-
-        if request_user not in project.users:
+        request_user = get_request_user()
+        if not is_project_member(request_user.id, project_id):
             return jsonify(message="Unauthorized access!"), 401
 
-        data = Data.query.filter_by(id=data_id, project_id=project_id).first()
+        data = (
+            Data.query.filter_by(id=data_id, project_id=project_id)
+            .with_for_update()
+            .first()
+        )
 
-        if request_user != data.assigned_user:
+        if request_user.id != data.assigned_user_id:
             return jsonify(message="Unauthorized access!"), 401
 
         segmentation = Segmentation.query.filter_by(
@@ -627,6 +978,8 @@ def delete_segmentations(project_id, data_id, segmentation_id):
         ).first()
 
         db.session.delete(segmentation)
+        count_segmentations(data, -1)
+        remove_segmentations([segmentation_id])
         db.session.commit()
     except Exception as e:
         app.logger.error(f"Could not delete segmentation")
@@ -649,55 +1002,194 @@ def delete_segmentations(project_id, data_id, segmentation_id):
     )
 
 
-@api.route("/projects/<int:project_id>/annotations", methods=["GET"])
+@api.route(
+    "/projects/<int:project_id>/data/<int:data_id>/segmentations/<int:segmentation_id>/audio",
+    methods=["GET"],
+)
 @jwt_required
-def get_project_annotations(project_id):
-    identity = get_jwt_identity()
+def get_segmentation_audio(project_id, data_id, segmentation_id):
+    """Stream only the audio of one segmentation as a WAV file
 
+    The clip is cut out of the stored file by byte offsets computed from its
+    header, so the response is as small as the segment. Only WAV is supported.
+    """
     try:
-        # TODO: Check if this can be optimized
-        request_user = User.query.filter_by(username=identity["username"]).first()
-        project = Project.query.options(
-            joinedload(Project.data).joinedload(Data.segmentations).joinedload(Segmentation.values)
-        ).get(project_id)
-
-        if request_user not in project.users:
+        request_user = get_request_user()
+        if not is_project_member(request_user.id, project_id):
             return jsonify(message="Unauthorized access!"), 401
 
-        annotations = []
+        segmentation = (
+            Segmentation.query.join(Data)
+            .filter(Data.project_id == project_id)
+            .filter(Segmentation.data_id == data_id)
+            .filter(Segmentation.id == segmentation_id)
+            .first()
+        )
+
+        if segmentation is None:
+            return jsonify(message="No segmentation found with given id"), 404
+
+        storage = get_storage()
+        filename = segmentation.Data.filename
+
+        with storage.open(filename) as audio_file:
+            if audio_file.read(4) != b"RIFF":
+                return (
+                    jsonify(message="Clips can only be extracted from WAV files"),
+                    400,
+                )
+
+            audio_file.seek(0)
+            header, offset, length = read_wav_clip(
+                audio_file,
+                storage.size(filename),
+                segmentation.start_time,
+                segmentation.end_time,
+            )
+    except Exception as e:
+        app.logger.error("Error extracting audio of segmentation")
+        app.logger.error(e)
+        return (jsonify(message="Error extracting audio of segmentation"), 500)
+
+    def generate():
+        yield header
+        yield from storage.stream_range(
+            filename, offset, offset + length, app.config["UPLOAD_CHUNK_SIZE"]
+        )
+
+    return Response(
+        generate(),
+        mimetype="audio/wav",
+        headers={"Content-Length": str(len(header) + length)},
+    )
+
+
+def generate_data_annotations(data, catalog, segment_value_ids, fields=None):
+    """Serialize a data point along with its segmentations and their annotations,
+    or only the `fields` of them requested from `ANNOTATION_EXPORT_FIELDS`
+    """
+    data_dict = data.to_dict(fields)
+
+    if not wants(fields, "segmentations"):
+        return data_dict
+
+    segmentation_fields = nested_fields(fields, "segmentations")
+    data_dict["segmentations"] = []
+
+    for segmentation in data.segmentations:
+        segmentation_dict = segmentation.to_dict(segmentation_fields)
+
+        if wants(segmentation_fields, "annotations"):
+            segmentation_dict["annotations"] = catalog.serialize(
+                segment_value_ids[segmentation.id], detailed=True
+            )
+
+        data_dict["segmentations"].append(segmentation_dict)
+
+    return data_dict
 
-        for data in project.data:
-            data_dict = data.to_dict()
-            data_dict["segmentations"] = []
 
-            for segmentation in data.segmentations:
-                segmentation_dict = segmentation.to_dict()
+def iter_project_annotations(project_id, batch_size, fields=None):
+    """Yield every serialized data point of a project, loading `batch_size` of them
+    with their segmentations and annotations at a time
 
-                values = dict()
-                for value in segmentation.values:
-                    if value.label.name not in values:
-                        values[value.label.name] = {
-                            "id": value.label.id,
-                            "values": []
-                            if value.label.label_type.type == "multiselect"
-                            else None,
-                        }
+    Batches are walked by primary key and dropped from the session once consumed,
+    so memory stays bounded no matter how large the project is. Only what is
+    needed for the requested `fields` is loaded.
+    """
+    segmentation_fields = nested_fields(fields, "segmentations")
+    with_segmentations = wants(fields, "segmentations")
+    with_annotations = with_segmentations and wants(segmentation_fields, "annotations")
 
-                    if value.label.label_type.type == "multiselect":
-                        values[value.label.name]["values"].append(
-                            {"id": value.id, "value": value.value}
-                        )
-                    else:
-                        values[value.label.name]["values"] = {
-                            "id": value.id,
-                            "value": value.value,
-                        }
+    options = []
 
-                segmentation_dict["annotations"] = values
+    if wants(fields, "reference_transcription"):
+        options.append(undefer(Data.reference_transcription))
 
-                data_dict["segmentations"].append(segmentation_dict)
+    if wants(fields, "assigned_user"):
+        options.append(joinedload(Data.assigned_user).joinedload(User.role))
+
+    if with_segmentations:
+        if wants(segmentation_fields, "transcription"):
+            options.append(
+                selectinload(Data.segmentations).undefer(Segmentation.transcription)
+            )
+        else:
+            options.append(selectinload(Data.segmentations))
+
+    last_id = 0
+
+    while True:
+        batch = (
+            Data.query.filter(Data.project_id == project_id, Data.id > last_id)
+            .options(*options)
+            .order_by(Data.id)
+            .limit(batch_size)
+            .all()
+        )
+
+        if not batch:
+            return
+
+        segment_ids = []
+        if with_annotations:
+            segment_ids = [
+                segment.id for data in batch for segment in data.segmentations
+            ]
+
+        segment_value_ids = load_segmentation_value_ids(segment_ids)
+        catalog = get_label_catalog(
+            project_id,
+            value_ids=[
+                value_id
+                for value_ids in segment_value_ids.values()
+                for value_id in value_ids
+            ],
+        )
+
+        for data in batch:
+            yield generate_data_annotations(data, catalog, segment_value_ids, fields)
+
+        last_id = batch[-1].id
+        db.session.expunge_all()
+
+
+@api.route("/projects/<int:project_id>/annotations", methods=["GET"])
+@jwt_required
+@replica_reads
+def get_project_annotations(project_id):
+    export_format = request.args.get("format", "json", type=str)
+    batch_size = app.config["EXPORT_BATCH_SIZE"]
+    try:
+        fields = parse_fields(ANNOTATION_EXPORT_FIELDS)
+    except ValueError as e:
+        return jsonify(message=str(e)), 400
+
+    try:
+        request_user = get_request_user()
+
+        if not is_project_member(request_user.id, project_id):
+            return jsonify(message="Unauthorized access!"), 401
+
+        if export_format == "ndjson":
+
+            def generate():
+                try:
+                    annotations = iter_project_annotations(
+                        project_id, batch_size, fields
+                    )
+                    for data in annotations:
+                        yield json.dumps(data) + "\n"
+                except Exception as e:
+                    # Headers are already sent, the client sees a truncated stream
+                    app.logger.error("Error streaming annotations for project")
+                    app.logger.error(e)
+
+            return Response(
+                stream_with_context(generate()), mimetype="application/x-ndjson"
+            )
 
-            annotations.append(data_dict)
+        annotations = list(iter_project_annotations(project_id, batch_size, fields))
 
     except Exception as e:
         message = "Error fetching annotations for project"
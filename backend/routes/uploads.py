@@ -0,0 +1,263 @@
+import fcntl
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+
+from pathlib import Path
+
+from flask import jsonify, request
+from werkzeug.exceptions import BadRequest, Conflict, NotFound
+from werkzeug.utils import secure_filename
+
+from backend import app, db
+from backend.catalog import get_label_catalog
+from backend.models import User
+from backend.storage import store_audio_file
+
+from . import api
+from .data import (
+    create_data_point,
+    get_audio_extension,
+    get_project_from_api_key,
+    validate_segmentation,
+)
+
+CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+def get_upload_folder(upload_id=None):
+    upload_folder = Path(app.config["RESUMABLE_UPLOAD_FOLDER"])
+
+    if upload_id is None:
+        return upload_folder
+
+    # Upload ids are generated by us, anything else must not reach the filesystem
+    if not re.match(r"^[0-9a-f]{32}$", upload_id):
+        raise NotFound(description="No upload exists with given id")
+
+    return upload_folder.joinpath(upload_id)
+
+
+def load_upload(upload_id, project):
+    """Read the state of an upload session from disk
+    """
+    upload_folder = get_upload_folder(upload_id)
+
+    try:
+        with open(upload_folder.joinpath("meta.json")) as meta_file:
+            meta = json.load(meta_file)
+    except FileNotFoundError:
+        raise NotFound(description="No upload exists with given id")
+
+    if meta["project_id"] != project.id:
+        raise NotFound(description="No upload exists with given id")
+
+    return upload_folder, meta
+
+
+def remove_stale_uploads():
+    """Drop upload sessions which have not received data for a long time
+    """
+    max_age = app.config["RESUMABLE_UPLOAD_MAX_AGE"].total_seconds()
+
+    for upload_folder in get_upload_folder().iterdir():
+        part_path = upload_folder.joinpath("data.part")
+        last_write = (
+            part_path.stat().st_mtime
+            if part_path.exists()
+            else upload_folder.stat().st_mtime
+        )
+
+        if time.time() - last_write > max_age:
+            shutil.rmtree(upload_folder.as_posix(), ignore_errors=True)
+
+
+@api.route("/uploads", methods=["POST"])
+def create_upload():
+    """Start a resumable upload, the audio is sent afterwards with `PUT` requests
+    """
+    project = get_project_from_api_key()
+
+    if not request.is_json:
+        raise BadRequest(description="Missing JSON in request")
+
+    original_filename = secure_filename(request.json.get("filename", ""))
+    size = request.json.get("size", None)
+    username = request.json.get("username", None)
+    segmentations = request.json.get("segmentations", [])
+
+    if not original_filename:
+        raise BadRequest(description="Please provide the `filename` of the audio")
+
+    if not isinstance(size, int) or size <= 0:
+        raise BadRequest(description="Param `size` needs to be a positive integer")
+
+    if not isinstance(segmentations, list):
+        raise BadRequest(description="Param `segmentations` should be a list")
+
+    get_audio_extension(original_filename)
+
+    # Catch bad segmentations now rather than after gigabytes were uploaded
+    catalog = get_label_catalog(project.id)
+    for segment in segmentations:
+        if not isinstance(segment, dict) or not validate_segmentation(segment):
+            raise BadRequest(description=f"Segmentations have missing keys.")
+
+        catalog.resolve_value_ids(segment.get("annotations", {}))
+
+    user = User.query.filter_by(username=username).first()
+
+    if not user:
+        raise NotFound(description="No user found with given username")
+
+    get_upload_folder().mkdir(parents=True, exist_ok=True)
+    remove_stale_uploads()
+
+    upload_id = uuid.uuid4().hex
+    upload_folder = get_upload_folder(upload_id)
+    upload_folder.mkdir()
+    upload_folder.joinpath("data.part").touch()
+
+    meta = {
+        "project_id": project.id,
+        "assigned_user_id": user.id,
+        "original_filename": original_filename,
+        "size": size,
+        "reference_transcription": request.json.get("reference_transcription", None),
+        "is_marked_for_review": bool(request.json.get("is_marked_for_review", False)),
+        "segmentations": segmentations,
+    }
+    with open(upload_folder.joinpath("meta.json"), "w") as meta_file:
+        json.dump(meta, meta_file)
+
+    return (
+        jsonify(
+            upload_id=upload_id,
+            offset=0,
+            size=size,
+            message="Upload created",
+            type="UPLOAD_CREATED",
+        ),
+        201,
+    )
+
+
+@api.route("/uploads/<upload_id>", methods=["GET"])
+def fetch_upload(upload_id):
+    """Return how many bytes were received, uploads continue from that offset
+    """
+    project = get_project_from_api_key()
+    upload_folder, meta = load_upload(upload_id, project)
+
+    offset = upload_folder.joinpath("data.part").stat().st_size
+
+    return jsonify(upload_id=upload_id, offset=offset, size=meta["size"]), 200
+
+
+@api.route("/uploads/<upload_id>", methods=["PUT"])
+def add_upload_chunk(upload_id):
+    """Append a chunk given by `Content-Range: bytes <start>-<end>/<size>`
+
+    `start` has to be the current offset of the upload, otherwise the request is
+    rejected with 409 and the offset to resume from.
+    """
+    project = get_project_from_api_key()
+    upload_folder, meta = load_upload(upload_id, project)
+
+    content_range = CONTENT_RANGE_RE.match(request.headers.get("Content-Range", ""))
+
+    if not content_range:
+        raise BadRequest(
+            description="Header `Content-Range: bytes <start>-<end>/<size>` is required"
+        )
+
+    start, end, size = (int(value) for value in content_range.groups())
+
+    if size != meta["size"] or end < start or end >= size:
+        raise BadRequest(description="Header `Content-Range` does not match upload")
+
+    chunk_size = app.config["UPLOAD_CHUNK_SIZE"]
+
+    with open(upload_folder.joinpath("data.part"), "ab") as part_file:
+        # Concurrent requests for the same upload must not interleave their writes
+        fcntl.flock(part_file.fileno(), fcntl.LOCK_EX)
+
+        offset = part_file.seek(0, 2)
+
+        if start != offset:
+            return (
+                jsonify(
+                    message="Chunk does not start at the current offset",
+                    offset=offset,
+                    type="UPLOAD_OFFSET_MISMATCH",
+                ),
+                409,
+            )
+
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = request.stream.read(min(chunk_size, remaining))
+
+            if not chunk:
+                break
+
+            part_file.write(chunk)
+            remaining -= len(chunk)
+
+        part_file.flush()
+        offset = part_file.tell()
+
+    return jsonify(upload_id=upload_id, offset=offset, size=meta["size"]), 200
+
+
+@api.route("/uploads/<upload_id>/finalize", methods=["POST"])
+def finalize_upload(upload_id):
+    """Turn a completely received upload into a data point
+    """
+    project = get_project_from_api_key()
+    upload_folder, meta = load_upload(upload_id, project)
+
+    part_path = upload_folder.joinpath("data.part")
+
+    with open(part_path, "rb") as part_file:
+        # Chunks and other attempts to finalize wait until this one is done, the
+        # session stays intact until the data point is committed so that a failed
+        # attempt can be retried
+        fcntl.flock(part_file.fileno(), fcntl.LOCK_EX)
+
+        if not upload_folder.joinpath("meta.json").exists():
+            raise NotFound(description="No upload exists with given id")
+
+        offset = os.fstat(part_file.fileno()).st_size
+
+        if offset != meta["size"]:
+            raise Conflict(
+                description=f"Upload is incomplete, received {offset} of {meta['size']} bytes"
+            )
+
+        extension = get_audio_extension(meta["original_filename"])
+        stored_audio = store_audio_file(part_path.as_posix(), extension)
+
+        data = create_data_point(
+            project_id=project.id,
+            assigned_user_id=meta["assigned_user_id"],
+            stored_audio=stored_audio,
+            original_filename=meta["original_filename"],
+            reference_transcription=meta["reference_transcription"],
+            is_marked_for_review=meta["is_marked_for_review"],
+            segmentations=meta["segmentations"],
+        )
+
+        shutil.rmtree(upload_folder.as_posix(), ignore_errors=True)
+
+    return (
+        jsonify(
+            data_id=data.id,
+            message=f"Data uploaded, created and assigned successfully",
+            type="DATA_CREATED",
+        ),
+        201,
+    )
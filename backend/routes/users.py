@@ -1,11 +1,13 @@
 import sqlalchemy as sa
 
 from flask import jsonify, flash, redirect, url_for, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from werkzeug.urls import url_parse
 
 from backend import app, db
+from backend.identity import get_request_user, invalidate_users
 from backend.models import User
+from backend.replica import replica_reads
 
 from . import api
 
@@ -14,9 +16,8 @@ from . import api
 @jwt_required
 def create_user():
     # TODO: Make jwt user id based to expire user session if permissions are changed
-    identity = get_jwt_identity()
-    request_user = User.query.filter_by(username=identity["username"]).first()
-    is_admin = True if request_user.role.role == "admin" else False
+    request_user = get_request_user()
+    is_admin = request_user.is_admin
 
     if is_admin == False:
         return jsonify(message="Unauthorized access!"), 401
@@ -68,9 +69,8 @@ def create_user():
 @api.route("/users/<int:user_id>", methods=["GET"])
 @jwt_required
 def fetch_user(user_id):
-    identity = get_jwt_identity()
-    request_user = User.query.filter_by(username=identity["username"]).first()
-    is_admin = True if request_user.role.role == "admin" else False
+    request_user = get_request_user()
+    is_admin = request_user.is_admin
 
     if is_admin == False:
         return jsonify(message="Unauthorized access!"), 401
@@ -99,9 +99,8 @@ def fetch_user(user_id):
 @api.route("/users/<int:user_id>", methods=["PATCH"])
 @jwt_required
 def update_user(user_id):
-    identity = get_jwt_identity()
-    request_user = User.query.filter_by(username=identity["username"]).first()
-    is_admin = True if request_user.role.role == "admin" else False
+    request_user = get_request_user()
+    is_admin = request_user.is_admin
 
     if is_admin == False:
         return jsonify(message="Unauthorized access!"), 401
@@ -131,6 +130,8 @@ def update_user(user_id):
         user = User.query.get(user_id)
         user.set_role(role_id)
         db.session.commit()
+
+        invalidate_users([user.username])
     except Exception as e:
         app.logger.error("No user found")
         app.logger.error(e)
@@ -149,10 +150,10 @@ def update_user(user_id):
 
 @api.route("/users", methods=["GET"])
 @jwt_required
+@replica_reads
 def fetch_all_users():
-    identity = get_jwt_identity()
-    request_user = User.query.filter_by(username=identity["username"]).first()
-    is_admin = True if request_user.role.role == "admin" else False
+    request_user = get_request_user()
+    is_admin = request_user.is_admin
 
     if is_admin == False:
         return jsonify(message="Unauthorized access"), 401
@@ -0,0 +1,17 @@
+#!/usr/bin/env sh
+
+set -o errexit
+
+app="/app/backend"
+venv="${app}/venv"
+
+if [ -f "${venv}/bin/activate" ]; then
+  echo "Activating environment"
+  . "${venv}/bin/activate"
+fi
+
+echo "Connecting to database"
+python3 "${app}/scripts/wait_for_database.py"
+
+echo "Starting ingest worker"
+cd "${app}" && flask ingest-worker
@@ -0,0 +1,209 @@
+import sqlalchemy as sa
+
+from backend import db
+
+# SQLite keeps segments and reference transcriptions in one FTS5 table, their
+# rowids are derived from the ids of the rows they were indexed from
+SEARCH_INDEX_TABLE = "search_index"
+
+
+def is_primary_sqlite(ddl, target, bind, **kwargs):
+    """Whether `create_all` or `drop_all` runs against the primary SQLite database,
+    replicas receive the table from their primary
+    """
+    return bind.dialect.name == "sqlite" and bind.engine.url == db.get_engine().url
+
+
+# Databases created from the models rather than migrations, like SQLite ones for
+# development, get the table along with the others
+sa.event.listen(
+    db.metadata,
+    "after_create",
+    sa.DDL(
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_INDEX_TABLE} USING fts5(
+            content,
+            project_id UNINDEXED,
+            data_id UNINDEXED,
+            segmentation_id UNINDEXED
+        )
+        """
+    ).execute_if(callable_=is_primary_sqlite),
+)
+sa.event.listen(
+    db.metadata,
+    "before_drop",
+    sa.DDL(f"DROP TABLE IF EXISTS {SEARCH_INDEX_TABLE}").execute_if(
+        callable_=is_primary_sqlite
+    ),
+)
+
+
+def uses_fts5():
+    """Whether the index has to be maintained by the application, MySQL keeps its
+    FULLTEXT indexes up to date on its own
+    """
+    return db.session.get_bind().dialect.name == "sqlite"
+
+
+def segmentation_rowid(segmentation_id):
+    return segmentation_id * 2 + 1
+
+
+def data_rowid(data_id):
+    return data_id * 2
+
+
+def replace_index_rows(rowids, rows):
+    db.session.execute(
+        sa.text(f"DELETE FROM {SEARCH_INDEX_TABLE} WHERE rowid IN :rowids").bindparams(
+            sa.bindparam("rowids", expanding=True)
+        ),
+        {"rowids": rowids},
+    )
+
+    rows = [row for row in rows if row["content"]]
+    if rows:
+        db.session.execute(
+            sa.text(
+                f"""
+                INSERT INTO {SEARCH_INDEX_TABLE}
+                    (rowid, content, project_id, data_id, segmentation_id)
+                VALUES
+                    (:rowid, :content, :project_id, :data_id, :segmentation_id)
+                """
+            ),
+            rows,
+        )
+
+
+def index_segmentations(project_id, segmentations):
+    """Index the transcriptions of `(id, data_id, transcription)` of segmentations
+    created or changed in the current transaction
+    """
+    if not segmentations or not uses_fts5():
+        return
+
+    replace_index_rows(
+        [
+            segmentation_rowid(segmentation_id)
+            for segmentation_id, _, _ in segmentations
+        ],
+        [
+            {
+                "rowid": segmentation_rowid(segmentation_id),
+                "content": transcription,
+                "project_id": project_id,
+                "data_id": data_id,
+                "segmentation_id": segmentation_id,
+            }
+            for segmentation_id, data_id, transcription in segmentations
+        ],
+    )
+
+
+def index_data_points(data_points):
+    """Index the reference transcriptions of data points created in the current
+    transaction
+    """
+    if not data_points or not uses_fts5():
+        return
+
+    replace_index_rows(
+        [data_rowid(data.id) for data in data_points],
+        [
+            {
+                "rowid": data_rowid(data.id),
+                "content": data.reference_transcription,
+                "project_id": data.project_id,
+                "data_id": data.id,
+                "segmentation_id": None,
+            }
+            for data in data_points
+        ],
+    )
+
+
+def remove_segmentations(segmentation_ids):
+    if not segmentation_ids or not uses_fts5():
+        return
+
+    replace_index_rows(
+        [segmentation_rowid(segmentation_id) for segmentation_id in segmentation_ids],
+        [],
+    )
+
+
+def fts5_query(query):
+    """Match any of the words in `query` like MySQL's natural language mode,
+    quoted so that FTS5 operators in it are searched for literally
+    """
+    terms = ['"{}"'.format(term.replace('"', '""')) for term in query.split()]
+    return " OR ".join(terms)
+
+
+def search_project(project_id, query, limit, offset):
+    """`(data_id, segmentation_id, score)` of the segments and data points of a
+    project whose transcription matches `query`, most relevant first
+
+    `segmentation_id` is `None` for matches of a data point's reference
+    transcription.
+    """
+    if uses_fts5():
+        statement = sa.text(
+            f"""
+            SELECT data_id, segmentation_id, -bm25({SEARCH_INDEX_TABLE}) AS score
+            FROM {SEARCH_INDEX_TABLE}
+            WHERE {SEARCH_INDEX_TABLE} MATCH :query AND project_id = :project_id
+            ORDER BY score DESC, rowid
+            LIMIT :limit OFFSET :offset
+            """
+        )
+        query = fts5_query(query)
+    else:
+        # Relevance is only comparable between the results of the same index, but
+        # both rank transcriptions by the same words
+        statement = sa.text(
+            """
+            SELECT data_id, segmentation_id, score FROM (
+                SELECT
+                    segmentation.data_id AS data_id,
+                    segmentation.id AS segmentation_id,
+                    MATCH (segmentation.transcription)
+                        AGAINST (:query IN NATURAL LANGUAGE MODE) AS score
+                FROM segmentation
+                JOIN data ON data.id = segmentation.data_id
+                WHERE data.project_id = :project_id
+                    AND MATCH (segmentation.transcription)
+                        AGAINST (:query IN NATURAL LANGUAGE MODE)
+                UNION ALL
+                SELECT
+                    data.id AS data_id,
+                    NULL AS segmentation_id,
+                    MATCH (data.reference_transcription)
+                        AGAINST (:query IN NATURAL LANGUAGE MODE) AS score
+                FROM data
+                WHERE data.project_id = :project_id
+                    AND MATCH (data.reference_transcription)
+                        AGAINST (:query IN NATURAL LANGUAGE MODE)
+            ) AS matches
+            ORDER BY score DESC, data_id, segmentation_id
+            LIMIT :limit OFFSET :offset
+            """
+        )
+
+    if not query:
+        return []
+
+    return [
+        (data_id, segmentation_id, float(score))
+        for data_id, segmentation_id, score in db.session.execute(
+            statement,
+            {
+                "query": query,
+                "project_id": project_id,
+                "limit": limit,
+                "offset": offset,
+            },
+        )
+    ]
@@ -0,0 +1,42 @@
+import sqlalchemy as sa
+
+from flask import g, has_request_context
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+
+REPLICA_BIND = "replica"
+
+
+class RoutingSession(SignallingSession):
+    """Session sending plain reads of views marked with `replica_reads` to the
+    `replica` bind, and everything else to the primary database
+
+    Once the session wrote, its reads stay on the primary too, so a request always
+    sees its own changes.
+    """
+
+    def __init__(self, db, **options):
+        self.db = db
+        self.wrote = False
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or not isinstance(clause, sa.sql.Select):
+            # Only selects are known to be reads, anything else may write
+            self.wrote = self.wrote or self._flushing or clause is not None
+        elif self.reads_replica() and clause._for_update_arg is None:
+            return self.db.get_engine(self.app, bind=REPLICA_BIND)
+
+        return super().get_bind(mapper, clause)
+
+    def reads_replica(self):
+        return (
+            not self.wrote
+            and has_request_context()
+            and g.get("replica_reads", False)
+            and not g.get("primary_reads", False)
+        )
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return sa.orm.sessionmaker(class_=RoutingSession, db=self, **options)
@@ -0,0 +1,283 @@
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+
+from collections import namedtuple
+from datetime import datetime
+from pathlib import Path
+
+from flask import Response, request, send_file
+from werkzeug.exceptions import NotFound, RequestedRangeNotSatisfiable
+
+from backend import app, db
+from backend.audio import read_audio_info
+from backend.models import Data
+
+from .local import LocalStorage, shard_filename
+from .s3 import S3Storage
+
+StoredAudio = namedtuple(
+    "StoredAudio", ["filename", "content_hash", "size", "audio_info"]
+)
+
+_storage = None
+
+
+def get_storage():
+    """The storage driver configured by `STORAGE_DRIVER`, `local` or `s3`"""
+    global _storage
+
+    if _storage is None:
+        driver = app.config["STORAGE_DRIVER"]
+
+        if driver == "local":
+            _storage = LocalStorage(app.config["UPLOAD_FOLDER"])
+        elif driver == "s3":
+            _storage = S3Storage(
+                bucket=app.config["S3_BUCKET"],
+                prefix=app.config["S3_PREFIX"],
+                endpoint_url=app.config["S3_ENDPOINT_URL"],
+                region_name=app.config["S3_REGION"],
+                access_key_id=app.config["S3_ACCESS_KEY_ID"],
+                secret_access_key=app.config["S3_SECRET_ACCESS_KEY"],
+            )
+        else:
+            raise RuntimeError(f"Unknown storage driver {driver}")
+
+    return _storage
+
+
+def create_temp_file(prefix):
+    """Create a scratch file on the upload volume, which stays local to this node
+    whatever the storage driver
+    """
+    return tempfile.mkstemp(dir=app.config["UPLOAD_FOLDER"], prefix=prefix)
+
+
+def _place_audio(temp_path, content_hash, size, extension):
+    """Move a fully written temporary file to its content addressed name
+
+    Headers are parsed while the file is still local, so storage drivers never
+    have to hand it back for that.
+    """
+    storage = get_storage()
+    filename = f"{content_hash}{extension}"
+    audio_info = read_audio_info(temp_path)
+
+    # Refreshing an identical file keeps `flask prune-audio` from removing it
+    # before the data point referring to it is committed
+    if storage.touch(filename):
+        os.remove(temp_path)
+    else:
+        storage.put(filename, temp_path)
+
+    return StoredAudio(
+        filename=filename, content_hash=content_hash, size=size, audio_info=audio_info
+    )
+
+
+def store_audio(stream, extension):
+    """Copy an audio stream into storage in chunks while hashing it
+
+    Files are content addressed as `<sha256><extension>`, so uploading the same
+    recording twice only keeps one copy. A file whose data point is never created
+    stays behind until `flask prune-audio` removes it.
+    """
+    chunk_size = app.config["UPLOAD_CHUNK_SIZE"]
+
+    digest = hashlib.sha256()
+    size = 0
+
+    fd, temp_path = create_temp_file(".upload-")
+
+    try:
+        with os.fdopen(fd, "wb") as temp_file:
+            for chunk in iter(lambda: stream.read(chunk_size), b""):
+                digest.update(chunk)
+                temp_file.write(chunk)
+                size += len(chunk)
+
+        return _place_audio(temp_path, digest.hexdigest(), size, extension)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def store_audio_file(path, extension):
+    """Store an audio file already on the upload volume, which is left in place
+
+    Unlike `store_audio` the file is only read to hash it and hard linked instead
+    of copied where possible, which matters for multi gigabyte recordings
+    assembled by resumable uploads.
+    """
+    chunk_size = app.config["UPLOAD_CHUNK_SIZE"]
+
+    digest = hashlib.sha256()
+    size = 0
+
+    with open(path, "rb") as audio_file:
+        for chunk in iter(lambda: audio_file.read(chunk_size), b""):
+            digest.update(chunk)
+            size += len(chunk)
+
+    fd, temp_path = create_temp_file(".upload-")
+    os.close(fd)
+
+    try:
+        try:
+            os.unlink(temp_path)
+            os.link(path, temp_path)
+        except OSError:
+            shutil.copyfile(path, temp_path)
+
+        return _place_audio(temp_path, digest.hexdigest(), size, extension)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def find_orphaned_files(grace_period):
+    """Keys of stored files no data point refers to, modified longer than
+    `grace_period` ago
+
+    Uploads store their file before the data point is committed, and another
+    request may be storing the same content addressed file right now, so only
+    files older than any transaction still running are considered. Peaks
+    sidecars belong to the audio file they are named after.
+    """
+    # `backend.peaks` stores its sidecars through this module
+    from backend.peaks import PEAKS_EXTENSION
+
+    storage = get_storage()
+    modified_before = datetime.utcnow() - grace_period
+    batch_size = 1000
+
+    def orphans_of(keys):
+        filenames = {
+            key[: -len(PEAKS_EXTENSION)] if key.endswith(PEAKS_EXTENSION) else key
+            for key in keys
+        }
+        in_use = {
+            filename
+            for (filename,) in db.session.query(Data.filename).filter(
+                Data.filename.in_(filenames)
+            )
+        }
+        return [
+            key
+            for key in keys
+            if key not in in_use and key[: -len(PEAKS_EXTENSION)] not in in_use
+        ]
+
+    batch = []
+    for key, modified in storage.list_files():
+        if modified >= modified_before:
+            continue
+
+        batch.append(key)
+        if len(batch) == batch_size:
+            yield from orphans_of(batch)
+            batch = []
+
+    if batch:
+        yield from orphans_of(batch)
+
+
+def send_audio(filename, private=False):
+    """Respond with a stored audio file, honouring `Range` and conditional requests
+
+    Stored files are never modified, their names are either content hashes or
+    random, so they are cached as immutable. `private` keeps shared caches from
+    storing files which are only served after authentication.
+
+    With `AUDIO_ACCEL_REDIRECT_PREFIX` set, the transfer of files on local disk is
+    handed to nginx with `X-Accel-Redirect` instead of streaming the file through
+    the worker.
+    """
+    # Hidden folders hold partial uploads which must not be served, this also
+    # rules out `..` in the path
+    if Path(filename).is_absolute() or any(
+        part.startswith(".") for part in Path(filename).parts
+    ):
+        raise NotFound(description="Error loading the audio")
+
+    storage = get_storage()
+    size = storage.size(filename)
+
+    if size is None:
+        raise NotFound(description="Error loading the audio")
+
+    cache_control = "{}, max-age={}, immutable".format(
+        "private" if private else "public", app.config["AUDIO_CACHE_MAX_AGE"]
+    )
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    # The name identifies the content, unlike the default tag built from the
+    # modification time it is the same on every node
+    etag = Path(filename).stem
+
+    path = storage.local_path(filename)
+
+    if path is None:
+        return send_audio_stream(storage, filename, size, mimetype, etag, cache_control)
+
+    accel_redirect_prefix = app.config["AUDIO_ACCEL_REDIRECT_PREFIX"]
+    if accel_redirect_prefix:
+        relative_path = path.relative_to(app.config["UPLOAD_FOLDER"]).as_posix()
+        return Response(
+            headers={
+                "X-Accel-Redirect": f"{accel_redirect_prefix.rstrip('/')}/{relative_path}",
+                "Content-Type": mimetype,
+                "Cache-Control": cache_control,
+            }
+        )
+
+    response = send_file(path.as_posix(), add_etags=False, conditional=False)
+    response.headers["Cache-Control"] = cache_control
+    response.expires = None
+    response.set_etag(etag)
+
+    try:
+        return response.make_conditional(
+            request, accept_ranges=True, complete_length=size
+        )
+    except RequestedRangeNotSatisfiable:
+        response.close()
+        raise
+
+
+def send_audio_stream(storage, filename, size, mimetype, etag, cache_control):
+    """Stream a file from a remote storage driver, fetching only the requested
+    range instead of skipping through the whole file
+    """
+    response = Response(mimetype=mimetype, direct_passthrough=True)
+    response.headers["Cache-Control"] = cache_control
+    response.set_etag(etag)
+    response.accept_ranges = "bytes"
+
+    if request.if_none_match.contains(etag):
+        response.status_code = 304
+        return response
+
+    start, stop = 0, size
+
+    if request.range is not None:
+        byte_range = request.range.range_for_length(size)
+
+        if byte_range is None:
+            raise RequestedRangeNotSatisfiable(length=size)
+
+        start, stop = byte_range
+        response.status_code = 206
+        response.content_range = f"bytes {start}-{stop - 1}/{size}"
+
+    response.response = storage.stream_range(
+        filename, start, stop, app.config["UPLOAD_CHUNK_SIZE"]
+    )
+    response.content_length = stop - start
+
+    return response
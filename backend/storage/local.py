@@ -0,0 +1,123 @@
+import os
+
+from datetime import datetime
+from pathlib import Path
+
+
+def shard_filename(filename):
+    """Relative path of a file in the sharded layout, `ab/cd/abcd...` for a file
+    named `abcd...`, which keeps directories small with millions of files
+    """
+    if "/" in filename or len(filename) < 4:
+        return filename
+
+    return f"{filename[:2]}/{filename[2:4]}/{filename}"
+
+
+class LocalStorage:
+    """Stores files below a folder on the local disk in the sharded layout
+
+    Files stored before the sharded layout was introduced are found in the flat
+    layout until `flask shard-uploads` moved them.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def _paths(self, key):
+        """Paths a file may be stored at, most likely first
+
+        `flask shard-uploads` links a file to its sharded path before it removes
+        the flat one, so a file missing from both was moved in between and is
+        found at the sharded path when trying again.
+        """
+        sharded_path = self.root.joinpath(shard_filename(key))
+        flat_path = self.root.joinpath(key)
+
+        if flat_path == sharded_path:
+            return [sharded_path]
+
+        return [sharded_path, flat_path, sharded_path]
+
+    def _at_path(self, key, operation):
+        """Apply `operation` to the path of a stored file, moving on to the next
+        possible path while it raises `FileNotFoundError`
+        """
+        *paths, last_path = self._paths(key)
+
+        for path in paths:
+            try:
+                return operation(path)
+            except FileNotFoundError:
+                pass
+
+        return operation(last_path)
+
+    def local_path(self, key):
+        try:
+            return self._at_path(key, lambda path: path.stat() and path)
+        except FileNotFoundError:
+            return self.root.joinpath(shard_filename(key))
+
+    def exists(self, key):
+        return self.size(key) is not None
+
+    def size(self, key):
+        try:
+            return self._at_path(key, lambda path: path.stat().st_size)
+        except FileNotFoundError:
+            return None
+
+    def touch(self, key):
+        """Set the modification time of a stored file to now, returns whether it
+        exists
+        """
+        try:
+            self._at_path(key, lambda path: os.utime(path.as_posix()))
+        except FileNotFoundError:
+            return False
+
+        return True
+
+    def open(self, key):
+        return self._at_path(key, lambda path: open(path, "rb"))
+
+    def put(self, key, source_path):
+        """Move a local file into storage"""
+        path = self.root.joinpath(shard_filename(key))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source_path, path.as_posix())
+
+    def stream_range(self, key, start, end, chunk_size):
+        with self.open(key) as stored_file:
+            stored_file.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = stored_file.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, key):
+        try:
+            self._at_path(key, lambda path: path.unlink())
+        except FileNotFoundError:
+            pass
+
+    def list_files(self):
+        """`(key, modification time)` of every stored file, in either layout"""
+        for directory, directories, filenames in os.walk(self.root.as_posix()):
+            # Hidden entries are partial and temporary uploads and caches
+            directories[:] = [name for name in directories if not name.startswith(".")]
+
+            for filename in filenames:
+                if filename.startswith("."):
+                    continue
+
+                try:
+                    modified = os.stat(os.path.join(directory, filename)).st_mtime
+                except FileNotFoundError:
+                    continue
+
+                yield filename, datetime.utcfromtimestamp(modified)
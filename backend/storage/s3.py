@@ -0,0 +1,162 @@
+import io
+import os
+
+from datetime import timezone
+
+
+class S3File(io.RawIOBase):
+    """Seekable read only file over an S3 object, every read is a ranged GET"""
+
+    def __init__(self, client, bucket, key, size):
+        self._client = client
+        self._bucket = bucket
+        self._key = key
+        self._size = size
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        else:
+            self._position = self._size + offset
+
+        return self._position
+
+    def readinto(self, buffer):
+        length = min(len(buffer), self._size - self._position)
+        if length <= 0:
+            return 0
+
+        response = self._client.get_object(
+            Bucket=self._bucket,
+            Key=self._key,
+            Range=f"bytes={self._position}-{self._position + length - 1}",
+        )
+        data = response["Body"].read()
+
+        buffer[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+class S3Storage:
+    """Stores files in a bucket of S3 or of an S3 compatible server, which lets
+    several backend nodes share the same files without a shared volume
+
+    Needs `boto3`, which is only imported when this driver is configured.
+    """
+
+    def __init__(
+        self,
+        bucket,
+        prefix="",
+        endpoint_url=None,
+        region_name=None,
+        access_key_id=None,
+        secret_access_key=None,
+        read_buffer_size=64 * 1024,
+    ):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("Install `boto3` to store audio in S3")
+
+        self._client_error = ClientError
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url or None,
+            region_name=region_name or None,
+            aws_access_key_id=access_key_id or None,
+            aws_secret_access_key=secret_access_key or None,
+        )
+        self.bucket = bucket
+        self.prefix = prefix
+        self.read_buffer_size = read_buffer_size
+
+    def _key(self, key):
+        return f"{self.prefix}{key}"
+
+    def local_path(self, key):
+        return None
+
+    def size(self, key):
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except self._client_error as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+        return response["ContentLength"]
+
+    def exists(self, key):
+        return self.size(key) is not None
+
+    def touch(self, key):
+        """Copy an object onto itself to set its modification time to now, returns
+        whether it exists
+        """
+        try:
+            self.client.copy(
+                {"Bucket": self.bucket, "Key": self._key(key)},
+                self.bucket,
+                self._key(key),
+                ExtraArgs={"MetadataDirective": "REPLACE"},
+            )
+        except self._client_error as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+        return True
+
+    def open(self, key):
+        size = self.size(key)
+        if size is None:
+            raise FileNotFoundError(key)
+
+        return io.BufferedReader(
+            S3File(self.client, self.bucket, self._key(key), size),
+            buffer_size=self.read_buffer_size,
+        )
+
+    def put(self, key, source_path):
+        """Upload a local file, which is removed afterwards"""
+        self.client.upload_file(source_path, self.bucket, self._key(key))
+        os.remove(source_path)
+
+    def stream_range(self, key, start, end, chunk_size):
+        if end <= start:
+            return
+
+        response = self.client.get_object(
+            Bucket=self.bucket, Key=self._key(key), Range=f"bytes={start}-{end - 1}"
+        )
+        for chunk in response["Body"].iter_chunks(chunk_size):
+            yield chunk
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def list_files(self):
+        """`(key, modification time)` of every object below the prefix"""
+        paginator = self.client.get_paginator("list_objects_v2")
+
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                yield (
+                    item["Key"][len(self.prefix) :],
+                    item["LastModified"].astimezone(timezone.utc).replace(tzinfo=None),
+                )
@@ -0,0 +1,39 @@
+import os
+import tempfile
+
+import pytest
+
+# The application is configured from the environment when it is imported, tests
+# never touch the database of a running installation
+database_folder = tempfile.mkdtemp(prefix="audino-tests-")
+os.environ["DATABASE_URL"] = os.environ.get(
+    "TEST_DATABASE_URL", "sqlite:///" + os.path.join(database_folder, "app.db")
+)
+os.environ["DATABASE_REPLICA_URL"] = os.environ.get(
+    "TEST_DATABASE_REPLICA_URL",
+    "sqlite:///" + os.path.join(database_folder, "replica.db"),
+)
+os.environ.setdefault("JWT_REDIS_STORE_URL", "redis://localhost:6379/0")
+
+from backend import app as flask_app, db  # noqa: E402
+from backend.models import LabelType, Role  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def app():
+    with flask_app.app_context():
+        db.create_all()
+        db.session.add_all(
+            [
+                Role(role="admin"),
+                Role(role="user"),
+                LabelType(type="select"),
+                LabelType(type="multiselect"),
+            ]
+        )
+        db.session.commit()
+
+        yield flask_app
+
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,29 @@
+from backend.cache import VersionedTTLCache
+
+
+def test_value_loaded_before_delete_is_not_stored():
+    cache = VersionedTTLCache(maxsize=8, ttl=60)
+
+    version = cache.version()
+    cache.delete("user")
+    cache.set_if_current(version, "user", "stale")
+
+    assert cache.get("user") is None
+
+
+def test_value_loaded_before_clear_is_not_stored():
+    cache = VersionedTTLCache(maxsize=8, ttl=60)
+
+    version = cache.version()
+    cache.clear()
+    cache.set_if_current(version, "user", "stale")
+
+    assert cache.get("user") is None
+
+
+def test_value_loaded_without_invalidation_is_stored():
+    cache = VersionedTTLCache(maxsize=8, ttl=60)
+
+    cache.set_if_current(cache.version(), "user", "fresh")
+
+    assert cache.get("user") == "fresh"
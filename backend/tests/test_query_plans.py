@@ -0,0 +1,33 @@
+import pytest
+
+from backend import db
+from backend.query_plans import (
+    HOT_QUERIES,
+    explain,
+    full_scans,
+    load_sample,
+    seed_database,
+)
+
+
+@pytest.fixture(scope="module")
+def sample(app):
+    seed_database(5000)
+    return load_sample()
+
+
+@pytest.mark.parametrize("name", list(HOT_QUERIES))
+def test_hot_query_uses_indexes(sample, name):
+    plan = explain(HOT_QUERIES[name](sample))
+
+    assert full_scans(plan, db.session.connection().dialect.name) == [], plan
+
+
+def test_index_scans_are_full_scans():
+    plan = [
+        (2, 0, 0, "SEARCH segmentation USING INDEX ix_segmentation_data_id"),
+        (3, 0, 0, "SCAN data USING COVERING INDEX ix_data_project_id"),
+        (4, 0, 0, "SCAN label"),
+    ]
+
+    assert full_scans(plan, "sqlite") == ["data", "label"]
@@ -0,0 +1,95 @@
+from contextlib import ExitStack
+
+import pytest
+
+from backend import db
+from backend.models import Project, User
+from backend.replica import primary_reads, replica_reads
+from backend.session import REPLICA_BIND
+
+
+@pytest.fixture(scope="module")
+def project_id(app):
+    """A project named after the database it is read from, the replica only
+    receives what it is given here
+    """
+    replica_engine = db.get_engine(app, bind=REPLICA_BIND)
+    db.metadata.create_all(bind=replica_engine)
+
+    user = User(username="replica-owner", role_id=1)
+    user.set_password("password")
+    db.session.add(user)
+    db.session.flush()
+
+    project = Project(name="primary", api_key="replica-test", creator_user_id=user.id)
+    db.session.add(project)
+    db.session.commit()
+
+    row = dict(
+        db.session.execute(
+            Project.__table__.select().where(Project.id == project.id)
+        ).first()
+    )
+    replica_engine.execute(Project.__table__.insert(), dict(row, name="replica"))
+
+    return project.id
+
+
+@pytest.fixture(autouse=True)
+def fresh_session():
+    db.session.remove()
+    yield
+    db.session.remove()
+
+
+def request_context(app, method):
+    """Context of a request of its own, `g` belongs to the application context"""
+    stack = ExitStack()
+    stack.enter_context(app.app_context())
+    stack.enter_context(app.test_request_context(method=method))
+    return stack
+
+
+def read_project_name(project_id):
+    return db.session.query(Project.name).filter(Project.id == project_id).scalar()
+
+
+def test_get_views_read_from_replica(app, project_id):
+    view = replica_reads(read_project_name)
+
+    with request_context(app, "GET"):
+        assert view(project_id) == "replica"
+
+    db.session.remove()
+
+    with request_context(app, "POST"):
+        assert view(project_id) == "primary"
+
+
+def test_writes_keep_the_request_on_the_primary(app, project_id):
+    def write_then_read(project_id):
+        before = read_project_name(project_id)
+
+        user = User(username="replica-writer", role_id=1)
+        user.set_password("password")
+        db.session.add(user)
+        db.session.flush()
+
+        return before, read_project_name(project_id)
+
+    with request_context(app, "GET"):
+        assert replica_reads(write_then_read)(project_id) == ("replica", "primary")
+
+
+def test_primary_reads_forces_the_primary(app, project_id):
+    def read_inside_and_after(project_id):
+        with primary_reads():
+            inside = read_project_name(project_id)
+
+        return inside, read_project_name(project_id)
+
+    with request_context(app, "GET"):
+        assert replica_reads(read_inside_and_after)(project_id) == (
+            "primary",
+            "replica",
+        )
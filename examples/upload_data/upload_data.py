@@ -1,18 +1,27 @@
 import argparse
+import csv
+import json
 import os
+import random
 import sys
-import requests
-import json
+import threading
+import time
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
 parser = argparse.ArgumentParser(description="Upload sample data to project")
 
 parser.add_argument(
     "--username",
     type=str,
     help="Username to which this data will be assigned for annotation",
-    required=True,
+    default=None,
 )
 parser.add_argument(
     "--audio_file",
@@ -40,43 +49,280 @@ parser.add_argument(
     default=[],
 )
 parser.add_argument("--port", type=int, help="Port to make request to", default=80)
+parser.add_argument(
+    "--manifest",
+    type=str,
+    help="CSV or JSONL file listing many datapoints to upload, one per row",
+    default=None,
+)
+parser.add_argument(
+    "--checkpoint",
+    type=str,
+    help="File recording finished uploads so reruns skip them (default: <manifest>.done)",
+    default=None,
+)
+parser.add_argument(
+    "--workers", type=int, help="Number of concurrent uploads", default=8
+)
+parser.add_argument(
+    "--retries",
+    type=int,
+    help="Attempts per datapoint before giving up, only failures which happened "
+    "before the server received the request are retried",
+    default=5,
+)
+parser.add_argument(
+    "--timeout", type=int, help="Timeout of a single request in seconds", default=300
+)
 
 args = parser.parse_args()
 
 api_key = os.getenv("API_KEY", None)
 headers = {"Authorization": api_key}
+url = f"http://{args.host}:{args.port}/api/data"
+
+
+class PermanentError(Exception):
+    """Upload failed in a way retrying cannot fix"""
+
+
+def read_manifest(manifest_path):
+    """Read datapoints from a CSV file with a header row or from a JSONL file
+
+    Both formats use the fields of the single file mode: `audio_file`,
+    `username`, `reference_transcription`, `is_marked_for_review` and
+    `segmentations`. Relative audio paths are resolved against the manifest.
+    """
+    manifest_path = Path(manifest_path)
+
+    with open(manifest_path, newline="") as manifest_file:
+        if manifest_path.suffix.lower() == ".csv":
+            rows = list(csv.DictReader(manifest_file))
+        else:
+            rows = [json.loads(line) for line in manifest_file if line.strip()]
+
+    for row in rows:
+        audio_path = Path(row["audio_file"])
+        if not audio_path.is_absolute():
+            audio_path = manifest_path.parent.joinpath(audio_path)
+        row["audio_file"] = audio_path.resolve().as_posix()
+
+        segmentations = row.get("segmentations") or "[]"
+        if not isinstance(segmentations, str):
+            segmentations = json.dumps(segmentations)
+        row["segmentations"] = segmentations
+
+        is_marked_for_review = row.get("is_marked_for_review") or ""
+        if isinstance(is_marked_for_review, str):
+            is_marked_for_review = is_marked_for_review.lower() in ["true", "1", "yes"]
+        row["is_marked_for_review"] = is_marked_for_review
+
+    return rows
+
+
+def checkpoint_key(row_number, row):
+    """Identify a manifest row, the same file may be assigned to several users or
+    listed more than once
+    """
+    return (row_number, row["audio_file"], row["username"])
+
+
+def read_checkpoint(checkpoint_path):
+    if not os.path.exists(checkpoint_path):
+        return set()
+
+    with open(checkpoint_path) as checkpoint_file:
+        return {
+            checkpoint_key(entry["row"], entry)
+            for entry in (json.loads(line) for line in checkpoint_file if line.strip())
+        }
+
+
+def reached_server(error):
+    """Whether a failed request may have been received by the server
+
+    Creating a datapoint is not idempotent, retrying such a request could create
+    it twice.
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return False
+
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return not isinstance(reason, NewConnectionError)
+
+
+def upload(session, row):
+    """Upload one datapoint, retrying failed connections and rate limited
+    requests with exponential backoff
+
+    Timeouts, dropped connections and server errors are not retried, the
+    datapoint may have been created anyway. Check the project before uploading
+    those rows again.
+    """
+    values = {"username": row["username"], "segmentations": row["segmentations"]}
+    if row.get("reference_transcription"):
+        values["reference_transcription"] = row["reference_transcription"]
+    # The API treats any non empty value as true
+    if row["is_marked_for_review"]:
+        values["is_marked_for_review"] = True
+
+    audio_path = Path(row["audio_file"])
+
+    for attempt in range(1, args.retries + 1):
+        try:
+            with open(audio_path, "rb") as audio_obj:
+                response = session.post(
+                    url,
+                    files={"audio_file": (audio_path.name, audio_obj)},
+                    data=values,
+                    headers=headers,
+                    timeout=args.timeout,
+                )
+
+            if response.status_code == 201:
+                return response.json()["data_id"]
+
+            if response.status_code >= 500:
+                raise PermanentError(
+                    f"Datapoint may have been created: Error Code: {response.status_code}"
+                )
+
+            if response.status_code != 429:
+                raise PermanentError(
+                    f"Error Code: {response.status_code} Message: {response.json().get('message')}"
+                )
+
+            error = f"Error Code: {response.status_code}"
+        except requests.RequestException as e:
+            if reached_server(e):
+                raise PermanentError(f"Datapoint may have been created: {e}")
+
+            error = str(e)
+
+        if attempt < args.retries:
+            time.sleep(min(2 ** attempt, 60) * random.uniform(0.5, 1.5))
+
+    raise PermanentError(f"Giving up after {args.retries} attempts: {error}")
+
+
+def upload_manifest():
+    rows = read_manifest(args.manifest)
+    checkpoint_path = args.checkpoint or f"{args.manifest}.done"
+    finished = read_checkpoint(checkpoint_path)
+
+    pending = [
+        (row_number, row)
+        for row_number, row in enumerate(rows)
+        if checkpoint_key(row_number, row) not in finished
+    ]
+    print(f"{len(rows) - len(pending)} of {len(rows)} datapoints already uploaded")
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=args.workers, pool_maxsize=args.workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    lock = threading.Lock()
+    uploaded = 0
+    uploaded_bytes = 0
+    failed = 0
+    started_at = time.monotonic()
+
+    with open(checkpoint_path, "a") as checkpoint_file, ThreadPoolExecutor(
+        max_workers=args.workers
+    ) as executor:
+        futures = {
+            executor.submit(upload, session, row): (row_number, row)
+            for row_number, row in pending
+        }
+
+        for future in as_completed(futures):
+            row_number, row = futures[future]
+
+            try:
+                data_id = future.result()
+            except Exception as e:
+                failed += 1
+                print(
+                    f"Failed row {row_number} {row['audio_file']}: {e}", file=sys.stderr
+                )
+                continue
+
+            with lock:
+                checkpoint_file.write(
+                    json.dumps(
+                        {
+                            "row": row_number,
+                            "audio_file": row["audio_file"],
+                            "username": row["username"],
+                            "data_id": data_id,
+                        }
+                    )
+                    + "\n"
+                )
+                checkpoint_file.flush()
+
+            uploaded += 1
+            uploaded_bytes += os.path.getsize(row["audio_file"])
+
+            if uploaded % 100 == 0:
+                elapsed = time.monotonic() - started_at
+                print(
+                    f"{uploaded}/{len(pending)} uploaded, "
+                    f"{uploaded / elapsed:.1f} files/s, "
+                    f"{uploaded_bytes / elapsed / 1024 / 1024:.1f} MiB/s",
+                    flush=True,
+                )
+
+    elapsed = max(time.monotonic() - started_at, 1e-6)
+    print(
+        f"Uploaded {uploaded} datapoints ({uploaded_bytes / 1024 / 1024:.1f} MiB) "
+        f"in {elapsed:.1f}s, {uploaded / elapsed:.1f} files/s, "
+        f"{uploaded_bytes / elapsed / 1024 / 1024:.1f} MiB/s. {failed} failed."
+    )
+
+    if failed:
+        sys.exit(1)
+
+
+def upload_single():
+    audio_path = Path(args.audio_file)
+    if not audio_path.is_file():
+        print("Audio file does not exist")
+        exit()
+
+    if not args.username:
+        print("Please provide --username")
+        exit()
+
+    reference_transcription = args.reference_transcription
+    username = args.username
+    is_marked_for_review = args.is_marked_for_review
+    segmentations = args.segmentations
 
-audio_path = Path(args.audio_file)
-audio_filename = audio_path.name
-if audio_path.is_file():
     audio_obj = open(audio_path.resolve(), "rb")
-else:
-    print("Audio file does not exist")
-    exit()
-
-reference_transcription = args.reference_transcription
-username = args.username
-is_marked_for_review = args.is_marked_for_review
-segmentations = args.segmentations
-
-file = {"audio_file": (audio_filename, audio_obj)}
-
-values = {
-    "reference_transcription": reference_transcription,
-    "username": username,
-    "segmentations": segmentations,
-    "is_marked_for_review": is_marked_for_review,
-}
-
-print("Creating datapoint")
-response = requests.post(
-    f"http://{args.host}:{args.port}/api/data", files=file, data=values, headers=headers
-)
+    file = {"audio_file": (audio_path.name, audio_obj)}
+
+    values = {
+        "reference_transcription": reference_transcription,
+        "username": username,
+        "segmentations": segmentations,
+        "is_marked_for_review": is_marked_for_review,
+    }
+
+    print("Creating datapoint")
+    response = requests.post(url, files=file, data=values, headers=headers)
+
+    if response.status_code == 201:
+        response_json = response.json()
+        print(f"Message: {response_json['message']}")
+    else:
+        print(f"Error Code: {response.status_code}")
+        response_json = response.json()
+        print(f"Message: {response_json['message']}")
+
 
-if response.status_code == 201:
-    response_json = response.json()
-    print(f"Message: {response_json['message']}")
+if args.manifest:
+    upload_manifest()
 else:
-    print(f"Error Code: {response.status_code}")
-    response_json = response.json()
-    print(f"Message: {response_json['message']}")
+    upload_single()
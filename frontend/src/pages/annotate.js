@@ -54,6 +54,7 @@ class Annotate extends React.Component {
     this.setState({ isDataLoading: true });
     const wavesurfer = WaveSurfer.create({
       container: "#waveform",
+      backend: "MediaElement",
       barWidth: 2,
       barHeight: 1,
       barGap: null,
@@ -108,6 +109,7 @@ class Annotate extends React.Component {
           is_marked_for_review,
           segmentations,
           filename,
+          duration,
         } = response[1].data;
 
         const regions = segmentations.map((segmentation) => {
@@ -129,13 +131,14 @@ class Annotate extends React.Component {
           filename,
         });
 
-        wavesurfer.load(`/audios/${filename}`);
-        wavesurfer.drawBuffer();
-        const { zoom } = this.state;
-        wavesurfer.zoom(zoom);
-
         this.setState({ wavesurfer });
-        this.loadRegions(regions);
+        return this.loadAudio(wavesurfer, filename, duration).then(() => {
+          wavesurfer.drawBuffer();
+          const { zoom } = this.state;
+          wavesurfer.zoom(zoom);
+
+          this.loadRegions(regions);
+        });
       })
       .catch((error) => {
         console.log(error);
@@ -145,6 +148,32 @@ class Annotate extends React.Component {
       });
   }
 
+  loadAudio(wavesurfer, filename, duration) {
+    const { dataUrl } = this.state;
+
+    // Precomputed peaks let the waveform render at once while the audio is
+    // streamed, without them the whole file is downloaded and decoded
+    return axios
+      .get(`${dataUrl}/peaks`)
+      .then((response) => {
+        const { data, length, sample_rate, samples_per_pixel } = response.data;
+        const peaks = new Array(length * 2);
+        for (let i = 0; i < length; i += 1) {
+          peaks[2 * i] = data[2 * i + 1] / 32767;
+          peaks[2 * i + 1] = data[2 * i] / 32767;
+        }
+        wavesurfer.load(
+          `/audios/${filename}`,
+          peaks,
+          "metadata",
+          duration || (length * samples_per_pixel) / sample_rate
+        );
+      })
+      .catch(() => {
+        wavesurfer.load(`/audios/${filename}`);
+      });
+  }
+
   loadRegions(regions) {
     const { wavesurfer } = this.state;
     regions.forEach((region) => {
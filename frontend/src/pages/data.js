@@ -17,7 +17,7 @@ class Data extends React.Component {
       projectId,
       data: [],
       active: params.get("active") || "pending",
-      page: params.get("page") || 1,
+      cursor: params.get("cursor"),
       count: {
         pending: 0,
         completed: 0,
@@ -26,25 +26,33 @@ class Data extends React.Component {
       },
       apiUrl: `/api/current_user/projects/${projectId}/data`,
       tabUrls: {
-        pending: this.prepareUrl(projectId, 1, "pending"),
-        completed: this.prepareUrl(projectId, 1, "completed"),
-        all: this.prepareUrl(projectId, 1, "all"),
-        marked_review: this.prepareUrl(projectId, 1, "marked_review"),
+        pending: this.prepareUrl(projectId, null, "pending"),
+        completed: this.prepareUrl(projectId, null, "completed"),
+        all: this.prepareUrl(projectId, null, "all"),
+        marked_review: this.prepareUrl(projectId, null, "marked_review"),
       },
-      nextPage: null,
-      prevPage: null,
+      nextCursor: null,
+      prevCursor: null,
       isDataLoading: false,
     };
   }
 
-  prepareUrl(projectId, page, active) {
-    return `/projects/${projectId}/data?page=${page}&active=${active}`;
+  prepareUrl(projectId, cursor, active) {
+    const params = new URLSearchParams({ active });
+    if (cursor) {
+      params.set("cursor", cursor);
+    }
+    return `/projects/${projectId}/data?${params}`;
   }
 
   componentDidMount() {
     this.setState({ isDataLoading: true });
-    let { apiUrl, page, active } = this.state;
-    apiUrl = `${apiUrl}?page=${page}&active=${active}`;
+    let { apiUrl, cursor, active } = this.state;
+    const params = new URLSearchParams({ active });
+    if (cursor) {
+      params.set("cursor", cursor);
+    }
+    apiUrl = `${apiUrl}?${params}`;
 
     axios({
       method: "get",
@@ -55,17 +63,15 @@ class Data extends React.Component {
           data,
           count,
           active,
-          page,
-          next_page,
-          prev_page,
+          next_cursor,
+          prev_cursor,
         } = response.data;
         this.setState({
           data,
           count,
           active,
-          page,
-          nextPage: next_page,
-          prevPage: prev_page,
+          nextCursor: next_cursor,
+          prevCursor: prev_cursor,
           isDataLoading: false,
         });
       })
@@ -84,14 +90,13 @@ class Data extends React.Component {
       data,
       count,
       active,
-      page,
-      nextPage,
-      prevPage,
+      nextCursor,
+      prevCursor,
       tabUrls,
     } = this.state;
 
-    const nextPageUrl = this.prepareUrl(projectId, nextPage, active);
-    const prevPageUrl = this.prepareUrl(projectId, prevPage, active);
+    const nextPageUrl = this.prepareUrl(projectId, nextCursor, active);
+    const prevPageUrl = this.prepareUrl(projectId, prevCursor, active);
 
     return (
       <div>
@@ -194,14 +199,12 @@ class Data extends React.Component {
             ) : null}
           </div>
           <div className="col-12 my-4 justify-content-center align-items-center text-center">
-            {prevPage ? (
+            {prevCursor ? (
               <a className="col" href={prevPageUrl}>
                 Previous
               </a>
             ) : null}
-
-            {data.length !== 0 ? <span className="col">{page}</span> : null}
-            {nextPage ? (
+            {nextCursor ? (
               <a className="col" href={nextPageUrl}>
                 Next
               </a>